@@ -10,11 +10,11 @@ import novalabs.core.MW as MW
 from novalabs.misc.helpers import *
 from novalabs.misc.crc import *
 from novalabs.misc.fwu import *
+from novalabs.misc.ihex import *
+from novalabs.misc.imagecache import ImageCache
 
 from time import sleep
 
-from intelhex import IntelHex
-
 
 def progressBar(value, endvalue, bar_length=20):
     percent = float(value) / endvalue
@@ -426,19 +426,16 @@ def hex_crc(args):
     ihex_file = args.file[0]
     programSize = int(args.size[0])
 
-    from intelhex import IntelHex
-
-    ih = IntelHex()
-    ih.loadfile(ihex_file, format="hex")
-    ih.padding = 0xFF
-    bin = ih.tobinarray(size=programSize)
-    crc = stm32_crc32_bytes(0xffffffff, bin)
+    crc = ImageCache().crc(ihex_file, programSize)
     print(hex(crc))
 
     return 0
 
 
-def write_ihex(bl, data, crc):
+def write_ihex(bl, data, crc, count=None):
+    if count is None:
+        count = len(data)
+
     type = MW.BootMsg.IHEX.IHexTypeEnum.BEGIN
     if not bl.ihex_write(type, ""):
         print("Cannot write IHEX data")
@@ -447,7 +444,7 @@ def write_ihex(bl, data, crc):
     l = 0
     for line in data:
         type = MW.BootMsg.IHEX.IHexTypeEnum.DATA
-        progressBar(l, len(data))
+        progressBar(l, count)
         l += 1
 
         if not bl.ihex_write(type, line):
@@ -505,17 +502,40 @@ def update(mw, transport, args):
         retval = 1
     else:
         fwu_file = args.file[0]
-        fwu = fwu_parse(fwu_file)
 
-        if len(fwu.program) > 0:
-            if not bl.eraseProgram(uid):
-                print("Cannot erase program")
+        if fwb_is(fwu_file):
+            # Binary container: records are streamed from the mapped file, whose CRCs are checked when opened
+            try:
+                fwb = FWB(fwu_file)
+            except ValueError as e:
+                print(str(e))
                 return 1
+            program = fwb.records(FWB_SECTION_PROGRAM)
+            count = fwb.count(FWB_SECTION_PROGRAM)
+            program_crc = fwb.header.program_crc
+        else:
+            fwb = None
+            fwu = ImageCache().fwu(fwu_file)
+            program = fwu.program
+            count = len(fwu.program)
+            program_crc = fwu.program_crc
+
+        try:
+            if count > 0:
+                if not bl.eraseProgram(uid):
+                    print("Cannot erase program")
+                    return 1
+
+            write_ihex(bl, program, program_crc, count)
+        except ValueError as e:
+            print(str(e))
+            return 1
+        finally:
+            if fwb is not None:
+                fwb.close()
 
-        write_ihex(bl, fwu.program, fwu.program_crc)
-
-        if len(fwu.program) > 0:
-            if not bl.write_program_crc(uid, fwu.program_crc):
+        if count > 0:
+            if not bl.write_program_crc(uid, program_crc):
                 print("Cannot write CRC")
                 return 1
 
@@ -566,12 +586,9 @@ def load(mw, transport, args):
         retval = 1
     else:
         programSize = desc.program
-        
-        ih = IntelHex()
-        ih.loadfile(ihex_file, format="hex")
-        ih.padding = 0xFF
-        bin = ih.tobinarray(size=programSize)
-        crc = stm32_crc32_bytes(0xffffffff, bin)
+
+        cache = ImageCache()
+        crc = cache.crc(ihex_file, programSize)
         print("CRC: " + hex(crc))
 
         what = args.what[0]
@@ -580,10 +597,7 @@ def load(mw, transport, args):
                 print("Cannot erase program")
                 return 1
 
-        with open(ihex_file) as f:
-            data = f.read().splitlines()
-
-        write_ihex(bl, data, crc)
+        write_ihex(bl, cache.records(ihex_file), crc)
 
         if what == 'program':
             if not bl.write_program_crc(uid, crc):
@@ -735,10 +749,14 @@ def read(mw, transport, args):
         print("Cannot select device")
         return 1
 
-    if not bl.ihex_read(uid, address):
-        print("Cannot write module name")
+    records = bl.ihex_read(uid, address)
+    if records is None:
+        print("Cannot read IHEX data")
         return 1
 
+    for record in records:  # Can be decoded with 'CoreWorkspace.py decode'
+        print(record)
+
     bl.deselect(uid)
 
     #    bl.select("000000000000000000000000")
@@ -765,10 +783,18 @@ def _main():
         sys.exit(retval)
 
     # TODO: Automate transport construction from "--transport" args
-    assert args.transport[0] == 'DebugTransport'
-    assert args.transport[1] == 'SerialLineIO'
-    lineio = MW.SerialLineIO(str(args.transport[2]), int(args.transport[3]))
-    transport = MW.DebugTransport('dbgtra', lineio)
+    if args.transport[0] == 'BrokerTransport':  # Attached to CoreBroker.py, the last parameter is not used
+        assert args.transport[1] == 'BrokerClient'
+        client = MW.BrokerClient(str(args.transport[2]))
+        transport = MW.BrokerTransport('dbgtra', client)
+    else:
+        assert args.transport[0] == 'DebugTransport'
+        if args.transport[1] == 'TCPLineIO':  # e.g. a CoreGateway.py
+            lineio = MW.TCPLineIO(str(args.transport[2]), int(args.transport[3]))
+        else:
+            assert args.transport[1] == 'SerialLineIO'
+            lineio = MW.SerialLineIO(str(args.transport[2]), int(args.transport[3]))
+        transport = MW.DebugTransport('dbgtra', lineio)
 
     mw = MW.Middleware.instance()
     mw.initialize()
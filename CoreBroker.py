@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# PYTHON_ARGCOMPLETE_OK
+
+import sys
+import logging
+import argparse
+import argcomplete
+
+import novalabs.core.MW as MW
+from novalabs.misc.helpers import *
+
+
+def _create_argsparser():
+    parser = argparse.ArgumentParser(
+        description='Shares a serial port among the local tools: they connect to the socket (e.g. CoreBootloader.py -p BrokerTransport BrokerClient SOCKET 0)'
+    )
+
+    parser.add_argument(
+        '-v', '--verbose', required=False, action='count', default=0,
+        help='verbosity level (default %(default)s): 0=critical, 1=error, 2=warning, 3=info, 4=debug',
+        dest='verbosity'
+    )
+
+    parser.add_argument(
+        '-s', '--socket', required=False,
+        default='/tmp/nova-broker.sock',
+        help='Unix socket the clients connect to [default = %(default)s]',
+        dest='socket'
+    )
+
+    parser.add_argument('device', nargs='?', default='/dev/ttyACM0', help='Serial port [default = %(default)s]')
+    parser.add_argument('baud', nargs='?', type=int, default=921600, help='Baud rate [default = %(default)s]')
+
+    return parser
+
+
+def _main():
+    parser = _create_argsparser()
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=verbosity2level(int(args.verbosity)))
+    logging.debug('sys.argv = ' + repr(sys.argv))
+
+    lineio = MW.SerialLineIO(args.device, args.baud)
+    transport = MW.DebugTransport('broker', lineio)
+
+    broker = MW.Broker(args.socket, transport)
+    broker.open()
+
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
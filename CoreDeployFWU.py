@@ -10,10 +10,16 @@ import argparse
 import argcomplete
 
 import subprocess
+import json
+import time
+import concurrent.futures
 
 from novalabs.core.CoreConsole import *
+from novalabs.core.CoreUtils import printSuccessOrFailure, writeIfChanged
 from novalabs.misc.helpers import *
 from novalabs.misc.crc import *
+from novalabs.misc.imagecache import ImageCache
+from novalabs.misc.fwu import fwu_parse, fwb_write
 import yaml
 
 # ENVIRONMENT VARIABLES -------------------------------------------------------
@@ -23,83 +29,205 @@ if NOVA_WORKSPACE_ROOT is None:
     CoreConsole.out(CoreConsole.error("NOVA_WORKSPACE_ROOT environment variable not found"))
     sys.exit(-1)
 
-def process(device_type, program, filename, device):
+# Inputs of the last successful run of every bundle, see inputs()
+FWU_MANIFEST = os.path.join(NOVA_WORKSPACE_ROOT, "build", "deploy", "fwu.manifest.json")
+
+_cache = None
+
+
+def cache():
+    global _cache
+
+    if _cache is None:
+        _cache = ImageCache(NOVA_WORKSPACE_ROOT)
+
+    return _cache
+
+
+def readFile(filename):
+    src = open(filename)
+    data = src.read()
+    src.close()
+
+    return data
+
+
+def deployPath(program):
+    return os.path.join(NOVA_WORKSPACE_ROOT, "build", "deploy", program)
+
+
+def templatePath(device_type):
+    return os.path.join(NOVA_WORKSPACE_ROOT, "fwu", "templates", device_type) + ".header"
+
+
+def outPath(filename, revision, extension):
+    return os.path.join(NOVA_WORKSPACE_ROOT, "fwu", "out", filename) + "_" + revision + extension
+
+
+def inputs(device_type, program, filename, device, binary):
+    # Everything a bundle depends on: if none of this changed, the bundle is up to date
+    revision = readFile(deployPath(program) + ".revision").rstrip()
+
+    return {
+        "device_type": device_type,
+        "program": program,
+        "device": device,
+        "binary": binary,
+        "revision": revision,
+        "template": cache().digest(templatePath(device_type)),
+        "crc": readFile(deployPath(program) + "_" + revision + ".crc").rstrip(),
+        "hex": cache().digest(deployPath(program) + "_" + revision + ".hex"),
+    }
+
+
+def process(device_type, program, filename, device, binary):
+    start = time.time()
+
     try:
-        src = open(os.path.join(NOVA_WORKSPACE_ROOT, "build", "deploy", program) + ".revision")
-        revision = src.read()
-        revision = revision.rstrip()
-        src.close
-        
-        src = open(os.path.join(NOVA_WORKSPACE_ROOT, "fwu", "templates", device_type) + ".header")
-        header = src.read()
-        src.close()
-        
-        src = open(os.path.join(NOVA_WORKSPACE_ROOT, "build", "deploy", program) + "_" + revision + ".crc")
-        crc = src.read()
-        crc = crc.rstrip()
-        src.close()
-
-        src = open(os.path.join(NOVA_WORKSPACE_ROOT, "build", "deploy", program) + "_" + revision + ".hex")
-        program = src.read()
-        src.close()
+        revision = readFile(deployPath(program) + ".revision").rstrip()
+        header = readFile(templatePath(device_type))
+        crc = readFile(deployPath(program) + "_" + revision + ".crc").rstrip()
+        records = readFile(deployPath(program) + "_" + revision + ".hex")  # Copied as it is, not rebuilt from the parsed records
 
         header = header.replace("@REVISION@", revision)
         header = header.replace("@FILENAME@", filename + ".fwu")
         header = header.replace("@NAME@", device)
         header = header.replace("@CRC@", crc)
 
-        fwu_filename = os.path.join(NOVA_WORKSPACE_ROOT, "fwu", "out", filename) + "_" + revision + ".fwu"
-
-        fwu = open(fwu_filename, 'w')
-
-        fwu.write(header)
-
-        fwu.write("#------------------------------------------\n");
-        fwu.write("!BEGIN_PROGRAM\n");
-        fwu.write("#------------------------------------------\n");
-
-        fwu.write(program)
-
-        fwu.write("#------------------------------------------\n");
-        fwu.write("!END_PROGRAM\n");
-        fwu.write("#------------------------------------------\n");
-        
-        fwu.close()
-        
-        fwu = open(fwu_filename, 'rb')
-        data = fwu.read()
-        fwu.close()
-        
-        d = 4 - (len(data) % 4)
-        
-        if d == 4:
-            d = 0;
-        
-        data = bytearray(data)
-        
-        for i in range(0, d):
-            data.append(0);
-            
-        file_crc = stm32_crc32_bytes(0xffffffff, data)
-        file_crc = bytearray("@CRC:" + hex(file_crc) +"\n", 'ascii')
-        
-        fwu = open(fwu_filename, 'wb')
-        fwu.write(file_crc);
-        fwu.write(data);
-        fwu.close()
-        
-        CoreConsole.out(Fore.YELLOW + Style.BRIGHT + device_type + Fore.BLUE + "." + device + Style.RESET_ALL + " -> " + Style.BRIGHT + filename + "_" + revision + ".fwu" + Style.RESET_ALL)
-    except IOError as e:
-        CoreConsole.out(CoreConsole.error(str(e)))
-
-stream = open(os.path.join(NOVA_WORKSPACE_ROOT, "fwu.yml"), 'r')
-
-data = yaml.load(stream)
-
-for device_type in data:
-    program = data[device_type]['program']
-    for target in data[device_type]['targets']:
-        for filename, v in target.items():
-            device = v['device']
-            process(device_type, program, filename, device)
+        chunks = [
+            header.encode('ascii'),
+            b"#------------------------------------------\n!BEGIN_PROGRAM\n#------------------------------------------\n",
+            records.encode('ascii'),
+            b"#------------------------------------------\n!END_PROGRAM\n#------------------------------------------\n",
+        ]
+
+        # The file CRC covers the content zero padded to a multiple of 4 bytes
+        file_crc = stm32_crc32_stream(0xffffffff, chunks)
+        size = sum([len(x) for x in chunks])
+        chunks.insert(0, bytearray("@CRC:" + hex(file_crc) + "\n", 'ascii'))
+        chunks.append(b'\0' * (-size & 3))
 
+        fwu_filename = outPath(filename, revision, ".fwu")
+        writeIfChanged(fwu_filename, b''.join(chunks))
+
+        if binary:
+            fwb_write(outPath(filename, revision, ".fwb"), fwu_parse(fwu_filename))
+
+        return revision, time.time() - start, None
+    except (IOError, ValueError) as e:
+        return None, time.time() - start, str(e)
+
+
+def deploy(jobs, force, binary):
+    data = yaml.load(open(os.path.join(NOVA_WORKSPACE_ROOT, "fwu.yml"), 'r'))
+
+    try:
+        manifest = json.load(open(FWU_MANIFEST, 'r'))
+    except (IOError, ValueError):
+        manifest = {}
+
+    targets = []
+    for device_type in data:
+        program = data[device_type]['program']
+        for target in data[device_type]['targets']:
+            for filename, v in target.items():
+                targets.append((device_type, program, filename, v['device']))
+
+    # Decide what has to be regenerated, in fwu.yml order
+    results = [None] * len(targets)
+    pending = []
+    for i, (device_type, program, filename, device) in enumerate(targets):
+        try:
+            current = inputs(device_type, program, filename, device, binary)
+        except IOError as e:
+            results[i] = ("error", None, 0.0, str(e))
+            continue
+
+        upToDate = manifest.get(filename) == current and os.path.isfile(outPath(filename, current["revision"], ".fwu"))
+        if upToDate and not force:
+            results[i] = ("skipped", current["revision"], 0.0, None)
+        else:
+            pending.append((i, current))
+
+    start = time.time()
+
+    if jobs == 1 or len(pending) <= 1:
+        done = [(i, current, process(*(targets[i] + (binary,)))) for i, current in pending]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [(i, current, executor.submit(process, *(targets[i] + (binary,)))) for i, current in pending]
+            done = [(i, current, f.result()) for i, current, f in futures]
+
+    elapsed = time.time() - start
+
+    for i, current, (revision, t, error) in done:
+        if error is None:
+            manifest[targets[i][2]] = current
+            results[i] = ("generated", revision, t, None)
+        else:
+            manifest.pop(targets[i][2], None)
+            results[i] = ("error", None, t, error)
+
+    os.makedirs(os.path.dirname(FWU_MANIFEST), exist_ok=True)
+    writeIfChanged(FWU_MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('ascii'))
+
+    isOk = True
+    table = []
+    for (device_type, program, filename, device), (status, revision, t, error) in zip(targets, results):
+        if status == "error":
+            isOk = False
+            CoreConsole.out(CoreConsole.error(error))
+            table.append([CoreConsole.highlight(filename), device_type, device, "", CoreConsole.error(status), "%.2f" % t])
+        else:
+            if status == "generated":
+                CoreConsole.out(Fore.YELLOW + Style.BRIGHT + device_type + Fore.BLUE + "." + device + Style.RESET_ALL + " -> " + Style.BRIGHT + filename + "_" + revision + ".fwu" + Style.RESET_ALL)
+            table.append([CoreConsole.highlight(filename), device_type, device, revision, status, "%.2f" % t])
+
+    CoreConsole.out(CoreConsole.h1("FWU BUNDLES"))
+    CoreConsole.out(CoreConsole.table(table, ["Name", "Type", "Device", "Revision", "Status", "Time [s]"]))
+
+    generated = len([x for x in results if x[0] == "generated"])
+    skipped = len([x for x in results if x[0] == "skipped"])
+    CoreConsole.out("Generated: %d, skipped: %d, total time: %.2f s" % (generated, skipped, elapsed))
+
+    printSuccessOrFailure(isOk)
+
+    if isOk:
+        return 0
+    else:
+        return -1
+
+
+if '__main__' == __name__:
+    parser = argparse.ArgumentParser(
+        description='Generates the FWU files listed in fwu.yml'
+    )
+
+    parser.add_argument(
+        '-b', '--binary', required=False,
+        action="store_true",
+        default=False,
+        help='Also emit the binary FWU container (.fwb)',
+        dest='binary'
+    )
+
+    parser.add_argument(
+        '-j', '--jobs', required=False,
+        type=int,
+        default=os.cpu_count(),
+        help='Number of parallel jobs [default = %(default)s]',
+        dest='jobs'
+    )
+
+    parser.add_argument(
+        '--force', required=False,
+        action="store_true",
+        default=False,
+        help='Regenerate all the bundles, even if their inputs did not change [default = False]',
+        dest='force'
+    )
+
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+
+    sys.exit(deploy(max(args.jobs, 1), args.force, args.binary))
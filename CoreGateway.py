@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# PYTHON_ARGCOMPLETE_OK
+
+import sys
+import logging
+import argparse
+import argcomplete
+
+import novalabs.core.MW as MW
+from novalabs.misc.helpers import *
+
+
+def _create_argsparser():
+    parser = argparse.ArgumentParser(
+        description='Exposes a serial port over TCP (e.g. CoreBootloader.py -p DebugTransport TCPLineIO HOST PORT)'
+    )
+
+    parser.add_argument(
+        '-v', '--verbose', required=False, action='count', default=0,
+        help='verbosity level (default %(default)s): 0=critical, 1=error, 2=warning, 3=info, 4=debug',
+        dest='verbosity'
+    )
+
+    parser.add_argument(
+        '-a', '--address', required=False,
+        default='127.0.0.1',
+        help='Address to listen on, 0.0.0.0 for all the interfaces [default = %(default)s]',
+        dest='address'
+    )
+
+    parser.add_argument(
+        '-P', '--port', required=False,
+        type=int,
+        default=4000,
+        help='TCP port [default = %(default)s]',
+        dest='port'
+    )
+
+    parser.add_argument('device', nargs='?', default='/dev/ttyACM0', help='Serial port [default = %(default)s]')
+    parser.add_argument('baud', nargs='?', type=int, default=921600, help='Baud rate [default = %(default)s]')
+
+    return parser
+
+
+def _main():
+    parser = _create_argsparser()
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=verbosity2level(int(args.verbosity)))
+    logging.debug('sys.argv = ' + repr(sys.argv))
+
+    gateway = MW.TCPGateway(args.device, args.baud, args.port, args.address)
+    gateway.open()
+
+    try:
+        gateway.run()
+    except KeyboardInterrupt:
+        pass
+
+    gateway.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
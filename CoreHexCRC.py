@@ -7,6 +7,7 @@ import argparse
 
 from novalabs.misc.helpers import *
 from novalabs.misc.crc import *
+from novalabs.misc.imagecache import ImageCache
 
 from time import sleep
 
@@ -45,13 +46,7 @@ def hex_crc(args):
     ihex_file = args.file[0]
     programSize = int(args.size[0])
 
-    from intelhex import IntelHex
-
-    ih = IntelHex()
-    ih.loadfile(ihex_file, format="hex")
-    ih.padding = 0xFF
-    bin = ih.tobinarray(size=programSize)
-    crc = stm32_crc32_bytes(0xffffffff, bin)
+    crc = ImageCache().crc(ihex_file, programSize)
     print(hex(crc))
 
     return 0
@@ -11,6 +11,7 @@ import argcomplete
 import io
 
 from novalabs.core.CorePackage import *
+from novalabs.core.CoreJobs import CoreJobs
 import novalabs.generators as generators
 
 def action_completer(prefix, parsed_args, **kwargs):
@@ -153,13 +154,19 @@ def generateDocumentation(name, git_rev, docs,nodes,params,msgs):
     return "\n".join(buffer)
 
 
-def generate(srcPath, dstPath, workspaceMode, verbose, link=False, relPathSrc=None, relPathDst=None):
+# Per-file generation steps: (heading, object, generator, list method)
+FILE_GENERATORS = [
+    ("CONFIGURATIONS", CoreConfiguration, generators.CoreConfigurationGenerator, "listConfigurationFiles"),
+    ("MESSAGES", CoreMessage, generators.CoreMessageGenerator, "listMessageFiles"),
+    ("NODES", CoreNode, generators.CoreNodeGenerator, "listNodeFiles"),
+]
+
+
+def generateSkeleton(srcPath, dstPath, workspaceMode, verbose, link=False, relPathSrc=None, relPathDst=None):
     if not verbose:
         CoreConsole.debug = False
         CoreConsole.verbose = False
 
-    isOk = True
-
     package = CorePackage()
     package.open(srcPath)
 
@@ -179,66 +186,56 @@ def generate(srcPath, dstPath, workspaceMode, verbose, link=False, relPathSrc=No
 
     if not package_gen.generated:
         printSuccessOrFailure(False)
-        return -1
+        return None
 
-    #TODO move the following inside CorePackage class...
+    return {
+        "package": package,
+        "targetPath": targetPath,
+        "destination": package_gen.destination,
+        "files": [getattr(package, x[3])() for x in FILE_GENERATORS],
+    }
 
-    # --- Generate configurations -------------------------------------------------
-    table = []
-    tmp = package.listConfigurationFiles()
-    for x in tmp:
-        conf = CoreConfiguration()
-        gen = generators.CoreConfigurationGenerator(conf)
-        if conf.open(x, package):
-            gen.generate(targetPath)
 
-        table.append(gen.getSummaryGenerate(package.packageRoot, package_gen.destination))
+def generateFile(skeleton, kind, filename):
+    package = skeleton["package"]
 
-        if not gen.generated:
-            isOk = False
-    if len(tmp) > 0:
-        CoreConsole.out("")
-        CoreConsole.out(CoreConsole.h2("CONFIGURATIONS"))
-        CoreConsole.out(CoreConsole.table(table, generators.CoreConfigurationGenerator.getSummaryFieldsGenerate()))
-    # -----------------------------------------------------------------------------
+    (heading, objectClass, generatorClass, listFiles) = FILE_GENERATORS[kind]
 
-    # --- Generate messages -------------------------------------------------------
-    table = []
-    tmp = package.listMessageFiles()
-    for x in tmp:
-        message = CoreMessage()
-        gen = generators.CoreMessageGenerator(message)
+    obj = objectClass()
+    gen = generatorClass(obj)
+    if obj.open(filename, package):
+        gen.generate(skeleton["targetPath"])
 
-        if message.open(x, package):
-            gen.generate(targetPath)
+    return gen.getSummaryGenerate(package.packageRoot, skeleton["destination"]), gen.generated
 
-        table.append(gen.getSummaryGenerate(package.packageRoot, package_gen.destination))
 
-        if not gen.generated:
-            isOk = False
-    if len(tmp) > 0:
-        CoreConsole.out("")
-        CoreConsole.out(CoreConsole.h2("MESSAGES"))
-        CoreConsole.out(CoreConsole.table(table, generators.CoreMessageGenerator.getSummaryFieldsGenerate()))
-    # -----------------------------------------------------------------------------
-
-    # --- Generate nodes ----------------------------------------------------------
-    table = []
-    tmp = package.listNodeFiles()
-    for x in tmp:
-        node = CoreNode()
-        gen = generators.CoreNodeGenerator(node)
-        if node.open(x, package):
-            gen.generate(targetPath)
-
-        table.append(gen.getSummaryGenerate(package.packageRoot, package_gen.destination))
+def generateFinish(skeleton, results):
+    isOk = True
 
-        if not gen.generated:
-            isOk = False
-    if len(tmp) > 0:
-        CoreConsole.out("")
-        CoreConsole.out(CoreConsole.h2("MESSAGES"))
-        CoreConsole.out(CoreConsole.table(table,  generators.CoreNodeGenerator.getSummaryFieldsGenerate()))
+    package = skeleton["package"]
+    targetPath = skeleton["targetPath"]
+
+    # --- Generated configurations, messages and nodes ----------------------------
+    for (heading, objectClass, generatorClass, listFiles), files, jobs in zip(FILE_GENERATORS, skeleton["files"], results):
+        table = []
+        for x, (result, output, error) in zip(files, jobs):
+            if len(output) > 0:
+                CoreConsole.out(output.rstrip("\n"))
+
+            if error is not None:
+                isOk = False
+                CoreConsole.out(CoreConsole.error(x + ": " + str(error)))
+                continue
+
+            (row, generated) = result
+            table.append(row)
+
+            if not generated:
+                isOk = False
+        if len(files) > 0:
+            CoreConsole.out("")
+            CoreConsole.out(CoreConsole.h2(heading))
+            CoreConsole.out(CoreConsole.table(table, generatorClass.getSummaryFieldsGenerate()))
     # -----------------------------------------------------------------------------
 
     # --- Generate documentation --------------------------------------------------
@@ -255,8 +252,7 @@ def generate(srcPath, dstPath, workspaceMode, verbose, link=False, relPathSrc=No
 
     try:
         try:
-            sink = open(docDestination, 'w')
-            sink.write(index)
+            writeIfChanged(docDestination, index)
         except IOError as e:
             raise CoreError(str(e.strerror), e.filename)
     except CoreError as e:
@@ -273,6 +269,24 @@ def generate(srcPath, dstPath, workspaceMode, verbose, link=False, relPathSrc=No
         return -1
 
 
+def generateSubmit(skeleton, jobs):
+    # One job per configuration, message and node, in FILE_GENERATORS order
+    return [[jobs.submit(generateFile, skeleton, kind, x) for x in files] for kind, files in enumerate(skeleton["files"])]
+
+
+def generate(srcPath, dstPath, workspaceMode, verbose, link=False, relPathSrc=None, relPathDst=None, jobs=None):
+    if jobs is None:
+        jobs = CoreJobs()
+
+    skeleton = generateSkeleton(srcPath, dstPath, workspaceMode, verbose, link, relPathSrc, relPathDst)
+    if skeleton is None:
+        return -1
+
+    submitted = generateSubmit(skeleton, jobs)
+
+    return generateFinish(skeleton, [[jobs.result(x) for x in files] for files in submitted])
+
+
 if '__main__' == __name__:
     try:
         parser = argparse.ArgumentParser()
@@ -285,6 +299,7 @@ if '__main__' == __name__:
 
         parser_gen = subparsers.add_parser('generate', help='Generates the Module sources and CMake files')
         parser_gen.add_argument("--link", help="Link instead of copy source files [default = False]", action="store_true", default=False)
+        parser_gen.add_argument("-j", "--jobs", help="Number of parallel jobs [default = 1]", type=int, default=1)
         parser_gen.add_argument("package", nargs='?', help="Package [default = None]", default=None).completer = package_completer
         parser_gen.add_argument("destination", nargs='?', help="Path to destination [default = None]", default=None)
 
@@ -337,7 +352,9 @@ if '__main__' == __name__:
                 if dst is None:
                     dst = os.path.join(coreWorkspace, "generated", "packages")
 
-            retval = generate(src, dst, workspaceMode, verbose, args.link)
+            jobs = CoreJobs(args.jobs)
+            retval = generate(src, dst, workspaceMode, verbose, args.link, jobs=jobs)
+            jobs.shutdown()
 
         sys.exit(retval)
 
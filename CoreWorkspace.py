@@ -10,10 +10,19 @@ import argparse
 import argcomplete
 
 import subprocess
+import threading
+import time
+import json
+import hashlib
+import concurrent.futures
 
 from novalabs.core.CoreWorkspace import *
+from novalabs.core.CoreBuildGraph import CoreBuildGraph
 from CoreModule import generate as generateModule
-from CorePackage import generate as generatePackage
+from CorePackage import generateSkeleton as generatePackageSkeleton, generateSubmit as generatePackageSubmit, generateFinish as generatePackageFinish
+from novalabs.core.CoreJobs import CoreJobs
+from novalabs.misc.ihex import ihex_dump
+from novalabs.misc.paramsarchive import npa_is
 import novalabs.generators as generators
 
 
@@ -64,6 +73,106 @@ def cmakeCommand(chip, source, buildType, OSVersion="CHIBIOS_16", workspaceRoot=
     return cmake_cmd
 
 
+# Stored in each build directory, the inputs it has been configured from
+CMAKE_FINGERPRINT = "CMakeFingerprint.json"
+
+CMAKE_ENVIRONMENT = ["NOVA_CORE_ROOT", "NOVA_CORE_TOOLCHAIN", "NOVA_CHIBIOS_16_ROOT", "CMAKE_PREFIX_PATH", "CMAKE_MODULE_PATH"]
+
+
+def cmakeFingerprint(cmake_cmd, chip, buildType, OSVersion, files):
+    fingerprint = {
+        "command": cmake_cmd,
+        "chip": chip,
+        "build_type": buildType,
+        "os_version": OSVersion,
+    }
+
+    for x in CMAKE_ENVIRONMENT:
+        fingerprint[x] = os.environ.get(x)
+
+    for filename in files:  # The generated CMake files
+        try:
+            with open(filename, 'rb') as src:
+                fingerprint[filename] = hashlib.sha1(src.read()).hexdigest()
+        except IOError:
+            fingerprint[filename] = None
+
+    return fingerprint
+
+
+def cmakeReconfigure(dest, fingerprint):
+    """Returns the list of reasons why a build directory must be configured again (empty if it is up to date)"""
+
+    if not os.path.isfile(os.path.join(dest, "CMakeCache.txt")):
+        return ["missing CMakeCache.txt"]
+
+    try:
+        with open(os.path.join(dest, CMAKE_FINGERPRINT), 'r') as src:
+            previous = json.load(src)
+    except (IOError, ValueError):
+        return ["missing fingerprint"]
+
+    return ["'" + x + "' changed" for x in sorted(set(fingerprint) | set(previous)) if fingerprint.get(x) != previous.get(x)]
+
+
+def cmakeStoreFingerprint(dest, fingerprint):
+    filename = os.path.join(dest, CMAKE_FINGERPRINT)
+
+    if fingerprint is not None:
+        with open(filename, 'w') as sink:
+            json.dump(fingerprint, sink, indent=1, sort_keys=True)
+    elif os.path.isfile(filename):
+        os.unlink(filename)  # A failed configuration must not look up to date
+
+
+def configure(builds, jobsCount=1, verbose=False):
+    """Runs the (name, cmake_cmd, dest) builds on a pool of jobsCount threads. Returns a (success, seconds, error) per build"""
+
+    lock = threading.Lock()  # Lines of concurrent builds must not interleave
+
+    def run(name, cmake_cmd, dest):
+        prefix = Fore.MAGENTA + "[" + name + "] " + Fore.RESET
+        start = time.time()
+        lines = []
+
+        try:
+            with lock:
+                CoreConsole.info(prefix + Fore.MAGENTA + cmake_cmd + Fore.RESET)
+
+            process = subprocess.Popen(cmake_cmd, shell=True, cwd=dest, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            for line in process.stdout:
+                line = prefix + line.decode("utf-8", "replace").rstrip()
+                if verbose:
+                    with lock:
+                        CoreConsole.out(line)
+                else:
+                    lines.append(line)
+
+            if process.wait() != 0:
+                with lock:
+                    for line in lines:  # Not streamed, but needed to understand what went wrong
+                        CoreConsole.out(line)
+                    CoreConsole.out(prefix + "CMake subprocess failed")
+                return False, time.time() - start, "CMake error. Try with --verbose"
+
+            return True, time.time() - start, None
+        except Exception as e:
+            return False, time.time() - start, "Unexpected error: " + repr(e)
+
+    if len(builds) == 0:
+        return []
+
+    start = time.time()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobsCount, 1)) as executor:
+        futures = [executor.submit(run, *build) for build in builds]
+        results = [f.result() for f in futures]
+
+    CoreConsole.out("CMake: configured %d builds, total time: %.2f s" % (len(builds), time.time() - start))
+
+    return results
+
+
 def createJSON(root):
     buffer = []
 
@@ -123,6 +232,13 @@ def build_type_completer(prefix, parsed_args, **kwargs):
     return (m for m in mm if m.startswith(prefix))
 
 
+def mustRebuild(graph, node, explain):
+    if explain:
+        CoreConsole.out(graph.explain(node))
+
+    return graph.isDirty(node)
+
+
 def ls(srcPath, verbose):
     if not verbose:
         CoreConsole.debug = False
@@ -131,7 +247,7 @@ def ls(srcPath, verbose):
     isOk = True
 
     workspace = Workspace()
-    workspace.open(coreRoot=NOVA_CORE_ROOT, workspaceRoot=NOVA_WORKSPACE_ROOT)
+    workspace.open(coreRoot=NOVA_CORE_ROOT, workspaceRoot=NOVA_WORKSPACE_ROOT, lazy=False)  # Lists everything
     CoreConsole.out(CoreConsole.h1("WORKSPACE"))
 
     if not workspace.isValid():
@@ -237,7 +353,7 @@ def ls(srcPath, verbose):
         return -1
 
 
-def generate(srcPath, dstPath, buildTypes, force, verbose):
+def generate(srcPath, dstPath, buildTypes, force, verbose, explain=False, jobsCount=1, reconfigure=False, archive=None):
     # I know that the following is a huge heap of crap, so please do not complain about it.
     if not verbose:
         CoreConsole.debug = False
@@ -272,70 +388,165 @@ def generate(srcPath, dstPath, buildTypes, force, verbose):
         printSuccessOrFailure(False)
         return -1
 
+    # --- BUILD GRAPH -------------------------------------------------------------
+    # Every package, module, parameters target and module target is a node, fingerprinted
+    # by the content of its sources and by the nodes it depends on. Nodes whose fingerprint
+    # matches the last successful run are not regenerated. CMake build directories keep
+    # their own fingerprint, see cmakeFingerprint().
+
+    graph = CoreBuildGraph()
+    graph.open(workspace.getBuildPath())
+
+    graph.node("tools", [os.path.dirname(os.path.dirname(os.path.abspath(generators.__file__)))])
+    mustRebuild(graph, "tools", explain)
+    graph.done("tools")
+
     # --- DEPS --------------------------------------------------------------------
+    # Packages and modules are generated by a pool of jobs, each package being split
+    # into one job per configuration, message and node. Results are reported in order.
+
+    jobs = CoreJobs(jobsCount)
+
+    packagesPath = os.path.join(workspace.getGeneratedPath(), "packages")
+    modulesPath = os.path.join(workspace.getGeneratedPath(), "modules")
+
+    steps = []  # (kind, node, message, name, job)
 
-    table = []
     for x in workspace.packagesCoreDependencies:
-        CoreConsole.out(Fore.MAGENTA + "Generating Core Package dependency: " + Style.BRIGHT + x.name + Style.RESET_ALL)
-        res = generatePackage(os.path.join(workspace.core.getPackagesRoot(), x.name), os.path.join(workspace.getGeneratedPath(), "packages"), True, args.verbose, False, None, workspace.getRoot())
-        if res != 0:
-            isOk = False
-            CoreConsole.out(str(res))
-        CoreConsole.out('')
+        node = "package:" + x.name
+        graph.node(node, [os.path.join(workspace.core.getPackagesRoot(), x.name)], {"workspace": False}, ["tools"], [os.path.join(packagesPath, x.name)])
+        if not mustRebuild(graph, node, explain):
+            steps.append((None, node, "Core Package dependency up to date: ", x.name, None))
+        else:
+            steps.append(("package", node, "Generating Core Package dependency: ", x.name, jobs.submit(generatePackageSkeleton, os.path.join(workspace.core.getPackagesRoot(), x.name), packagesPath, True, verbose, False, None, workspace.getRoot())))
 
     for x in workspace.packagesWorkspaceDependencies:
-        CoreConsole.out(Fore.MAGENTA + "Generating Workspace Package dependency: " + Style.BRIGHT + x.name + Style.RESET_ALL)
-        res = generatePackage(os.path.join(workspace.getPackagesRoot(), x.name), os.path.join(workspace.getGeneratedPath(), "packages"), True, args.verbose, True, workspace.getRoot(), workspace.getRoot())
-        if res != 0:
-            isOk = False
-            CoreConsole.out(str(res))
-        CoreConsole.out('')
+        node = "package:" + x.name
+        graph.node(node, [os.path.join(workspace.getPackagesRoot(), x.name)], {"workspace": True}, ["tools"], [os.path.join(packagesPath, x.name)])
+        if not mustRebuild(graph, node, explain):
+            steps.append((None, node, "Workspace Package dependency up to date: ", x.name, None))
+        else:
+            steps.append(("package", node, "Generating Workspace Package dependency: ", x.name, jobs.submit(generatePackageSkeleton, os.path.join(workspace.getPackagesRoot(), x.name), packagesPath, True, verbose, True, workspace.getRoot(), workspace.getRoot())))
 
     for x in workspace.packagesNoneDependencies:
-        CoreConsole.out(Fore.MAGENTA + "Generating Package dependency: " + Style.BRIGHT + x + Style.RESET_ALL)
-        CoreConsole.out(CoreConsole.error("404 not found"))
-        CoreConsole.out('')
+        steps.append(("missing", None, "Generating Package dependency: ", x, None))
 
     for x in workspace.modulesCoreDependencies:
-        CoreConsole.out(Fore.MAGENTA + "Generating Core Module dependency: " + Style.BRIGHT + x.name + Style.RESET_ALL)
-        res = generateModule(os.path.join(workspace.core.getModulesRoot(), x.name), os.path.join(workspace.getGeneratedPath(), "modules"), True, args.verbose, False, None, workspace.getRoot())
-        if res != 0:
-            isOk = False
-            CoreConsole.out(str(res))
-        CoreConsole.out('')
+        node = "module:" + x.name
+        graph.node(node, [os.path.join(workspace.core.getModulesRoot(), x.name)], {"workspace": False}, ["tools"], [os.path.join(modulesPath, x.name)])
+        if not mustRebuild(graph, node, explain):
+            steps.append((None, node, "Core Module dependency up to date: ", x.name, None))
+        else:
+            steps.append(("module", node, "Generating Core Module dependency: ", x.name, jobs.submit(generateModule, os.path.join(workspace.core.getModulesRoot(), x.name), modulesPath, True, verbose, False, None, workspace.getRoot())))
 
     for x in workspace.modulesWorkspaceDependencies:
-        CoreConsole.out(Fore.MAGENTA + "Generating Workspace Module dependency: " + Style.BRIGHT + x.name + Style.RESET_ALL)
-        res = generateModule(os.path.join(workspace.coreWorkspace.getModulesRoot(), x.name), os.path.join(workspace.getGeneratedPath(), "modules"), True, args.verbose, True, workspace.getRoot(), workspace.getRoot())
+        node = "module:" + x.name
+        graph.node(node, [os.path.join(workspace.coreWorkspace.getModulesRoot(), x.name)], {"workspace": True}, ["tools"], [os.path.join(modulesPath, x.name)])
+        if not mustRebuild(graph, node, explain):
+            steps.append((None, node, "Workspace Module dependency up to date: ", x.name, None))
+        else:
+            steps.append(("module", node, "Generating Workspace Module dependency: ", x.name, jobs.submit(generateModule, os.path.join(workspace.coreWorkspace.getModulesRoot(), x.name), modulesPath, True, verbose, True, workspace.getRoot(), workspace.getRoot())))
+
+    for x in workspace.modulesNoneDependencies:
+        steps.append(("missing", None, "Generating Module dependency: ", x, None))
+
+    # As soon as the skeleton of a package is there, its files can be generated
+    skeletons = dict()
+    for i, (kind, node, message, name, job) in enumerate(steps):
+        if kind == "package":
+            (skeleton, output, error) = jobs.result(job)
+            if skeleton is not None:
+                skeletons[i] = (skeleton, output, error, generatePackageSubmit(skeleton, jobs))
+            else:
+                skeletons[i] = (skeleton, output, error, None)
+
+    for i, (kind, node, message, name, job) in enumerate(steps):
+        CoreConsole.out(Fore.MAGENTA + message + Style.BRIGHT + name + Style.RESET_ALL)
+
+        if kind is None:
+            CoreConsole.out('')
+            continue
+
+        if kind == "missing":
+            CoreConsole.out(CoreConsole.error("404 not found"))
+            CoreConsole.out('')
+            continue
+
+        if kind == "package":
+            (skeleton, output, error, files) = skeletons[i]
+            if len(output) > 0:
+                CoreConsole.out(output.rstrip("\n"))
+
+            if error is not None:
+                res = str(error)
+            elif skeleton is None:
+                res = -1
+            else:
+                res = generatePackageFinish(skeleton, [[jobs.result(y) for y in x] for x in files])
+        else:
+            (res, output, error) = jobs.result(job)
+            if len(output) > 0:
+                CoreConsole.out(output.rstrip("\n"))
+
+            if error is not None:
+                res = str(error)
+
         if res != 0:
             isOk = False
             CoreConsole.out(str(res))
+        graph.done(node, res == 0)
         CoreConsole.out('')
 
-    for x in workspace.modulesNoneDependencies:
-        CoreConsole.out(Fore.MAGENTA + "Generating Module dependency: " + Style.BRIGHT + x + Style.RESET_ALL)
-        CoreConsole.out(CoreConsole.error("404 not found"))
-        CoreConsole.out('')
+    jobs.shutdown()
 
     # --- NOW THE TARGETS ---------------------------------------------------------
 
-    table = []
+    targets = []  # (target, skip, node)
     for p in workspace.validParameterTargets():
-        p.generate(workspace, os.path.join(workspace.getGeneratedPath(), "params"), os.path.join(workspace.getBuildPath(), "params"))
+        node = "params:" + p.parameters + "/" + p.name
+        roots = [p.source]
+        deps = ["tools"]
+        parameters = workspace.getParameters(p.parameters)
+        if parameters is not None:
+            roots.append(parameters.source)
+            deps += ["package:" + x for x in sorted(parameters.requiredPackages())]
+        outputs = [os.path.join(workspace.getGeneratedPath(), "params", p.parameters, p.name + ".bin"), os.path.join(workspace.getBuildPath(), "params", p.parameters, p.name + ".hex")]
+
+        graph.node(node, roots, {}, deps, outputs)
+        targets.append((p, not mustRebuild(graph, node, explain), node))
+
+    # All the images are packed first, then written in parallel
+    builder = ParametersBuilder(workspace, os.path.join(workspace.getGeneratedPath(), "params"), os.path.join(workspace.getBuildPath(), "params"), jobsCount)
+    builder.build([(p, skip) for p, skip, node in targets])
+
+    table = []
+    for p, skip, node in targets:
         table.append(p.getSummaryGenerate(workspace.getRoot(), workspace.getRoot()))
 
+        if not skip:
+            graph.done(node, p.generated)
+
         if not p.generated:
             isOk = False
 
     if len(table) > 0:
         CoreConsole.out(CoreConsole.h1("GENERATED PARAMETERS TARGETS"))
         CoreConsole.out(CoreConsole.table(table, ParametersTarget.getSummaryFieldsGenerate()))
+        CoreConsole.out(builder.getSummary())
+
+        if archive is not None:
+            if builder.archive(archive):
+                CoreConsole.out("Parameters archive: " + CoreConsole.highlightFilename(archive))
+            else:
+                isOk = False
 
     table = []
+    rows = []  # (fields, targetSuccess, targetNode, targetDirty, generated, cmakeBuilds)
     targets = []
 
     for m in workspace.validModuleTargets():
         targetSuccess = True
+        cmakeBuilds = []
 
         target_root = os.path.join(workspace.getSourcesPath(), "targets", m.name)
 
@@ -401,9 +612,14 @@ def generate(srcPath, dstPath, buildTypes, force, verbose):
 
         executeCmake = True
 
+        targetNode = "target:" + m.name
+        deps = ["tools", "module:" + cm.name] + ["package:" + x for x in sorted(set(m.requiredPackages + cm.requiredPackages))]
+        graph.node(targetNode, [target_root], {"mustGenerate": mustGenerate}, deps, [os.path.join(target_root, "CMakeLists.txt")])
+        targetDirty = mustRebuild(graph, targetNode, explain)
+
         gen = generators.ModuleTargetGenerator(m)
 
-        gen.generate(target_root, not mustGenerate)
+        gen.generate(target_root, not mustGenerate or not targetDirty)
         if gen.generated:
             fields = [CoreConsole.highlight(m.name), m.description, m.module, cm.chip, m.os_version, os.path.relpath(gen.destination, workspace.getRoot()), str(mustGenerate)]
             headers = ["Name", "Description", "CoreModule", "Chip", "OS Version", "CMakeLists", "Generated CMakeLists"]
@@ -414,6 +630,10 @@ def generate(srcPath, dstPath, buildTypes, force, verbose):
             fields = [CoreConsole.highlight(m.name), m.description, m.module, cm.chip, m.os_version, CoreConsole.error(m.reason), str(mustGenerate)]
             headers = ["Name", "Description", "CoreModule", "Chip", "OS Version", "CMakeLists", "Generated CMakeLists"]
 
+        # What CMake reads from the generated sources, its own files are tracked by the generated build system
+        cmakeFiles = [gen.destination, os.path.join(workspace.getGeneratedPath(), "modules", cm.name, cm.name + "Config.cmake")]
+        cmakeFiles += [os.path.join(workspace.getGeneratedPath(), "packages", x, x + "Config.cmake") for x in sorted(set(m.requiredPackages + cm.requiredPackages))]
+
         for buildType in buildTypes:
             headers += ["Build (" + buildType + ")", "CMake (" + buildType + ")"]
 
@@ -430,23 +650,19 @@ def generate(srcPath, dstPath, buildTypes, force, verbose):
 
                     cmake_cmd = cmakeCommand(cm.chip, source, buildType, m.os_version, workspace.getRoot())
 
-                    try:
-                        CoreConsole.info(Fore.MAGENTA + cmake_cmd + Fore.RESET)
-
-                        out = subprocess.check_output(cmake_cmd, shell=True, cwd=dest)
-                        if verbose:
-                            CoreConsole.out(out)
-
-                        fields += [os.path.relpath(dest, workspace.getRoot()), "OK"]
-                    except subprocess.CalledProcessError as e:
-                        CoreConsole.out("CMake subprocess failed")
-                        isOk = False
-                        targetSuccess = False
-                        fields += [os.path.relpath(dest, workspace.getRoot()), CoreConsole.error("CMake error. Try with --verbose")]
-                    except BaseException as e:
-                        fields += [os.path.relpath(dest, workspace.getRoot()), CoreConsole.error("Unexpected error: " + repr(e))]
-                        isOk = False
-                        targetSuccess = False
+                    fingerprint = cmakeFingerprint(cmake_cmd, cm.chip, buildType, m.os_version, cmakeFiles)
+                    reasons = cmakeReconfigure(dest, fingerprint)
+                    if reconfigure:
+                        reasons.append("forced")
+
+                    if explain:
+                        CoreConsole.out(CoreConsole.highlight("cmake:" + m.name + ":" + buildType) + ": " + ("; ".join(reasons) if len(reasons) > 0 else "up to date"))
+
+                    if len(reasons) == 0:
+                        fields += [os.path.relpath(dest, workspace.getRoot()), "Up to date"]
+                    else:
+                        fields += [os.path.relpath(dest, workspace.getRoot()), None]  # Filled in once configured
+                        cmakeBuilds.append((fingerprint, len(fields) - 1, (m.name + ":" + buildType, cmake_cmd, dest)))
             else:
                 fields += ["---", "---"]
 
@@ -509,12 +725,41 @@ def generate(srcPath, dstPath, buildTypes, force, verbose):
             headers += ["Eclipse files"]
             targetSuccess = False
 
+        headers += ["Status"]
+
+        rows.append((fields, targetSuccess, targetNode, targetDirty, gen.generated, cmakeBuilds))
+
+    # --- CMAKE -------------------------------------------------------------------
+    # The CMake builds of all the targets are configured concurrently, then the rows
+    # of the summary table are completed in order.
+
+    builds = [build for row in rows for (fingerprint, index, build) in row[5]]
+    results = iter(configure(builds, jobsCount, verbose))
+
+    for fields, targetSuccess, targetNode, targetDirty, generated, cmakeBuilds in rows:
+        # The target is recorded after the Eclipse files, as they live in its root, and before its CMake builds, which depend on it
+        if targetDirty:
+            graph.done(targetNode, generated)
+
+        for fingerprint, index, build in cmakeBuilds:
+            (success, seconds, error) = next(results)
+
+            if success:
+                fields[index] = "OK (%.2f s)" % seconds
+            else:
+                fields[index] = CoreConsole.error(error)
+                isOk = False
+                targetSuccess = False
+
+            try:
+                cmakeStoreFingerprint(build[2], fingerprint if success else None)
+            except IOError as e:
+                CoreConsole.out(CoreConsole.error(str(e.strerror) + " [" + CoreConsole.highlightFilename(e.filename) + "]"))
+
         if targetSuccess:
             fields += [CoreConsole.success("OK")]
-            headers += ["Status"]
         else:
             fields += [CoreConsole.fail("FAIL")]
-            headers += ["Status"]
 
         table.append(fields)
 
@@ -541,6 +786,10 @@ def generate(srcPath, dstPath, buildTypes, force, verbose):
         CoreConsole.out(CoreConsole.table(table, ParametersTarget.getSummaryFields()))
         isOk = False
 
+    graph.save()
+
+    CoreConsole.out("Generated files: %d updated, %d unchanged" % (outputStatistics["updated"], outputStatistics["unchanged"]))
+
     printSuccessOrFailure(isOk)
 
     # The following is disabled
@@ -631,6 +880,125 @@ def initialize(force, verbose):
         return -1
 
 
+def decode(files, out, verbose):
+    if not verbose:
+        CoreConsole.debug = False
+        CoreConsole.verbose = False
+
+    isOk = True
+
+    workspace = Workspace()
+    workspace.open(coreRoot=NOVA_CORE_ROOT, workspaceRoot=NOVA_WORKSPACE_ROOT)
+
+    if not workspace.isValid():
+        CoreConsole.out(CoreConsole.error(workspace.reason))
+        printSuccessOrFailure(False)
+        return -1
+
+    decoder = ParametersDecoder(workspace)
+
+    table = []
+    for filename in files:
+        targets = decoder.decodeFile(filename)
+
+        if targets is None:
+            table.append([CoreConsole.highlightFilename(filename), "", "", CoreConsole.error(decoder.reason)])
+            isOk = False
+            continue
+
+        for target in targets:
+            if target is None:
+                table.append([CoreConsole.highlightFilename(filename), "", "", CoreConsole.error(decoder.reason)])
+                isOk = False
+            elif out is not None:
+                mkdir(out)
+                destination = os.path.join(out, target["name"] + ".json")
+                writeIfChanged(destination, json.dumps(target, indent=2) + "\n")
+                table.append([CoreConsole.highlightFilename(filename), target["target"], destination, CoreConsole.success("OK")])
+            else:
+                CoreConsole.out(json.dumps(target, indent=2))
+
+    if len(table) > 0:
+        CoreConsole.out(CoreConsole.h1("DECODED PARAMETERS"))
+        CoreConsole.out(CoreConsole.table(table, ["Image", "Parameters", "Target", "Status"]))
+
+    if out is not None or not isOk:
+        printSuccessOrFailure(isOk)
+
+    if isOk:
+        return 0
+    else:
+        return -1
+
+
+def delta(current, new, out, verbose):
+    if not verbose:
+        CoreConsole.debug = False
+        CoreConsole.verbose = False
+
+    isOk = True
+
+    workspace = Workspace()
+    workspace.open(coreRoot=NOVA_CORE_ROOT, workspaceRoot=NOVA_WORKSPACE_ROOT)
+
+    if not workspace.isValid():
+        CoreConsole.out(CoreConsole.error(workspace.reason))
+        printSuccessOrFailure(False)
+        return -1
+
+    decoder = ParametersDecoder(workspace)
+
+    currentImages = decoder.load(current)
+    newImages = decoder.load(new)
+
+    if currentImages is None or newImages is None:
+        CoreConsole.out(CoreConsole.error(decoder.reason))
+        printSuccessOrFailure(False)
+        return -1
+
+    if len(currentImages) == 1 and len(newImages) == 1 and not npa_is(new):
+        pairs = [(out, currentImages[0][1], newImages[0][1], newImages[0][0])]  # Two images, a single delta
+    else:
+        currentImages = dict(currentImages)  # Two archives, a delta per image in out/
+        pairs = [(os.path.join(out, x + ".hex"), currentImages.get(x), data, x) for x, data in newImages]
+
+    table = []
+    for destination, currentData, newData, name in pairs:
+        if currentData is None:  # New target, it must be flashed anyway
+            segments = decoder.delta(b"", newData)
+        else:
+            segments = decoder.delta(currentData, newData)
+
+        if segments is None:
+            table.append([CoreConsole.highlight(name), "", "", "", CoreConsole.error(decoder.reason)])
+            isOk = False
+            continue
+
+        size = sum([len(x) for offset, x in segments])
+        blocks = decoder.blocks(newData)
+        changed = len([x for x in blocks if any([offset <= x[0] < offset + len(data) for offset, data in segments])])
+
+        if len(segments) > 0:
+            mkdir(os.path.dirname(os.path.abspath(destination)))
+            records = ihex_dump(segments)
+            writeIfChanged(destination, "\n".join(records) + "\n")
+            table.append([CoreConsole.highlight(name), "%d/%d" % (changed, len(blocks)), "%d/%d" % (size, len(newData)), str(len(records)), os.path.relpath(destination)])
+        else:
+            if os.path.isfile(destination):  # Nothing to flash, do not leave an old delta around
+                os.unlink(destination)
+            table.append([CoreConsole.highlight(name), "0/%d" % len(blocks), "0/%d" % len(newData), "0", "unchanged"])
+
+    CoreConsole.out(CoreConsole.h1("PARAMETERS DELTA"))
+    CoreConsole.out(CoreConsole.table(table, ["Image", "Blocks", "Bytes", "Records", "Delta"]))
+
+    printSuccessOrFailure(isOk)
+
+    if isOk:
+        return 0
+    else:
+        return -1
+
+
 def target_add(module_name, name):
     if not verbose:
         CoreConsole.debug = False
@@ -646,12 +1014,11 @@ def target_add(module_name, name):
         printSuccessOrFailure(False)
         return -1
 
-    for target in workspace.validModuleTargets():
-        if target.name == name:
-            CoreConsole.out(CoreConsole.error("Target '" + name + "' already defined"))
-            CoreConsole.out("")
-            printSuccessOrFailure(False)
-            return -1
+    if workspace.coreWorkspace.getModuleTargetByName(name) is not None:
+        CoreConsole.out(CoreConsole.error("Target '" + name + "' already defined"))
+        CoreConsole.out("")
+        printSuccessOrFailure(False)
+        return -1
 
     target_root = os.path.join(workspace.getModuleTargetsRoot(), name)
     default_params_root = os.path.join(workspace.getParametersTargetsRoot(), name)
@@ -725,6 +1092,19 @@ if '__main__' == __name__:
         parser_gen = subparsers.add_parser('generate', help='Generates the Workspace sources and CMake files')
         parser_gen.add_argument("build_type", nargs='?', help="Build type [default = debug]", default=None).completer = build_type_completer
         parser_gen.add_argument("--force", help="Generate even in presence on unmet dependencies [default = False]", action="store_true", default=False)
+        parser_gen.add_argument("-j", "--jobs", help="Number of parallel jobs, for generators and CMake [default = 1]", type=int, default=1)
+        parser_gen.add_argument("--reconfigure", help="Run CMake even if the inputs of the build directories did not change [default = False]", action="store_true", default=False)
+        parser_gen.add_argument("--params-archive", help="Also pack all the parameters images in a single indexed archive [default = None]", default=None, dest="params_archive")
+        parser_gen.add_argument("--explain", help="Explain why each node of the build graph is (not) regenerated [default = False]", action="store_true", default=False)
+
+        parser_decode = subparsers.add_parser('decode', help='Decodes parameters images (.bin, .hex, .npa) back to ParametersTarget JSON')
+        parser_decode.add_argument("files", nargs='+', help="Parameters images")
+        parser_decode.add_argument("--out", help="Write the JSON files in this directory, instead of printing them [default = None]", default=None)
+
+        parser_delta = subparsers.add_parser('delta', help='Writes the IHEX records of the configuration blocks that changed between two parameters images')
+        parser_delta.add_argument("current", help="Image on the device (.bin, .hex as read back, or .npa)")
+        parser_delta.add_argument("new", help="New image (.bin, .hex, or .npa)")
+        parser_delta.add_argument("out", help="Delta .hex file, or directory of delta .hex files for archives")
 
         parser_init = subparsers.add_parser('initialize', help='Initializes a Workspace')
         parser_init.add_argument("--force", help="Re-Initialize [default = False]", action="store_true", default=False)
@@ -773,7 +1153,13 @@ if '__main__' == __name__:
             else:
                 buildTypes = [args.build_type]
 
-            retval = generate(None, None, buildTypes, force, verbose)
+            retval = generate(None, None, buildTypes, force, verbose, args.explain, args.jobs, args.reconfigure, args.params_archive)
+
+        if args.action == "decode":
+            retval = decode(args.files, args.out, verbose)
+
+        if args.action == "delta":
+            retval = delta(args.current, args.new, args.out, verbose)
 
         if args.action == "target":
             if args.target_action == "add":
@@ -76,7 +76,7 @@ class Core(CoreContainer):
 
         return True
 
-    def open(self, root=None):
+    def open(self, root=None, lazy=True):
         self.valid = False
 
         try:
@@ -91,8 +91,8 @@ class Core(CoreContainer):
             jsonFile = os.path.join(self.root, "CORE.json")
 
             if self.openJSON(jsonFile):
-                self.openPackages()
-                self.openModules()
+                if not lazy:
+                    self.scan()
 
             return self.valid
         except CoreError as e:
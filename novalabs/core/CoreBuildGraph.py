@@ -0,0 +1,200 @@
+# COPYRIGHT (c) 2016-2018 Nova Labs SRL
+#
+# All rights reserved. All use of this software and documentation is
+# subject to the License Agreement located in the file LICENSE.
+
+import hashlib
+import json
+import tempfile
+
+from .CoreUtils import *
+
+
+class CoreBuildGraph:
+    # Bump when the layout of graph.json changes, old graphs are discarded
+    VERSION = 1
+
+    FILENAME = "graph.json"
+
+    def __init__(self):
+        self.filename = None
+
+        self.nodes = dict()  # Nodes of the last successful build, as stored in graph.json
+        self.current = dict()  # Nodes as fingerprinted in this run
+        self.reasons = dict()  # Why each node has to be rebuilt, empty if up to date
+
+        self.valid = False
+        self.reason = ""
+
+    def open(self, buildPath):
+        self.__init__()
+
+        self.filename = os.path.join(buildPath, self.FILENAME)
+
+        try:
+            with open(self.filename, 'r') as src:
+                data = json.load(src)
+
+            if data.get("version") == self.VERSION:
+                self.nodes = data["nodes"]
+        except IOError:
+            pass
+        except (ValueError, KeyError, AttributeError) as e:
+            CoreConsole.info("CoreBuildGraph::open: discarding " + CoreConsole.highlightFilename(self.filename) + ": " + str(e))
+
+        self.valid = True
+
+        return True
+
+    def save(self):
+        try:
+            if not self.valid:
+                raise CoreError("invalid", context="CoreBuildGraph::save")
+
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.filename))
+            with os.fdopen(fd, 'w') as sink:
+                json.dump({"version": self.VERSION, "nodes": self.nodes}, sink, indent=1, sort_keys=True)
+            os.replace(tmp, self.filename)
+
+            return True
+        except OSError as e:
+            self.reason = str(CoreError(str(e.strerror), e.filename))
+            CoreConsole.fail("CoreBuildGraph::save: " + self.reason)
+        except CoreError as e:
+            self.reason = str(e)
+            CoreConsole.fail("CoreBuildGraph::save: " + self.reason)
+
+        return False
+
+    def node(self, name, roots=[], values={}, deps=[], outputs=[]):
+        """Fingerprints a node, returns the list of reasons why it must be rebuilt (empty if it is up to date)"""
+
+        previous = self.nodes.get(name)
+
+        files = self.__scan(roots, previous["files"] if previous is not None else {})
+
+        external = dict()  # Dependencies that are files (or directories) rather than nodes: {path: files}
+        for x in deps:
+            if x not in self.current and os.path.exists(x):
+                external[x] = self.__scan([x], previous.get("external", {}).get(x, {}) if previous is not None else {})
+
+        depsHashes = dict([(x, self.__depHash(x, self.current, external)) for x in deps])
+
+        record = {
+            "roots": list(roots),
+            "files": files,
+            "values": values,
+            "deps": depsHashes,
+            "external": external,
+            "outputs": list(outputs),
+        }
+        record["hash"] = self.__hash(record)
+
+        self.current[name] = record
+
+        reasons = []
+        if previous is None:
+            reasons.append("new node")
+        else:
+            added = [x for x in files if x not in previous["files"]]
+            removed = [x for x in previous["files"] if x not in files]
+            modified = [x for x in files if x in previous["files"] and files[x][2] != previous["files"][x][2]]
+
+            for what, which in [("added", added), ("removed", removed), ("modified", modified)]:
+                if len(which) > 0:
+                    reasons.append(what + ": " + ", ".join(sorted(which)[:3]) + (" (+%d)" % (len(which) - 3) if len(which) > 3 else ""))
+
+            for x in sorted(set(values) | set(previous["values"])):
+                if values.get(x) != previous["values"].get(x):
+                    reasons.append("'" + x + "' changed")
+
+            for x in sorted(depsHashes):
+                if depsHashes[x] != previous["deps"].get(x):
+                    reasons.append("dependency " + x + " changed")
+
+        for x in outputs:
+            if not os.path.exists(x):
+                reasons.append("missing output " + x)
+
+        self.reasons[name] = reasons
+
+        return reasons
+
+    def isDirty(self, name):
+        return len(self.reasons.get(name, ["unknown node"])) > 0
+
+    def done(self, name, success=True):
+        """Records the outcome of a (re)build. Roots are rescanned, as generators may write inside them"""
+
+        if name not in self.current:
+            return
+
+        if success:
+            record = self.current[name]
+            record["files"] = self.__scan(record["roots"], record["files"])
+            record["external"] = dict([(x, self.__scan([x], record["external"][x])) for x in record["external"]])
+            record["deps"] = dict([(x, self.__depHash(x, self.nodes, record["external"])) for x in record["deps"]])
+            record["hash"] = self.__hash(record)
+            self.nodes[name] = record
+        else:
+            self.nodes.pop(name, None)
+
+    def explain(self, name):
+        reasons = self.reasons.get(name, ["unknown node"])
+
+        if len(reasons) == 0:
+            return CoreConsole.highlight(name) + ": up to date"
+        else:
+            return CoreConsole.highlight(name) + ": " + "; ".join(reasons)
+
+    @staticmethod
+    def __hash(record):
+        tmp = {
+            "files": dict([(x, record["files"][x][2]) for x in record["files"]]),
+            "values": record["values"],
+            "deps": record["deps"],
+        }
+
+        return hashlib.sha1(json.dumps(tmp, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def __depHash(name, nodes, external):
+        if name in nodes:
+            return nodes[name]["hash"]
+
+        if name in external:
+            return hashlib.sha1(json.dumps(dict([(x, external[name][x][2]) for x in external[name]]), sort_keys=True).encode("utf-8")).hexdigest()
+
+        return None  # Neither a node nor a file (e.g. a missing package): ignored until it appears
+
+    @staticmethod
+    def __scan(roots, previous):
+        # {filename: [size, mtime, sha1]}, the hash is reused if size and mtime did not change
+        files = dict()
+
+        for root in roots:
+            if os.path.isfile(root):
+                tmp = [root]
+            else:
+                tmp = []
+                for path, dirs, names in os.walk(root):
+                    dirs[:] = sorted([x for x in dirs if not x.startswith(".") and x != "__pycache__"])
+                    tmp += [os.path.join(path, x) for x in sorted(names) if not x.startswith(".")]
+
+            for filename in tmp:
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue  # Dangling link
+
+                entry = previous.get(filename)
+                if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+                    h = hashlib.sha1()
+                    with open(filename, 'rb') as src:
+                        for chunk in iter(lambda: src.read(1 << 20), b''):
+                            h.update(chunk)
+                    entry = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+
+                files[filename] = entry
+
+        return files
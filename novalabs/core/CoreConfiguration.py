@@ -71,6 +71,7 @@ class CoreConfiguration:
 
         self.data = None
         self.defaultData = None
+        self.defaultSource = None
 
         self.name = ""
         self.namespace = ""
@@ -81,6 +82,10 @@ class CoreConfiguration:
         self.signature = 0xffffffff
         self.signatureBuffer = []
 
+        self.plan = []  # (name, type, size, default, itemStruct) of each field, in packing order
+        self.struct = None  # '<L' + fields
+        self.namedStruct = None  # '<16sL' + fields
+
         self.valid = False
         self.reason = ""
 
@@ -110,50 +115,94 @@ class CoreConfiguration:
             return False
 
     def pack(self, fields, name=None):
+        if name is not None:
+            s = self.namedStruct
+        else:
+            s = self.struct
+
+        if s is None:
+            self.reason = "Invalid configuration"
+            CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
+            return (None, 0)
+
+        buffer = bytearray(s.size)
+
+        if self.packInto(buffer, 0, fields, name) == 0:
+            return (None, 0)
+
+        return (bytes(buffer), s.size)
+
+    def packInto(self, buffer, offset, fields, name=None):
+        """Packs the fields at buffer[offset:], returns the packed size (0 on error)"""
+
         values = []
         if name is not None:
-            formatString = '<16sL'
+            s = self.namedStruct
             values.append(bytes(name, "ascii"))
         else:
-            formatString = '<L'
+            s = self.struct
+
+        if s is None:
+            self.reason = "Invalid configuration"
+            CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
+            return 0
 
         values.append(self.signature)
 
-        for field in self.orderedFields:
+        for (fieldName, fieldType, fieldSize, default, itemStruct) in self.plan:
+            value = fields[fieldName] if fieldName in fields else default
 
-            if field['type'] == 'CHAR' and field['size'] > 1:
-                formatString = formatString + '%ds' % field['size']
+            if value is None:
+                self.reason = "No value or default specified for field '" + fieldName + "'"
+                CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
+                return 0
+
+            if itemStruct is not None:
+                # Arrays are checked (types and ranges) in bulk by pack_into, element by element only on error
+                if not isinstance(value, list) or len(value) != fieldSize:
+                    self.reason = "Value specified for field '" + fieldName + "' is not compatible with type '" + fieldType + "[" + str(fieldSize) + "]'"
+                    CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
+                    return 0
             else:
-                formatString = formatString + field['size'] * TYPE_FORMAT_MAP[field['type']]
+                value = checkCTypeValueForCoreType(fieldType, fieldSize, value)
 
-            value = None
+                if value is None:
+                    self.reason = "Value specified for field '" + fieldName + "' is not compatible with type '" + fieldType + "[" + str(fieldSize) + "]'"
+                    CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
+                    return 0
 
-            if field['name'] in fields:
-                value = fields[field['name']]
-            else:
-                if field['default'] is not None:
-                    value = field['default']
+            values.extend(value)
 
-            if value is None:
-                self.reason = "No value or default specified for field '" + field['name'] + "'"
-                CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
-                return (None, 0)
+        try:
+            s.pack_into(buffer, offset, *values)
+        except (struct.error, OverflowError) as e:
+            self.reason = self.__whyNotPacked(values[2 if name is not None else 1:]) or str(e)
+            CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
+            return 0
 
-            value = checkCTypeValueForCoreType(field['type'], field['size'], value)
+        if CoreConsole.enabled and (CoreConsole.debug or CoreConsole.verbose):  # Skip the repr() otherwise
+            CoreConsole.info("CoreConfiguration::pack: '" + s.format + "' [size=" + str(s.size) + "] " + repr(values) + " -> " + repr(bytes(buffer[offset:offset + s.size])))
 
-            if value is None:
-                self.reason = "Value specified for field '" + field['name'] + "' is not compatible with type '" + field['type'] + "[" + str(field['size']) + "]'"
-                CoreConsole.fail("CoreConfiguration::pack: " + self.reason)
-                return (None, 0)
+        return s.size
 
-            values = values + value
+    def unpack(self, values):
+        """Returns the fields of values, as unpacked by struct (or by namedStruct, without the name)"""
 
-        s = struct.Struct(formatString)
-        packed = s.pack(*values)
+        fields = dict()
+        i = 1
 
-        CoreConsole.info("CoreConfiguration::pack: '" + formatString + "' [size=" + str(s.size) + "] " + repr(values) + " -> " + repr(packed))
+        for (fieldName, fieldType, fieldSize, default, itemStruct) in self.plan:
+            if itemStruct is not None:
+                fields[fieldName] = list(values[i:i + fieldSize])
+                i += fieldSize
+            else:
+                if fieldType == 'CHAR':
+                    fields[fieldName] = values[i].rstrip(b'\0').decode('ascii')
+                else:
+                    fields[fieldName] = values[i]
+                i += 1
 
-        return (packed, s.size)
+        return fields
 
     def getSummary(self, relpath=None):
         if self.valid:
@@ -210,6 +259,7 @@ class CoreConfiguration:
 
         try:
             self.defaultData = loadJson(jsonFile)
+            self.defaultSource = jsonFile
         except CoreError as e:
             self.reason = str(e)
             CoreConsole.fail("CoreConfiguration::openDefaultJSON: " + self.reason)
@@ -221,16 +271,35 @@ class CoreConfiguration:
                 self.signatureBuffer = []
                 self.orderedFields = []
 
+                fields = self.data['fields']
+
+                # Field order, defaults and signature only change with the JSON files and the namespace
+                files = [self.source] if self.defaultSource is None else [self.source, self.defaultSource]
+                (cached, stamp) = CoreJsonCache.lookup("CoreConfiguration:" + self.source, files, self.namespace)
+                if cached is not None:
+                    for (index, default) in zip(cached["order"], cached["defaults"]):
+                        field = fields[index]
+                        field['default'] = default
+                        if not 'notes' in field:
+                            field['notes'] = None
+                        self.orderedFields.append(field)
+
+                    self.signatureBuffer = cached["signatureBuffer"]
+                    self.signature = cached["signature"]
+                    self.__compile()
+                    return True
+
                 namespace = self.namespace
                 for ns in namespace.split('::'):
                     self.signatureBuffer.append(ns)
 
                 self.signatureBuffer.append(self.data['name'])
 
-                fields = self.data['fields']
+                order = []
                 for fieldType in self.FIELD_TYPE_ORDER:
-                    for field in fields:
+                    for (index, field) in enumerate(fields):
                         if fieldType == field['type']:
+                            order.append(index)
                             self.orderedFields.append(field)
                             self.signatureBuffer.append(field['name'])
                             self.signatureBuffer.append(field['type'])
@@ -249,6 +318,14 @@ class CoreConfiguration:
                                         raise CoreError("Default value specified for field '" + field['name'] + "' is not compatible with CoreType<" + field['type'] + ", " + str(field['size']) + ">")
 
                 self.__updateSignature()
+                self.__compile()
+
+                CoreJsonCache.store("CoreConfiguration:" + self.source, files, stamp, {
+                    "order": order,
+                    "defaults": [field['default'] for field in self.orderedFields],
+                    "signatureBuffer": self.signatureBuffer,
+                    "signature": self.signature
+                })
                 return True
             else:
                 return False
@@ -258,5 +335,50 @@ class CoreConfiguration:
             CoreConsole.fail("CoreConfiguration::preProcess: " + self.reason)
             return False
 
+    def __compile(self):
+        # Built once, pack() then only converts the values
+        self.plan = []
+        formatString = ''
+
+        for field in self.orderedFields:
+            itemStruct = None
+
+            if field['type'] == 'CHAR' and field['size'] > 1:
+                formatString = formatString + '%ds' % field['size']
+            elif field['size'] > 1:
+                formatString = formatString + '%d%s' % (field['size'], TYPE_FORMAT_MAP[field['type']])  # Same layout as 'fff...'
+                itemStruct = struct.Struct('<' + TYPE_FORMAT_MAP[field['type']])
+            else:
+                formatString = formatString + TYPE_FORMAT_MAP[field['type']]
+
+            self.plan.append((field['name'], field['type'], field['size'], field['default'], itemStruct))
+
+        self.struct = struct.Struct('<L' + formatString)
+        self.namedStruct = struct.Struct('<16sL' + formatString)
+
+    def __whyNotPacked(self, values):
+        # Finds the value that made pack_into() fail: the first one that cannot be packed on its own
+        i = 0
+
+        for (fieldName, fieldType, fieldSize, default, itemStruct) in self.plan:
+            if itemStruct is not None:
+                for index in range(fieldSize):
+                    try:
+                        itemStruct.pack(values[i + index])
+                    except (struct.error, OverflowError) as e:
+                        return "Value specified for field '" + fieldName + "[" + str(index) + "]' is not compatible with type '" + fieldType + "': " + str(e)
+
+                i += fieldSize
+            else:
+                if not (fieldType == 'CHAR' and fieldSize > 1):
+                    try:
+                        struct.pack('<' + TYPE_FORMAT_MAP[fieldType], values[i])
+                    except (struct.error, OverflowError) as e:
+                        return "Value specified for field '" + fieldName + "' is not compatible with type '" + fieldType + "': " + str(e)
+
+                i += 1
+
+        return None
+
     def __updateSignature(self):
         self.signature = (zlib.crc32(bytearray(':'.join(self.signatureBuffer), 'ascii')) & 0xffffffff)
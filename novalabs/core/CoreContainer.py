@@ -7,11 +7,21 @@ from .CorePackage import *
 from .CoreModule import *
 
 class CoreContainer:
+    # Packages and modules are opened on first access, by name. Listing them opens them all
+
     def __init__(self):
-        self.invalidModules = []
-        self.validModules = []
-        self.invalidPackages = []
-        self.validPackages = []
+        self._packages = dict()  # {name: CorePackage}
+        self._modules = dict()  # {name: CoreModule}
+
+        self._invalidModules = None  # Filled by openModules()
+        self._validModules = None
+        self._invalidPackages = None  # Filled by openPackages()
+        self._validPackages = None
+
+    def scan(self):
+        """Opens all the packages and modules"""
+        self.openPackages()
+        self.openModules()
 
 # --- PACKAGES ----------------------------------------------------------------
     def listPackages(self):
@@ -30,26 +40,64 @@ class CoreContainer:
 
         return tmp
 
+    def openPackage(self, root):
+        (dummy, name) = os.path.split(root)
+
+        if name not in self._packages:
+            p = CorePackage()
+            p.open(root)
+            self._packages[name] = p
+
+        return self._packages[name]
+
     def openPackages(self):
         list = self.listPackages()
 
-        self.validPackages = []
-        self.invalidPackages = []
+        self._validPackages = []
+        self._invalidPackages = []
 
         for x in list:
-            p = CorePackage()
-            if p.open(x):
-                self.validPackages.append(p)
+            p = self.openPackage(x)
+            if p.valid:
+                self._validPackages.append(p)
             else:
-                self.invalidPackages.append(p)
+                self._invalidPackages.append(p)
+
+        return self._validPackages
+
+    @property
+    def validPackages(self):
+        if self._validPackages is None:
+            if not self.valid:
+                return []
+            self.openPackages()
+
+        return self._validPackages
 
-        return self.validPackages
+    @property
+    def invalidPackages(self):
+        if self._invalidPackages is None:
+            if not self.valid:
+                return []
+            self.openPackages()
+
+        return self._invalidPackages
 
     def getPackageByName(self, name):
         if name is None:
             raise CoreError("CoreContainer::getPackageByName() name is None")
 
-        for x in self.validPackages:
+        if self._validPackages is None:
+            if not self.valid or not CorePackage.check(self.getPackagesRoot(), name):
+                return None
+
+            p = self.openPackage(os.path.join(self.getPackagesRoot(), name))
+            if p.valid and p.name == name:
+                return p
+
+            return None
+
+        for x in self._validPackages:
             if x.name == name:
                 return x
 
@@ -72,26 +120,64 @@ class CoreContainer:
 
         return tmp
 
+    def openModule(self, root):
+        (dummy, name) = os.path.split(root)
+
+        if name not in self._modules:
+            m = CoreModule()
+            m.open(root)
+            self._modules[name] = m
+
+        return self._modules[name]
+
     def openModules(self):
         list = self.listModules()
 
-        self.validModules = []
-        self.invalidModules = []
+        self._validModules = []
+        self._invalidModules = []
 
         for x in list:
-            m = CoreModule()
-            if m.open(x):
-                self.validModules.append(m)
+            m = self.openModule(x)
+            if m.valid:
+                self._validModules.append(m)
             else:
-                self.invalidModules.append(m)
+                self._invalidModules.append(m)
+
+        return self._validModules
 
-        return self.validModules
+    @property
+    def validModules(self):
+        if self._validModules is None:
+            if not self.valid:
+                return []
+            self.openModules()
+
+        return self._validModules
+
+    @property
+    def invalidModules(self):
+        if self._invalidModules is None:
+            if not self.valid:
+                return []
+            self.openModules()
+
+        return self._invalidModules
 
     def getModuleByName(self, name):
         if name is None:
             raise CoreError("CoreContainer::getModule() name is None")
 
-        for x in self.validModules:
+        if self._validModules is None:
+            if not self.valid or not CoreModule.check(self.getModulesRoot(), name):
+                return None
+
+            m = self.openModule(os.path.join(self.getModulesRoot(), name))
+            if m.valid and m.name == name:
+                return m
+
+            return None
+
+        for x in self._validModules:
             if x.name == name:
                 return x
 
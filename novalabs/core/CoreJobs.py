@@ -0,0 +1,75 @@
+# COPYRIGHT (c) 2016-2018 Nova Labs SRL
+#
+# All rights reserved. All use of this software and documentation is
+# subject to the License Agreement located in the file LICENSE.
+
+import io
+import concurrent.futures
+
+from .CoreConsole import *
+from .CoreUtils import outputStatistics
+
+
+def _run(console, function, args):
+    # Runs a job, capturing what it prints so that it can be replayed in order
+    previous = (CoreConsole.enabled, CoreConsole.debug, CoreConsole.verbose, CoreConsole.f)
+
+    CoreConsole.enabled, CoreConsole.debug, CoreConsole.verbose = console
+    CoreConsole.f = io.StringIO()
+
+    statistics = dict(outputStatistics)
+
+    try:
+        result = function(*args)
+        error = None
+    except Exception as e:
+        result = None
+        error = e
+
+    output = CoreConsole.f.getvalue()
+    CoreConsole.enabled, CoreConsole.debug, CoreConsole.verbose, CoreConsole.f = previous
+
+    statistics = dict([(x, outputStatistics[x] - statistics[x]) for x in statistics])
+
+    return result, output, error, statistics
+
+
+class CoreJobs:
+    def __init__(self, jobs=1):
+        self.jobs = max(jobs, 1)
+
+        if self.jobs > 1:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs)
+        else:
+            self.executor = None
+
+    def submit(self, function, *args):
+        """Schedules function(*args). With a single job it runs, in this process, when its result is requested"""
+
+        console = (CoreConsole.enabled, CoreConsole.debug, CoreConsole.verbose)
+
+        if self.executor is None:
+            return (console, function, args)
+        else:
+            return self.executor.submit(_run, console, function, args)
+
+    def result(self, job):
+        """Returns (result, output, error) of a job: the console output is not printed, the exception not raised"""
+
+        if self.executor is None:
+            (result, output, error, statistics) = _run(*job)
+        else:
+            try:
+                (result, output, error, statistics) = job.result()
+            except Exception as e:  # The worker died, or the result could not be pickled
+                return None, "", e
+
+            for x in statistics:  # Files written by the worker count as written by this process
+                outputStatistics[x] += statistics[x]
+
+        return result, output, error
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
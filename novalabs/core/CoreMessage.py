@@ -157,9 +157,25 @@ class CoreMessage:
                 self.orderedFields = []
 
                 fields = self.data['fields']
+
+                # Field order and signature only change with the JSON file
+                (cached, stamp) = CoreJsonCache.lookup("CoreMessage:" + self.source, [self.source], None)
+                if cached is not None:
+                    for index in cached["order"]:
+                        field = fields[index]
+                        if not 'notes' in field:
+                            field['notes'] = None
+                        self.orderedFields.append(field)
+
+                    self.signatureBuffer = cached["signatureBuffer"]
+                    self.signature = cached["signature"]
+                    return True
+
+                order = []
                 for fieldType in self.FIELD_TYPE_ORDER:
-                    for field in fields:
+                    for (index, field) in enumerate(fields):
                         if fieldType == field['type']:
+                            order.append(index)
                             self.orderedFields.append(field)
                             self.signatureBuffer.append(field['name'])
                             self.signatureBuffer.append(field['type'])
@@ -169,6 +185,12 @@ class CoreMessage:
                                 field['notes'] = None
 
                 self.__updateSignature()
+
+                CoreJsonCache.store("CoreMessage:" + self.source, [self.source], stamp, {
+                    "order": order,
+                    "signatureBuffer": self.signatureBuffer,
+                    "signature": self.signature
+                })
                 return True
             else:
                 return False
@@ -172,38 +172,24 @@ class CoreModule:
             os.makedirs(self.destination    )
 
         self.includes = listFiles(srcIncludes)
-        if len(self.includes) > 0:
-            if not os.path.isdir(dstIncludes):
-                os.makedirs(dstIncludes)
-            for file in self.includes:
-                copyOrLink(os.path.join(srcIncludes, file), os.path.join(dstIncludes, file), link=self.link)
+        syncFiles(srcIncludes, dstIncludes, self.includes, link=self.link)
 
         srcSources = os.path.join(self.moduleRoot, "src")
         dstSources = os.path.join(self.destination, "src")
 
         self.sources = listFiles(srcSources)
-        if len(self.sources) > 0:
-            if not os.path.isdir(dstSources):
-                os.makedirs(dstSources)
-            for file in self.sources:
-                copyOrLink(os.path.join(srcSources, file), os.path.join(dstSources, file), link=self.link)
+        syncFiles(srcSources, dstSources, self.sources, link=self.link)
 
         srcMisc = os.path.join(self.moduleRoot, "misc")
         dstMisc = os.path.join(self.destination, "misc")
 
         misc = listFiles(srcMisc)
-        if len(misc) > 0:
-            if not os.path.isdir(dstMisc):
-                os.makedirs(dstMisc)
-            for file in misc:
-                copyOrLink(os.path.join(srcMisc, file), os.path.join(dstMisc, file), link=self.link)
+        syncFiles(srcMisc, dstMisc, misc, link=self.link)
 
         self.__processCMake()
 
         self.cmake = os.path.join(self.destination, self.name + "Config.cmake")
-        sink = open(self.cmake, 'w')
-
-        sink.write("\n".join(self.buffer))
+        writeIfChanged(self.cmake, "\n".join(self.buffer))
 
     def __processCMake(self):
         self.buffer = []
@@ -8,6 +8,14 @@ import sys
 import os
 import numbers
 import ctypes
+import tempfile
+import stat
+import filecmp
+import concurrent.futures
+import threading
+import atexit
+import hashlib
+import json
 from json import loads
 import jsonschema
 from jsonschema import validate
@@ -107,10 +115,158 @@ def loadJson(filename):
         raise CoreError("I/0 Error: " + str(e.strerror), e.filename)
 
 
+class CoreJsonCache:
+    """Validated JSON files, and values derived from them. Entries are invalidated by size, mtime or schema changes"""
+
+    # Bump when the layout of the cache file changes, old caches are discarded
+    VERSION = 2
+
+    FILENAME = "json_cache.json"
+
+    filename = None  # Persisted there, once opened
+    pid = None
+    entries = dict()  # {name: {"files": [filename, ...], "stamp": [...], "data": JSON text}}
+    dirty = False
+
+    _digests = dict()  # {id(schema): (schema, digest)}
+
+    @staticmethod
+    def open(buildPath):
+        filename = os.path.join(buildPath, CoreJsonCache.FILENAME)
+
+        if CoreJsonCache.filename == filename:
+            return
+
+        try:
+            with open(filename, 'r') as src:
+                data = json.load(src)
+
+            if data["version"] == CoreJsonCache.VERSION:
+                for x in data["entries"]:
+                    CoreJsonCache.entries.setdefault(x, data["entries"][x])
+        except IOError:
+            pass
+        except Exception as e:  # Whatever is wrong with it, it will be rebuilt
+            CoreConsole.info("CoreJsonCache::open: discarding " + CoreConsole.highlightFilename(filename) + ": " + repr(e))
+
+        if CoreJsonCache.filename is None:
+            atexit.register(CoreJsonCache.save)
+
+        CoreJsonCache.filename = filename
+        CoreJsonCache.pid = os.getpid()
+
+    @staticmethod
+    def save():
+        # Worker processes share the entries of their parent, only the parent writes them
+        if CoreJsonCache.filename is None or CoreJsonCache.pid != os.getpid():
+            return
+
+        CoreJsonCache.prune()
+
+        if not CoreJsonCache.dirty:
+            return
+
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(CoreJsonCache.filename))
+            with os.fdopen(fd, 'w') as sink:
+                json.dump({"version": CoreJsonCache.VERSION, "entries": CoreJsonCache.entries}, sink, separators=(',', ':'))
+            os.replace(tmp, CoreJsonCache.filename)
+
+            CoreJsonCache.dirty = False
+        except OSError as e:
+            CoreConsole.fail("CoreJsonCache::save: " + str(CoreError(str(e.strerror), e.filename)))
+
+    @staticmethod
+    def prune():
+        # Drops the entries of files that do not exist anymore
+        for name in list(CoreJsonCache.entries):
+            for filename in CoreJsonCache.entries[name]["files"]:
+                if not os.path.isfile(filename):
+                    del CoreJsonCache.entries[name]
+                    CoreJsonCache.dirty = True
+                    break
+
+    @staticmethod
+    def digest(schema):
+        if id(schema) not in CoreJsonCache._digests:
+            CoreJsonCache._digests[id(schema)] = (schema, hashlib.sha1(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest())
+
+        return CoreJsonCache._digests[id(schema)][1]
+
+    @staticmethod
+    def stamp(filenames, key):
+        """Returns the stamp of filenames (size and mtime of each one) and key, None if a file is missing"""
+
+        stamp = [key]
+        for filename in filenames:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                return None
+            stamp.append([st.st_size, st.st_mtime_ns])
+
+        return stamp
+
+    @staticmethod
+    def lookup(name, filenames, key):
+        """Returns (data, stamp): data is None if not cached, stamp is what store() needs to cache it"""
+
+        stamp = CoreJsonCache.stamp(filenames, key)
+
+        entry = CoreJsonCache.entries.get(name)
+        if stamp is not None and entry is not None and entry["stamp"] == stamp:
+            return loads(entry["data"]), stamp  # A copy, callers modify it
+
+        return None, stamp
+
+    @staticmethod
+    def store(name, filenames, stamp, data):
+        if stamp is not None:
+            CoreJsonCache.entries[name] = {"files": list(filenames), "stamp": stamp, "data": json.dumps(data, separators=(',', ':'))}
+            CoreJsonCache.dirty = True
+
+    @staticmethod
+    def get(filename, schema):
+        return CoreJsonCache.lookup(filename, [filename], CoreJsonCache.digest(schema))
+
+    @staticmethod
+    def put(filename, stamp, data):
+        CoreJsonCache.store(filename, [filename], stamp, data)
+
+
+# One validator per schema, compiled (and the schema checked) on first use
+_validators = dict()  # {id(schema): (schema, validator)}
+
+
+def getValidator(schema):
+    entry = _validators.get(id(schema))
+
+    if entry is None:
+        cls = jsonschema.validators.validator_for(schema)
+        cls.check_schema(schema)
+        entry = (schema, cls(schema))
+        _validators[id(schema)] = entry
+
+    return entry[1]
+
+
+def validateJson(data, schema):
+    """Same as jsonschema.validate(data, schema), without building a validator every time"""
+
+    error = jsonschema.exceptions.best_match(getValidator(schema).iter_errors(data))
+    if error is not None:
+        raise error
+
+
 def loadAndValidateJson(filename, schema):
+    (data, stamp) = CoreJsonCache.get(filename, schema)
+    if data is not None:
+        return data
+
     try:
         data = loads(open(filename, 'r').read())
-        validate(data, schema)
+        validateJson(data, schema)
+        CoreJsonCache.put(filename, stamp, data)
         return data
     except jsonschema.exceptions.ValidationError as e:
         raise CoreError("File invalid according to schema [%s]" % e.message, filename)
@@ -145,26 +301,181 @@ def findFileGoingUp(filename, cwd=None):
         return root
 
 
-def copyOrLink(src, dst, rm=True, link=False):
+# Files written (or removed) by writeIfChanged() and syncFiles(), and files left untouched as they were up to date
+outputStatistics = {"updated": 0, "unchanged": 0}
+_outputStatisticsLock = threading.Lock()  # writeIfChanged() may be called from worker threads
+
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows
+    fcntl = None
+
+_FICLONE = 0x40049409  # Linux ioctl, shares the extents of a file (reflink) on btrfs, xfs, ...
+
+# Written in each directory populated by syncFiles(), the files it has copied there
+SYNC_MANIFEST = ".synced"
+
+
+def isSynced(src, dst, checksum=False):
+    """True if dst is a regular file with the same content of src: same file, or same size and mtime (or content, if checksum)"""
+
+    try:
+        s = os.stat(src)
+        d = os.lstat(dst)
+    except OSError:
+        return False
+
+    if not stat.S_ISREG(d.st_mode):
+        return False
+    if (s.st_dev, s.st_ino) == (d.st_dev, d.st_ino):  # Hard link
+        return True
+    if s.st_size != d.st_size:
+        return False
+    if s.st_mtime_ns == d.st_mtime_ns:
+        return True
+
+    return checksum and filecmp.cmp(src, dst, shallow=False)
+
+
+def cloneOrCopy(src, dst, hardlink=False):
+    # On the same filesystem a reflink costs no data writes. A hard link neither, but dst then shares its inode with src:
+    # editing one edits the other, so it is only done if asked for. The destination is replaced atomically
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst) or ".", prefix="." + os.path.basename(dst) + ".")
+    os.close(fd)
+
+    try:
+        if fcntl is not None:
+            try:
+                with open(src, 'rb') as s, open(tmp, 'wb') as d:
+                    fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+                shutil.copystat(src, tmp)
+                os.replace(tmp, dst)
+                return
+            except OSError:
+                pass
+
+        if hardlink:
+            try:
+                os.unlink(tmp)
+                os.link(src, tmp)
+                os.replace(tmp, dst)
+                return
+            except OSError:
+                pass
+
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def copyOrLink(src, dst, rm=True, link=False, checksum=False, hardlink=False):
+    """Copies (or symlinks, or hard links) src to dst, unless dst is already up to date. Returns True if dst has been written"""
+
     env_link = os.environ.get("NOVA_CORE_LINKS_NOT_COPIES")
 
     if env_link is not None:  # Ok, it is defined. It overrides the parameter
         link = True
 
+    env_hardlink = os.environ.get("NOVA_CORE_HARDLINKS_NOT_COPIES")
+
+    if env_hardlink is not None:  # As above
+        hardlink = True
+
     if link:
         if os.path.islink(dst):
             if os.path.realpath(src) == os.path.realpath(dst):
-                return
+                return False
         if rm:
-            if os.path.exists(dst):
+            if os.path.lexists(dst):
                 os.unlink(dst)
 
         os.symlink(src, dst)
     else:
+        if isSynced(src, dst, checksum):
+            return False
+
         if rm:
-            if os.path.exists(dst):
+            if os.path.islink(dst):  # Left by a linking run
                 os.unlink(dst)
-        shutil.copy2(src, dst)
+        cloneOrCopy(src, dst, hardlink)
+
+    return True
+
+
+def syncFiles(srcPath, dstPath, files, link=False, hardlink=False):
+    """Mirrors files from srcPath into dstPath. Up to date files are skipped, the ones synced by a previous run but not in files are removed"""
+
+    checksum = os.environ.get("NOVA_CORE_SYNC_CHECKSUM") is not None  # Compare the content, when only the mtime differs
+
+    manifest = os.path.join(dstPath, SYNC_MANIFEST)
+    try:
+        with open(manifest, 'r') as src:
+            previous = set(src.read().split("\n")) - {""}
+    except IOError:
+        previous = set()
+
+    if len(files) > 0:
+        os.makedirs(dstPath, exist_ok=True)
+
+    if len(files) > 1:
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            written = list(executor.map(lambda x: copyOrLink(os.path.join(srcPath, x), os.path.join(dstPath, x), link=link, checksum=checksum, hardlink=hardlink), files))
+    else:
+        written = [copyOrLink(os.path.join(srcPath, x), os.path.join(dstPath, x), link=link, checksum=checksum, hardlink=hardlink) for x in files]
+
+    stale = sorted(previous - set(files))
+    for x in stale:
+        if os.path.lexists(os.path.join(dstPath, x)):
+            os.unlink(os.path.join(dstPath, x))
+
+    if set(files) != previous:
+        if len(files) > 0:
+            with open(manifest, 'w') as sink:
+                sink.write("\n".join(sorted(files)) + "\n")
+        elif os.path.isfile(manifest):
+            os.unlink(manifest)
+
+    outputStatistics["updated"] += written.count(True) + len(stale)
+    outputStatistics["unchanged"] += written.count(False)
+
+
+def writeIfChanged(filename, data):
+    """Writes data (str or bytes) to filename, unless the file already has that content. Returns True if the file has been written"""
+
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    try:
+        if os.path.getsize(filename) == len(data):
+            with open(filename, 'rb') as src:
+                if src.read() == data:
+                    with _outputStatisticsLock:
+                        outputStatistics["unchanged"] += 1
+                    return False
+    except OSError:
+        pass  # Does not exist yet
+
+    # Readers (and make) never see a partially written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix="." + os.path.basename(filename) + ".")
+    try:
+        with os.fdopen(fd, 'wb') as sink:
+            sink.write(data)
+        os.chmod(tmp, 0o666 & ~_umask)
+        os.replace(tmp, filename)
+    except:
+        os.unlink(tmp)
+        raise
+
+    with _outputStatisticsLock:
+        outputStatistics["updated"] += 1
+    return True
 
 
 def mkdir(tmp):
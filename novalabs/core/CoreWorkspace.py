@@ -124,12 +124,15 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         CoreContainer.__init__(self)
         CoreWorkspaceBase.__init__(self)
 
-        self._validModuleTargets = []
-        self._invalidModuleTargets = []
-        self._validParameters = []
-        self._invalidParameters = []
-        self._validParametersTargets = []
-        self._invalidParametersTargets = []
+        self._moduleTargets = dict()  # {name: ModuleTarget}, opened on first access
+        self._parameters = dict()  # {name: Parameters}, opened on first access
+
+        self._validModuleTargets = None  # Filled by openModuleTargets()
+        self._invalidModuleTargets = None
+        self._validParameters = None  # Filled by openParameters()
+        self._invalidParameters = None
+        self._validParametersTargets = None  # Filled by openParametersTargets()
+        self._invalidParametersTargets = None
 
         self.root = None
         self.sources = None
@@ -153,7 +156,7 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
 
         return True
 
-    def open(self, root=None):
+    def open(self, root=None, lazy=True):
         self.valid = False
 
         try:
@@ -165,14 +168,13 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
             if self.root is None:
                 return False
 
+            CoreJsonCache.open(self.getBuildPath())
+
             jsonFile = os.path.join(self.root, "WORKSPACE.json")
 
             if self.openJSON(jsonFile):
-                self.openPackages()
-                self.openModules()
-                self.openModuleTargets()
-                self.openParameters()
-                self.openParametersTargets()
+                if not lazy:
+                    self.scan()
 
             return self.valid
         except CoreError as e:
@@ -183,6 +185,13 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
     def isValid(self):
         return self.valid
 
+    def scan(self):
+        """Opens all the packages, modules, module targets, parameters and parameters targets"""
+        CoreContainer.scan(self)
+        self.openModuleTargets()
+        self.openParameters()
+        self.openParametersTargets()
+
     # --- MODULE TARGET -----------------------------------------------------------
     def listModuleTargets(self):
         path = self.getModuleTargetsRoot()
@@ -200,6 +209,16 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
 
         return tmp
 
+    def openModuleTarget(self, root):
+        (dummy, name) = os.path.split(root)
+
+        if name not in self._moduleTargets:
+            m = ModuleTarget()
+            m.open(root)
+            self._moduleTargets[name] = m
+
+        return self._moduleTargets[name]
+
     def openModuleTargets(self):
         list = self.listModuleTargets()
 
@@ -207,8 +226,8 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         self._invalidModuleTargets = []
 
         for x in list:
-            m = ModuleTarget()
-            if m.open(x):
+            m = self.openModuleTarget(x)
+            if m.valid:
                 self._validModuleTargets.append(m)
             else:
                 self._invalidModuleTargets.append(m)
@@ -219,6 +238,16 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         if name is None:
             raise CoreError("CoreContainer::getModule() name is None")
 
+        if self._validModuleTargets is None:
+            if not self.valid or not ModuleTarget.check(self.getModuleTargetsRoot(), name):
+                return None
+
+            m = self.openModuleTarget(os.path.join(self.getModuleTargetsRoot(), name))
+            if m.valid and m.name == name:
+                return m
+
+            return None
+
         for x in self._validModuleTargets:
             if x.name == name:
                 return x
@@ -226,9 +255,19 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         return None
 
     def validModuleTargets(self):
+        if self._validModuleTargets is None:
+            if not self.valid:
+                return []
+            self.openModuleTargets()
+
         return self._validModuleTargets
 
     def invalidModuleTargets(self):
+        if self._invalidModuleTargets is None:
+            if not self.valid:
+                return []
+            self.openModuleTargets()
+
         return self._invalidModuleTargets
 
     # --- PARAMETERS --------------------------------------------------------------
@@ -248,6 +287,16 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
 
         return tmp
 
+    def openParameter(self, root):
+        (dummy, name) = os.path.split(root)
+
+        if name not in self._parameters:
+            m = Parameters()
+            m.open(root)
+            self._parameters[name] = m
+
+        return self._parameters[name]
+
     def openParameters(self):
         list = self.listParameters()
 
@@ -255,8 +304,8 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         self._invalidParameters = []
 
         for x in list:
-            m = Parameters()
-            if m.open(x):
+            m = self.openParameter(x)
+            if m.valid:
                 self._validParameters.append(m)
             else:
                 self._invalidParameters.append(m)
@@ -267,6 +316,16 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         if name is None:
             raise CoreError("CoreContainer::getModule() name is None")
 
+        if self._validParameters is None:
+            if not self.valid or not Parameters.check(self.getParametersRoot(), name):
+                return None
+
+            m = self.openParameter(os.path.join(self.getParametersRoot(), name))
+            if m.valid and m.name == name:
+                return m
+
+            return None
+
         for x in self._validParameters:
             if x.name == name:
                 return x
@@ -274,9 +333,19 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         return None
 
     def validParameters(self):
+        if self._validParameters is None:
+            if not self.valid:
+                return []
+            self.openParameters()
+
         return self._validParameters
 
     def invalidParameters(self):
+        if self._invalidParameters is None:
+            if not self.valid:
+                return []
+            self.openParameters()
+
         return self._invalidParameters
 
     def listParametersTargets(self):
@@ -313,9 +382,19 @@ class CoreWorkspace(CoreContainer, CoreWorkspaceBase):
         return self._validParametersTargets
 
     def validParameterTargets(self):
+        if self._validParametersTargets is None:
+            if not self.valid:
+                return []
+            self.openParametersTargets()
+
         return self._validParametersTargets
 
     def invalidParameterTargets(self):
+        if self._invalidParametersTargets is None:
+            if not self.valid:
+                return []
+            self.openParametersTargets()
+
         return self._invalidParametersTargets
 
 
@@ -333,6 +412,8 @@ class Workspace(CoreWorkspaceBase):
         self.core = Core()
         self.coreWorkspace = CoreWorkspace()
 
+        self.configurations = dict()  # {(package, name): CoreConfiguration}
+
         self.packagesCoreDependencies = []
         self.packagesWorkspaceDependencies = []
         self.packagesNoneDependencies = []
@@ -340,14 +421,22 @@ class Workspace(CoreWorkspaceBase):
         self.modulesCoreDependencies = []
         self.modulesNoneDependencies = []
 
-    def open(self, coreRoot=None, workspaceRoot=None):
+    def open(self, coreRoot=None, workspaceRoot=None, lazy=True):
         self.__init__()
 
-        if not self.core.open(coreRoot):
+        try:
+            if self.getRoot(workspaceRoot) is not None:
+                CoreJsonCache.open(self.getBuildPath())  # Before the Core, its files are cached too
+        except CoreError as e:
+            self.reason = str(e)
+            CoreConsole.fail("Workspace::open: " + self.reason)
+            return False
+
+        if not self.core.open(coreRoot, lazy):
             self.reason = self.core.reason
             return False
         else:
-            if not self.coreWorkspace.open(self.getRoot(workspaceRoot)):
+            if not self.coreWorkspace.open(self.getRoot(workspaceRoot), lazy):
                 self.reason = self.coreWorkspace.reason
                 return False
 
@@ -383,21 +472,21 @@ class Workspace(CoreWorkspaceBase):
         return self.coreWorkspace.invalidParameterTargets()
 
     def getParameters(self, name) -> Parameters:
-        for x in self.validParameters():
-            if x.name == name:
-                return x
-        return None
+        return self.coreWorkspace.getParameterByName(name)
 
     def getCoreConfiguration(self, package, name):
-        p = self.getCorePackage(package)
+        if (package, name) not in self.configurations:  # Opened once, they are not modified by pack()
+            p = self.getCorePackage(package)
 
-        tmp = None
+            tmp = None
 
-        if p is not None:
-            tmp = CoreConfiguration()
-            tmp.open(name, p)
+            if p is not None:
+                tmp = CoreConfiguration()
+                tmp.open(name, p)
 
-        return tmp
+            self.configurations[(package, name)] = tmp
+
+        return self.configurations[(package, name)]
 
     def getCoreMessage(self, package, name):
         p = self.getCorePackage(package)
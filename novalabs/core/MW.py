@@ -1,12 +1,18 @@
-import io
+import collections
+import os
 import queue
 import random
 import re
+import select
+import selectors
 import socket
+import stat
 import string
 import struct
 import time
 
+from multiprocessing import shared_memory, resource_tracker
+
 import serial
 
 import sys, traceback
@@ -399,6 +405,100 @@ class EventQueue(object):
         return item
 
 
+# ==============================================================================
+
+class PriorityEventQueue(object):
+    STRICT = 'strict'
+    WEIGHTED = 'weighted'
+
+    def __init__(self, classes, classify, policy=STRICT, weights=None):
+        """An EventQueue with a FIFO per class, classify(item) telling the class index of an item. The strict policy
+        serves a class only when the previous ones are empty, the weighted one serves the non empty classes in
+        proportion to their weights (smooth weighted round robin), so that none of them starves"""
+
+        assert policy in (self.STRICT, self.WEIGHTED)
+        self.classes = list(classes)
+        self.policy = policy
+        self.weights = list(weights) if weights is not None else [1] * len(self.classes)
+        assert len(self.weights) == len(self.classes)
+
+        self._classify = classify
+        self._queues = [collections.deque() for x in self.classes]
+        self._credits = [0] * len(self.classes)
+        self._cond = threading.Condition()
+
+        # Per class statistics
+        self.max_depth = [0] * len(self.classes)
+        self.served = [0] * len(self.classes)
+        self.total_wait = [0.0] * len(self.classes)
+        self.max_wait = [0.0] * len(self.classes)
+
+    def signal(self, item=None):
+        index = self._classify(item)
+        with self._cond:
+            self._queues[index].append((item, time.perf_counter()))
+            self.max_depth[index] = max(self.max_depth[index], len(self._queues[index]))
+            self._cond.notify()
+
+    def wait(self, timeout=Time_INFINITE):
+        with self._cond:
+            if timeout == Time_IMMEDIATE:
+                ready = self._ready()
+            elif timeout == Time_INFINITE:
+                ready = self._cond.wait_for(self._ready)
+            else:
+                ready = self._cond.wait_for(self._ready, timeout.to_s())
+
+            if not ready:
+                raise queue.Empty()
+
+            index = self._pick()
+            item, enqueued = self._queues[index].popleft()
+
+            wait = time.perf_counter() - enqueued
+            self.served[index] += 1
+            self.total_wait[index] += wait
+            self.max_wait[index] = max(self.max_wait[index], wait)
+
+            return item
+
+    def get_depth(self, index):
+        with self._cond:
+            return len(self._queues[index])
+
+    def get_summary(self):
+        """Returns [class, depth, max depth, served, mean wait [ms], max wait [ms]] for each class"""
+
+        with self._cond:
+            return [[name, len(self._queues[i]), self.max_depth[i], self.served[i],
+                     1000.0 * self.total_wait[i] / max(self.served[i], 1), 1000.0 * self.max_wait[i]]
+                    for i, name in enumerate(self.classes)]
+
+    def _ready(self):
+        for q in self._queues:
+            if len(q) > 0:
+                return True
+        return False
+
+    def _pick(self):
+        if self.policy == self.STRICT:
+            for index, q in enumerate(self._queues):
+                if len(q) > 0:
+                    return index
+
+        total = 0
+        best = None
+        for index, q in enumerate(self._queues):
+            if len(q) > 0:
+                self._credits[index] += self.weights[index]
+                total += self.weights[index]
+                if best is None or self._credits[index] > self._credits[best]:
+                    best = index
+
+        self._credits[best] -= total
+        return best
+
+
 # ==============================================================================
 
 class IhexRecord(Serializable):
@@ -491,11 +591,11 @@ class IhexRecord(Serializable):
         explen = 1 + 2 * (1 + 2 + 1 + self.count + 1)
         if len(entry) < explen:
             raise ValueError("len(%s) < %d" % (repr(entry), explen))
-        self.offset = int(entry[3:7], 16)
-        self.type = int(entry[7:9], 16)
-        entry = entry[9:]
-        self.data = str(bytearray([int(entry[i: (i + 2)], 16) for i in range(0, 2 * self.count, 2)]))
-        self.checksum = int(entry[(2 * self.count): (2 * self.count + 2)], 16)
+        raw = bytes.fromhex(entry[1:explen])
+        self.offset = (raw[1] << 8) | raw[2]
+        self.type = raw[3]
+        self.data = raw[4:4 + self.count]
+        self.checksum = raw[4 + self.count]
         self.check_valid()
         return self
 
@@ -1598,6 +1698,9 @@ class Transport(object):
     def close(self):
         raise NotImplementedError()
 
+    def wakeup(self):
+        pass  # Makes blocked readers check ok(), if supported
+
     def fill_raw_params(self, topic):
         return ''.ljust(MgmtMsg.PubSub.MAX_RAW_PARAMS_LENGTH, '\xAA')
 
@@ -1751,6 +1854,10 @@ class Middleware(object):
                 return
             self.stopped = True
 
+        with self._transports_lock:
+            for transport in self.transports:
+                transport.wakeup()
+
         running = True
         while running:
             running = False
@@ -1973,59 +2080,264 @@ class LineIO(object):
     def writeline(self, line):
         raise NotImplementedError()
 
+    def writelines(self, lines):
+        for line in lines:  # One write per line, unless overridden
+            self.writeline(line)
+
+    def readlines_nowait(self):
+        raise NotImplementedError()  # Needed to be served by a BusSelector, like fileno()
+        # return [line, ...]
+
+    def fileno(self):
+        raise NotImplementedError()
+
+    def wakeup(self):
+        pass  # Makes a blocked readline() check ok(), if supported
+
+    def set_write_timeout(self, timeout):
+        pass  # Bounds how long a write blocks, if supported
+
+
+# ==============================================================================
+
+class BufferedLineIO(LineIO):
+    READ_SIZE = 1 << 12  # Bytes read at once, at most
+    POLLED = (os.name == 'nt')  # Windows cannot select() serial ports and pipes: the device is polled instead
+    POLL_PERIOD = 0.002  # [s], between reads of a polled device with no bytes available
+
+    def __init__(self, newline='\r\n'):
+        """Reads lines in bulk from a file descriptor, waiting on it with a selector that wakeup() interrupts.
+        Each wakeup() interrupts a single blocked read (or the next one), all of them once the LineIO is closing"""
+
+        super(BufferedLineIO, self).__init__()
+        self._newline = str(newline)
+        self._eol = self._newline.encode('ascii')
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        # Received bytes: [_start, _end) is the partial line, _lines[_next:] the complete ones not read yet
+        self._buffer = bytearray(4 * self.READ_SIZE)
+        self._start = 0
+        self._end = 0
+        self._lines = []
+        self._next = 0
+
+        self._selector = None
+        self._wakeup = None  # (r, w) pipe, readable once wakeup() has been called, until a reader is interrupted
+        self._woken = False  # The same, when polled
+        self._closing = False
+
+    def fileno(self):
+        raise NotImplementedError()
+
+    def wakeup(self):
+        if self._wakeup is not None:
+            os.write(self._wakeup[1], b'\0')
+        else:
+            self._woken = True
+
+    def readline(self):
+        with self._read_lock:
+            if not ok():
+                raise KeyboardInterrupt('soft interrupt')
+
+            while self._next == len(self._lines):
+                self._fill()
+
+            line = self._lines[self._next]
+            self._next += 1
+        return line
+
+    def readlines_nowait(self):
+        """Returns the complete lines received so far, without blocking"""
+
+        with self._read_lock:
+            lines = self._lines[self._next:]
+            self._lines = []
+            self._next = 0
+
+            self._read()
+
+            lines.extend(self._lines)
+            self._lines = []
+            return lines
+
+    def writeline(self, line):
+        self.writelines([line])
+
+    def writelines(self, lines):
+        data = (self._newline.join(lines) + self._newline).encode('ascii')
+        with self._write_lock:
+            self._write(data)  # A single write() for the whole batch
+
+    def _attach(self, fd):
+        # To be called once the device is open, with the fd to wait on (None if POLLED)
+        self._discard()
+        self._woken = False
+        self._closing = False
+
+        if fd is None:
+            return
+
+        self._wakeup = os.pipe()
+        os.set_blocking(self._wakeup[0], False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(fd, selectors.EVENT_READ)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+    def _detach(self):
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+            os.close(self._wakeup[0])
+            os.close(self._wakeup[1])
+            self._wakeup = None
+
+    def _close_begin(self):
+        # Interrupts the readers, until the LineIO is closed: they hold the read lock close() needs
+        self._closing = True
+        self.wakeup()
+
+    def _interrupt(self):
+        # Consumes the pending wakeup(), unless closing
+        if not self._closing:
+            if self._wakeup is not None:
+                try:
+                    while os.read(self._wakeup[0], 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            self._woken = False
+
+        raise KeyboardInterrupt('soft interrupt')
+
+    def _sleep(self, timeout):
+        # Returns True if wakeup() has been called within timeout, the device must not be registered (e.g. reconnecting)
+        if self._selector is not None:
+            return len(self._selector.select(timeout)) > 0
+
+        deadline = time.time() + timeout
+        while not self._woken and time.time() < deadline:
+            time.sleep(self.POLL_PERIOD)
+        return self._woken
+
+    def _discard(self):
+        # Drops the partial line
+        self._start = self._end = 0
+        self._lines = []
+        self._next = 0
+
+    def _fill(self):
+        # Blocks until some bytes are available, then reads them
+        if self._closing:
+            self._interrupt()
+
+        if self._selector is None:  # POLLED
+            if self._woken:
+                self._interrupt()
+            if self._read() is None:
+                time.sleep(self.POLL_PERIOD)
+            return
+
+        for key, events in self._selector.select():
+            if key.fd == self._wakeup[0]:
+                self._interrupt()
+
+        self._read()
+
+    def _read(self):
+        # Reads the available bytes (up to READ_SIZE) and splits the complete lines at once. Returns as _readinto()
+        if self._start > 0:
+            length = self._end - self._start
+            self._buffer[0:length] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = length
+
+        if len(self._buffer) - self._end < self.READ_SIZE:  # A very long line
+            self._buffer.extend(bytes(len(self._buffer)))
+
+        with memoryview(self._buffer) as view:
+            count = self._readinto(view[self._end:self._end + self.READ_SIZE])
+
+        if count is None:
+            return None
+
+        if count == 0:
+            self._eof()
+            return 0
+
+        # Only the new bytes (and the tail of a newline split between two reads) can end a line
+        last = self._buffer.rfind(self._eol, max(self._start, self._end - len(self._eol) + 1), self._end + count)
+        self._end += count
+
+        if last >= 0:
+            self._lines = self._buffer[self._start:last].decode('ascii').split(self._newline)
+            self._next = 0
+            self._start = last + len(self._eol)
+
+        return count
+
+    def _readinto(self, view):
+        raise NotImplementedError()
+        # return count, 0 at the end of file, None if no bytes are available
+
+    def _write(self, data):
+        raise NotImplementedError()
+
+    def _eof(self):
+        raise NotImplementedError()
+
 
 # ==============================================================================
 
-class SerialLineIO(LineIO):
+class SerialLineIO(BufferedLineIO):
     def __init__(self, dev_path, baud_rate, newline='\r\n'):
-        super(SerialLineIO, self).__init__()
+        super(SerialLineIO, self).__init__(newline)
         self._dev_path = str(dev_path)
         self._baud = int(baud_rate)
+        self._write_timeout = None
         self._ser = None
-        self._ti = None
-        self._to = None
-        self._newline = str(newline)
-        self._read_lock = threading.Lock()
-        self._write_lock = threading.Lock()
 
     def __repr__(self):
         return '%s(dev_path=%s, baud_rate=%d)' % (type(self).__name__, repr(self._dev_path), self._baud)
 
     def open(self):
         if self._ser is None:
-            self._ser = serial.Serial(port=self._dev_path, baudrate=self._baud, timeout=0.001)
-            self._ti = io.TextIOWrapper(buffer=io.BufferedReader(self._ser, 1),
-                                        encoding='ascii', newline=self._newline)
-            self._to = io.TextIOWrapper(buffer=io.BufferedWriter(self._ser, buffer_size=128),
-                                        encoding='ascii', newline=self._newline)
+            self._ser = serial.Serial(port=self._dev_path, baudrate=self._baud, timeout=0, write_timeout=self._write_timeout)
+            self._attach(None if self.POLLED else self._ser.fileno())
+
+    def set_write_timeout(self, timeout):
+        # Then write() raises serial.SerialTimeoutException
+        self._write_timeout = timeout
+        if self._ser is not None:
+            self._ser.write_timeout = timeout
 
     def close(self):
         if self._ser is not None:
-            self._to.flush()
-            self._ser.close()
-            self._ser = None
-        self._ti = None
-        self._to = None
+            self._close_begin()
+            with self._read_lock, self._write_lock:
+                self._ser.close()
+                self._ser = None
+                self._detach()
 
-    def readline(self):
-        line = ''
-        with self._read_lock:
-            while True:
-                if not ok():
-                    raise KeyboardInterrupt('soft interrupt')
-                line += str(self._ti.readline())
-                if line[-2:] == self._newline:
-                    break
-        line = line[:-2]
-        # XXX logging.debug("%s --->>> %s" % (repr(self._dev_path), repr(line)))
-        return line
+    def fileno(self):
+        return self._ser.fileno()
 
-    def writeline(self, line):
-        # XXX logging.debug("%s <<<--- %s" % (repr(self._dev_path), repr(line)))
-        with self._write_lock:
-            self._to.write(line)
-            self._to.write(u'\n')
-            self._to.flush()
+    def _readinto(self, view):
+        if self.POLLED:  # pyserial, which does not block as timeout=0
+            return self._ser.readinto(view) or None
+
+        try:
+            return os.readv(self._ser.fileno(), [view])
+        except BlockingIOError:
+            return None
+
+    def _write(self, data):
+        # XXX logging.debug("%s <<<--- %s" % (repr(self._dev_path), repr(data)))
+        self._ser.write(data)
+
+    def _eof(self):
+        raise serial.SerialException('device reports readiness to read but returned no data (device disconnected?)')
 
 
 # ==============================================================================
@@ -2059,38 +2371,258 @@ class StdLineIO(LineIO):
 
 # ==============================================================================
 
-class TCPLineIO(LineIO):
-    def __init__(self, address_string, port):
-        # super().__init__() #DAVIDE
+class TCPLineIO(BufferedLineIO):
+    CONNECT_TIMEOUT = 5.0  # [s]
+    WRITE_TIMEOUT = 5.0  # [s], then the connection is considered lost
+    BACKOFF_MIN = 0.1  # [s], between reconnection attempts, doubling up to BACKOFF_MAX
+    BACKOFF_MAX = 5.0  # [s]
+    KEEPALIVE = (5, 1, 3)  # Idle time [s], interval between probes [s], probes before the connection is dropped
+
+    def __init__(self, address_string, port, reconnect=True, newline='\r\n'):
+        super(TCPLineIO, self).__init__(newline)
         self._socket = None
-        self._fp = None
         self._address = address_string
-        self._port = port
+        self._port = int(port)
+        self._reconnect_enabled = bool(reconnect)
+        self._connect_lock = threading.Lock()
+        self._generation = 0  # Of the connection, bumped when reconnecting
+        self._read_generation = 0
+        self._recv_generation = 0  # Of the connection the last recv_into() was on
+        self.reconnections = 0
 
     def __repr__(self):
         return '%s(address_string=%s, port=%d)' % (type(self).__name__, repr(self._address), self._port)
 
     def open(self):
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.connect((self._address, self._port))
-        self._fp = self._socket.makefile()
+        if self._socket is None:
+            self._socket = self._connect()
+            self._attach(None if self.POLLED else self._socket.fileno())
+
+    def close(self):
+        if self._socket is not None:
+            self._close_begin()
+            with self._read_lock, self._write_lock:  # Readers and writers reconnecting are interrupted by wakeup()
+                self._socket.close()
+                self._socket = None
+                self._detach()
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def _connect(self):
+        sock = socket.create_connection((self._address, self._port), self.CONNECT_TIMEOUT)
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Frames are small, do not wait to fill a segment
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        idle, interval, count = self.KEEPALIVE
+        if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+        sock.setblocking(False)
+        return sock
+
+    def _reconnect(self, generation):
+        # Replaces the connection, unless another thread already did it
+        with self._connect_lock:
+            if self._socket is None:
+                raise KeyboardInterrupt('soft interrupt')  # Closed
+            if generation != self._generation:
+                return
+
+            logging.warning('%s: connection lost, reconnecting' % repr(self))
+            if self._selector is not None:
+                self._selector.unregister(self._socket.fileno())
+            self._socket.close()
+
+            backoff = self.BACKOFF_MIN
+            while True:
+                try:
+                    self._socket = self._connect()
+                    break
+                except OSError as e:
+                    logging.debug('%s: %s, retrying in %.1f s' % (repr(self), str(e), backoff))
+
+                if not ok() or self._sleep(backoff):
+                    self._interrupt()
+                backoff = min(2 * backoff, self.BACKOFF_MAX)
+
+            if self._selector is not None:
+                self._selector.register(self._socket.fileno(), selectors.EVENT_READ)
+            self._generation += 1
+            self.reconnections += 1
+            logging.info('%s: reconnected' % repr(self))
+
+    def _readinto(self, view):
+        if self._read_generation != self._generation:  # Reconnected by the writer: the partial line is garbage
+            self._read_generation = self._generation
+            self._discard()
+            return None
+
+        self._recv_generation = self._generation  # Before, as in _write(): a writer may reconnect meanwhile
+        try:
+            return self._socket.recv_into(view)
+        except BlockingIOError:
+            return None
+        except OSError:
+            return 0
+
+    def _write(self, data):
+        # XXX logging.debug("'%s:%d' <<<--- %s" % (self._address, self._port, repr(data)))
+
+        with memoryview(data) as view:
+            sent = 0
+            while sent < len(data):
+                generation = self._generation
+                try:
+                    sent += self._socket.send(view[sent:])
+                    continue
+                except BlockingIOError:
+                    if len(select.select([], [self._socket], [], self.WRITE_TIMEOUT)[1]) > 0:
+                        continue
+                except OSError:
+                    pass
+
+                if not self._reconnect_enabled:
+                    raise ConnectionError('%s: connection lost' % repr(self))
+
+                self._reconnect(generation)
+                sent = 0  # The whole batch, on the new connection
+
+    def _eof(self):
+        if not self._reconnect_enabled:
+            raise ConnectionError('%s: connection closed' % repr(self))
+
+        self._reconnect(self._recv_generation)  # A no-op if a writer already replaced the connection that failed
+        self._read_generation = self._generation
+        self._discard()
+
+
+# ==============================================================================
+
+class TCPGateway(object):
+    READ_SIZE = 1 << 16
+    SEND_TIMEOUT = 2.0  # [s], then the client is dropped
+
+    def __init__(self, dev_path, baud_rate, port, address='127.0.0.1'):
+        """Exposes a serial port over TCP, to TCPLineIO. Bytes are forwarded as they come, both ways, to a single client:
+        a new connection replaces the previous one (e.g. left half open by a rig that rebooted).
+        Anyone who can connect drives the serial port: only local clients can, unless another address is given"""
+
+        self._dev_path = str(dev_path)
+        self._baud = int(baud_rate)
+        self.port = int(port)
+        self.address = str(address)
+        self._ser = None
+        self._listener = None
+        self._client = None
+        self._selector = None
+        self._wakeup = None
+        self.rx_bytes = 0  # Serial -> TCP
+        self.tx_bytes = 0  # TCP -> serial
+
+    def __repr__(self):
+        return '%s(dev_path=%s, baud_rate=%d, port=%d, address=%s)' % (type(self).__name__, repr(self._dev_path), self._baud, self.port, repr(self.address))
+
+    def open(self):
+        self._ser = serial.Serial(port=self._dev_path, baudrate=self._baud, timeout=0)
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.address, self.port))
+        self._listener.listen(1)
+        self._listener.setblocking(False)
+        self.port = self._listener.getsockname()[1]  # If port 0 was asked
 
-        time.sleep(1)
+        self._wakeup = os.pipe()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._ser.fileno(), selectors.EVENT_READ, self._serve_serial)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+
+        logging.info('%s open' % repr(self))
 
     def close(self):
-        self._socket.close()
-        self._fp = None
+        if self._client is not None:
+            self._drop()
 
-    def readline(self):
-        line = self._fp.readline().rstrip('\r\n')
-        logging.debug("'%s:%d' --->>> %s" % (self._address, self._port, repr(line)))
-        return line
+        self._selector.close()
+        self._listener.close()
+        self._ser.close()
+        os.close(self._wakeup[0])
+        os.close(self._wakeup[1])
 
-    def writeline(self, line):
-        logging.debug("'%s:%d' <<<--- %s" % (self._address, self._port, repr(line)))
-        self._fp.write(line)
-        self._fp.write('\r\n')
-        self._fp.flush()
+        logging.info('%s closed, %d bytes to TCP, %d bytes to serial' % (repr(self), self.rx_bytes, self.tx_bytes))
+
+    def wakeup(self):
+        os.write(self._wakeup[1], b'\0')  # Never drained: run() returns
+
+    def run(self):
+        try:
+            while ok():
+                for key, events in self._selector.select():
+                    if key.data is None:
+                        return
+                    key.data()
+
+        except KeyboardInterrupt:
+            logging.debug('run interrupted manually')
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+
+        if self._client is not None:
+            logging.info('%s: replacing the client' % repr(self))
+            self._drop()
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.settimeout(self.SEND_TIMEOUT)
+        self._client = sock
+        self._selector.register(sock, selectors.EVENT_READ, self._serve_client)
+        logging.info('%s: client %s connected' % (repr(self), repr(address)))
+
+    def _drop(self):
+        self._selector.unregister(self._client)
+        self._client.close()
+        self._client = None
+
+    def _serve_serial(self):
+        try:
+            data = os.read(self._ser.fileno(), self.READ_SIZE)
+        except BlockingIOError:
+            return
+
+        if len(data) == 0:
+            raise serial.SerialException('device reports readiness to read but returned no data (device disconnected?)')
+
+        if self._client is None:
+            return  # Nobody listening
+
+        try:
+            self._client.sendall(data)
+            self.rx_bytes += len(data)
+        except OSError as e:
+            logging.warning('%s: dropping the client: %s' % (repr(self), str(e)))
+            self._drop()
+
+    def _serve_client(self):
+        try:
+            data = self._client.recv(self.READ_SIZE)
+        except OSError:
+            data = b''
+
+        if len(data) == 0:
+            logging.info('%s: client disconnected' % repr(self))
+            self._drop()
+            return
+
+        self._ser.write(data)
+        self.tx_bytes += len(data)
 
 
 # ==============================================================================
@@ -2128,6 +2660,15 @@ class DebugTransport(Transport):
     MGMT_BUFFER_LENGTH = 4
     BOOT_BUFFER_LENGTH = 5
 
+    TX_BATCH_LENGTH = 64  # Messages written at once, at most
+    TX_WINDOW = Time_IMMEDIATE  # How long the TX thread waits for more messages before writing a batch
+
+    # TX priority classes, the first one is served first. Topics not listed are in the last class
+    TX_CLASSES = ('BOOT', 'MGMT', 'DATA')
+    TX_WEIGHTS = (8, 4, 1)  # With the weighted policy
+    TX_POLICY = PriorityEventQueue.STRICT
+    TX_TOPIC_CLASSES = {CORE_BOOTLOADER_TOPIC_NAME: 0, CORE_BOOTLOADER_MASTER_TOPIC_NAME: 0, 'R2P': 1}
+
     class MsgParser(object):
         def __init__(self, line):
             self._line = str(line)
@@ -2200,7 +2741,7 @@ class DebugTransport(Transport):
             tmp = bytearray([self.read_unsigned(1) for i in range(length)])
             return tmp
 
-    def __init__(self, name, lineio):
+    def __init__(self, name, lineio, tx_policy=None):
         super(DebugTransport, self).__init__(name)
         self._lineio = lineio
         self._rx_thread = None
@@ -2211,9 +2752,15 @@ class DebugTransport(Transport):
         self._boot_rsub = DebugSubscriber(self, self.BOOT_BUFFER_LENGTH)
         self._boot_master_rpub = DebugPublisher(self)
         self._boot_master_rsub = DebugSubscriber(self, self.BOOT_BUFFER_LENGTH)
-        self._sub_queue = EventQueue()
+        self.tx_policy = tx_policy if tx_policy is not None else self.TX_POLICY
+        self.tx_topic_classes = dict(self.TX_TOPIC_CLASSES)
+        self._sub_queue = PriorityEventQueue(self.TX_CLASSES, self._get_tx_class, self.tx_policy, self.TX_WEIGHTS)
         self._running = False
         self._running_lock = threading.Lock()
+        self.tx_window = self.TX_WINDOW
+        self.tx_frames = 0
+        self.tx_writes = 0
+        self.tx_bytes = 0
 
     def __repr__(self):
         return '%s(name=%s, lineio=%s)' % (type(self).__name__, repr(self.name), repr(self._lineio))
@@ -2223,14 +2770,8 @@ class DebugTransport(Transport):
             if not self._running:
                 logging.info('Opening %s' % repr(self))
                 self._running = True
-                self._lineio.open()
-                self._lineio.writeline('')
-                self._lineio.writeline('')
-                self._lineio.writeline('')
-                self._rx_thread = threading.Thread(name=(self.name + '_RX'), target=self._rx_threadf)
-                self._tx_thread = threading.Thread(name=(self.name + '_TX'), target=self._tx_threadf)
-                self._rx_thread.start()
-                self._tx_thread.start()
+                self._open_lineio()
+                self._start_io()
                 self.advertise(self._mgmt_rpub, 'R2P', Time.ms(200), MgmtMsg)  # TODO: configure
                 self.subscribe(self._mgmt_rsub, 'R2P', MgmtMsg)  # TODO: configure
                 self.advertise(self._boot_master_rpub, CORE_BOOTLOADER_MASTER_TOPIC_NAME, Time.ms(200), MasterBootMsg)  # TODO: configure
@@ -2250,6 +2791,47 @@ class DebugTransport(Transport):
             else:
                 raise RuntimeError('%s already closed' % repr(self))
 
+        self._stop_io()
+
+        self._lineio.close()
+        logging.info('%s closed, %s' % (repr(self), self.get_tx_summary()))
+        for row in self._sub_queue.get_summary():
+            logging.info('%s TX class %s: depth %d (max %d), %d served, wait %.3f ms (max %.3f ms)' % tuple([repr(self)] + row))
+
+    def set_tx_class(self, topic_name, tx_class):
+        """Sets the TX priority class (index or name in TX_CLASSES) of a topic"""
+
+        if not isinstance(tx_class, int):
+            tx_class = self.TX_CLASSES.index(tx_class)
+        assert 0 <= tx_class < len(self.TX_CLASSES)
+        self.tx_topic_classes[str(topic_name)] = tx_class
+
+    def get_tx_queue_summary(self):
+        return self._sub_queue.get_summary()
+
+    @staticmethod
+    def get_tx_queue_summary_fields():
+        return ['Class', 'Depth', 'Max depth', 'Served', 'Mean wait [ms]', 'Max wait [ms]']
+
+    def _get_tx_class(self, sub):
+        if sub is None:
+            return 0  # Closing
+        return self.tx_topic_classes.get(sub.topic.name, len(self.TX_CLASSES) - 1)
+
+    def _open_lineio(self):
+        self._lineio.open()
+        self._lineio.writeline('')
+        self._lineio.writeline('')
+        self._lineio.writeline('')
+
+    def _start_io(self):
+        self._rx_thread = threading.Thread(name=(self.name + '_RX'), target=self._rx_threadf)
+        self._tx_thread = threading.Thread(name=(self.name + '_TX'), target=self._tx_threadf)
+        self._rx_thread.start()
+        self._tx_thread.start()
+
+    def _stop_io(self):
+        self._lineio.wakeup()
         self._rx_thread.join()
         self._rx_thread = None
 
@@ -2257,10 +2839,21 @@ class DebugTransport(Transport):
         self._tx_thread.join()
         self._tx_thread = None
 
-        self._lineio.close()
-        logging.info('%s closed' % repr(self))
+    def get_tx_summary(self):
+        writes = max(self.tx_writes, 1)
+        return 'TX: %d frames, %d bytes in %d writes (%.1f frames/write, %.1f bytes/write)' % \
+               (self.tx_frames, self.tx_bytes, self.tx_writes, self.tx_frames / writes, self.tx_bytes / writes)
 
     def _send_message(self, topic_name, payload):
+        self._write_lines([self._encode_message(topic_name, payload)])
+
+    def _write_lines(self, lines):
+        self._lineio.writelines(lines)
+        self.tx_frames += len(lines)
+        self.tx_writes += 1
+        self.tx_bytes += sum(len(line) for line in lines) + 2 * len(lines)  # '\r\n' terminated
+
+    def _encode_message(self, topic_name, payload):
         assert is_topic_name(topic_name)
         assert len(payload) < 256
         now_raw = Time.now().raw
@@ -2280,10 +2873,9 @@ class DebugTransport(Transport):
         if topic_name == CORE_BOOTLOADER_MASTER_TOPIC_NAME:
             #### print("<<< " + line)  # DAVIDE
             pass
-        self._lineio.writeline(line)
+        return line
 
     def _recv(self):
-        cs = Checksummer()
         while True:
             with self._running_lock:
                 if not self._running:
@@ -2291,10 +2883,15 @@ class DebugTransport(Transport):
 
             # Start parsing the incoming message
             line = self._lineio.readline()
-            parser = self.MsgParser(line)
-            parser.skip_after_char('@')
             break
 
+        return self._parse(line)
+
+    def _parse(self, line):
+        cs = Checksummer()
+        parser = self.MsgParser(line)
+        parser.skip_after_char('@')
+
         ####print(">>> " + line) # DAVIDE
 
         deadline = parser.read_unsigned(4)
@@ -2322,6 +2919,9 @@ class DebugTransport(Transport):
         parser.check_eol()
         return (topic, payload)
 
+    def wakeup(self):
+        self._lineio.wakeup()
+
     def _create_publisher(self, topic, raw_params):
         rpub = DebugPublisher(self)
         return rpub
@@ -2344,32 +2944,7 @@ class DebugTransport(Transport):
                     logging.debug(str(e))
                     continue
 
-                topic = Middleware.instance().find_topic(topic_name)
-                if topic is None:
-                    continue
-
-                with self._publishers_lock:
-                    for rpub in self.publishers:
-                        if rpub.topic is topic:
-                            break
-                    else:
-                        continue
-                try:
-                    msg = rpub.alloc()
-                    msg.unmarshal(payload)
-                    msg._source = self
-                    x = repr(msg)
-                    logging.debug('--->>> %s' % x)
-                    rpub.publish_locally(msg)
-
-                except queue.Full:
-                    logging.warning('Full %s' % repr(rpub))
-                    pass
-
-                except Exception as e:  # suppress errors
-                    print(repr(e))
-                    topic.release(msg)  # TODO: Create BasePublisher.release() like BaseSubscriber.release()
-                    logging.warning(e)
+                self._dispatch(topic_name, payload)
 
         except KeyboardInterrupt:
             logging.debug('_rx_threadf interrupted manually')
@@ -2378,22 +2953,47 @@ class DebugTransport(Transport):
             logging.exception(e)
             raise
 
+    def _dispatch(self, topic_name, payload):
+        # Publishes a received message to the local subscribers
+        topic = Middleware.instance().find_topic(topic_name)
+        if topic is None:
+            return
+
+        with self._publishers_lock:
+            for rpub in self.publishers:
+                if rpub.topic is topic:
+                    break
+            else:
+                return
+        try:
+            msg = rpub.alloc()
+            self._unmarshal(msg, payload)
+            msg._source = self
+            x = repr(msg)
+            logging.debug('--->>> %s' % x)
+            rpub.publish_locally(msg)
+
+        except queue.Full:
+            logging.warning('Full %s' % repr(rpub))
+            pass
+
+        except Exception as e:  # suppress errors
+            print(repr(e))
+            topic.release(msg)  # TODO: Create BasePublisher.release() like BaseSubscriber.release()
+            logging.warning(e)
+
     def _tx_threadf(self):
         try:
             while self._is_running():
                 try:
-                    sub = self._sub_queue.wait()
+                    subs = [self._sub_queue.wait()]
                 except TimeoutError:
                     continue
-                if sub is None:
-                    continue
 
-                msg, deadline = sub.fetch()
-                try:
-                    logging.debug('<<<--- %s' % repr(msg))
-                    self._send_message(sub.topic.name, msg.marshal())
-                finally:
-                    sub.release(msg)
+                if self.tx_window > Time_IMMEDIATE:
+                    time.sleep(self.tx_window.to_s())  # Let more messages queue up
+
+                self._tx_batch(subs)
 
         except KeyboardInterrupt:
             logging.debug('_tx_threadf interrupted manually')
@@ -2402,50 +3002,984 @@ class DebugTransport(Transport):
             logging.exception(e)
             raise
 
+    def _tx_batch(self, subs):
+        # Drains whatever is pending, then writes it all at once
+        try:
+            while len(subs) < self.TX_BATCH_LENGTH:
+                subs.append(self._sub_queue.wait(Time_IMMEDIATE))
+        except queue.Empty:
+            pass
 
-# ==============================================================================
+        lines = []
+        for sub in subs:
+            if sub is None:
+                continue
 
-class Bootloader(object):
-    States = _enum(
-        IDLE=0x00,
+            msg, deadline = sub.fetch()
+            try:
+                logging.debug('<<<--- %s' % repr(msg))
+                line = self._marshal(sub.topic, msg)
+                if line is not None:
+                    lines.append(line)
+            finally:
+                sub.release(msg)
 
-        IDENTIFYING=0x02,
+        if len(lines) > 0:
+            self._write_lines(lines)
 
-        SELECTING=0x10,
-        SELECTED=0x11,
-        DESELECTING=0x12,
+        return len(subs)
 
-        NONE=0xFF
-    )
+    def _marshal(self, topic, msg):
+        return self._encode_message(topic.name, msg.marshal())
 
-    Errors = _enum(
-        SUCCESS=0x00,
-        WRONG_SEQUENCE=0x01,
-        NONE=0xFF
-    )
+    def _unmarshal(self, msg, payload):
+        msg.unmarshal(payload)
 
-    def __init__(self):
-        self.target_uid = None
-        self.sel_desel = True
 
-        self._lock = threading.Lock()
-        self._runner = None
-        self._mustRun = False
-        self._state = Bootloader.States.NONE
-        self._slaves = {}
-        self._slavesNames = {}
-        self._slavesTypes = {}
-        self._slavesUserStorageSize = {}
-        self._slavesProgramStorageSize = {}
-        self._lastSeq = 0
+# ==============================================================================
 
-        self._lastAck = BootMsg.Acknowledge(None)
-        self._rx_queue = queue.Queue()
-        self._tx_queue = queue.Queue()
+class BusQueue(PriorityEventQueue):
+    def __init__(self, selector, bus):
+        super(BusQueue, self).__init__(bus.TX_CLASSES, bus._get_tx_class, bus.tx_policy, bus.TX_WEIGHTS)
+        self._selector = selector
+        self._bus = bus
 
-        self._subShort = None
-        self._sub = None
-        self._pub = None
+    def signal(self, item=None):
+        super(BusQueue, self).signal(item)
+        self._selector.signal(self._bus)
+
+
+# ==============================================================================
+
+class BusTransport(DebugTransport):
+    GLOBAL_TOPIC_NAMES = ('R2P', CORE_BOOTLOADER_TOPIC_NAME, CORE_BOOTLOADER_MASTER_TOPIC_NAME)
+
+    PUBSUB_TYPES = (MgmtMsg.TypeEnum.ADVERTISE, MgmtMsg.TypeEnum.SUBSCRIBE_REQUEST, MgmtMsg.TypeEnum.SUBSCRIBE_RESPONSE)
+
+    def __init__(self, name, lineio, selector, namespace=None):
+        """A DebugTransport served by a BusSelector thread. With a namespace, the topics of the bus (but the global ones)
+        are known to the middleware as '<namespace>/<topic>', so that many buses can use the same topic names"""
+
+        super(BusTransport, self).__init__(name, lineio)
+        self.namespace = str(namespace) if namespace is not None else None
+        self._selector = selector
+        self._sub_queue = BusQueue(selector, self)
+
+    def __repr__(self):
+        return '%s(name=%s, lineio=%s, namespace=%s)' % (type(self).__name__, repr(self.name), repr(self._lineio), repr(self.namespace))
+
+    def get_topic_name(self, wire_name):
+        if self.namespace is None or wire_name in self.GLOBAL_TOPIC_NAMES:
+            return wire_name
+        else:
+            return self.namespace + '/' + wire_name
+
+    def get_wire_name(self, topic_name):
+        """Returns the name of a topic on the bus, None if the topic belongs to another namespace"""
+
+        if self.namespace is None or topic_name in self.GLOBAL_TOPIC_NAMES:
+            return topic_name
+
+        namespace, sep, wire_name = topic_name.rpartition('/')
+        if namespace == self.namespace:
+            return wire_name
+        else:
+            return None
+
+    def wakeup(self):
+        self._selector.wakeup()
+
+    def _start_io(self):
+        self._selector.add(self)
+
+    def _stop_io(self):
+        self._selector.remove(self)
+
+    def _dispatch(self, topic_name, payload):
+        super(BusTransport, self)._dispatch(self.get_topic_name(topic_name), payload)
+
+    def _marshal(self, topic, msg):
+        wire_name = self.get_wire_name(topic.name)
+        if wire_name is None:
+            return None
+
+        if isinstance(msg, MgmtMsg) and msg.type in self.PUBSUB_TYPES:
+            pubsub_name = self.get_wire_name(msg.pubsub.topic)
+            if pubsub_name is None:
+                return None  # Not about this bus
+
+            if pubsub_name != msg.pubsub.topic:  # The message is shared with the other transports: copy it
+                tmp = MgmtMsg(msg.type)
+                tmp.pubsub = MgmtMsg.PubSub(tmp, pubsub_name, msg.pubsub.payload_size, msg.pubsub.queue_length, msg.pubsub.raw_params)
+                msg = tmp
+
+        return self._encode_message(wire_name, msg.marshal())
+
+    def _unmarshal(self, msg, payload):
+        msg.unmarshal(payload)
+
+        if isinstance(msg, MgmtMsg) and msg.type in self.PUBSUB_TYPES:
+            msg.pubsub.topic = self.get_topic_name(msg.pubsub.topic)
+
+
+# ==============================================================================
+
+class BusSelector(object):
+    WRITE_TIMEOUT = 1.0  # [s], a bus that cannot take a batch by then drops it, instead of stalling the others
+
+    def __init__(self, name='BUS'):
+        """Serves the RX and the TX of many BusTransports from a single thread, waiting on all their LineIOs at once"""
+
+        self.name = str(name)
+        self.buses = []
+        self._selector = selectors.DefaultSelector()
+        self._wakeup = os.pipe()
+        self._pending = []  # Buses with messages to send
+        self._lock = threading.Lock()
+        self._serve_lock = threading.RLock()  # Held while serving the buses, so that they are not removed meanwhile
+        self._thread = None
+        self._running = False
+
+        os.set_blocking(self._wakeup[0], False)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+
+    def __repr__(self):
+        return '%s(name=%s)' % (type(self).__name__, repr(self.name))
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                raise RuntimeError('%s already started' % repr(self))
+            self._running = True
+
+        self._thread = threading.Thread(name=(self.name + '_SELECTOR'), target=self._threadf)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if not self._running:
+                raise RuntimeError('%s already stopped' % repr(self))
+            self._running = False
+
+        self.wakeup()
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        if self._thread is not None:
+            self.stop()
+
+        self._selector.close()
+        os.close(self._wakeup[0])
+        os.close(self._wakeup[1])
+
+    def add(self, bus):
+        with self._lock:
+            if bus in self.buses:
+                raise KeyError('%s already added' % repr(bus))
+            self.buses.append(bus)
+            bus._lineio.set_write_timeout(self.WRITE_TIMEOUT)  # Written from the selector thread
+            self._selector.register(bus._lineio.fileno(), selectors.EVENT_READ, bus)
+
+        self.wakeup()
+
+    def remove(self, bus):
+        with self._serve_lock, self._lock:
+            if bus not in self.buses:
+                return  # Already removed, as it failed
+            self.buses.remove(bus)
+            for key in list(self._selector.get_map().values()):  # The LineIO may be broken, its fileno() is not needed
+                if key.data is bus:
+                    self._selector.unregister(key.fileobj)
+            if bus in self._pending:
+                self._pending.remove(bus)
+
+    def signal(self, bus):
+        # A bus has messages to send
+        with self._lock:
+            if bus in self._pending or bus not in self.buses:
+                return
+            self._pending.append(bus)
+            if len(self._pending) > 1:
+                return  # Already woken up
+
+        self.wakeup()
+
+    def wakeup(self):
+        os.write(self._wakeup[1], b'\0')
+
+    def _is_running(self):
+        with self._lock:
+            return self._running
+
+    def _threadf(self):
+        try:
+            while self._is_running() and ok():
+                events = self._selector.select()
+
+                with self._serve_lock:
+                    for key, mask in events:
+                        bus = key.data
+                        if bus is None:
+                            try:
+                                while os.read(self._wakeup[0], 4096):
+                                    pass
+                            except BlockingIOError:
+                                pass
+                            continue
+
+                        if bus not in self.buses:
+                            continue  # Removed meanwhile
+
+                        try:
+                            self._serve(bus)
+                        except Exception as e:
+                            self._fail(bus, e)
+
+                    with self._lock:
+                        pending = self._pending
+                        self._pending = []
+
+                    for bus in pending:
+                        try:
+                            if bus._tx_batch([]) >= bus.TX_BATCH_LENGTH:
+                                self.signal(bus)  # More to send, after serving the others
+                        except serial.SerialTimeoutException as e:
+                            logging.warning('%s: %s, batch dropped' % (repr(bus), str(e)))
+                        except Exception as e:
+                            self._fail(bus, e)
+
+        except KeyboardInterrupt:
+            logging.debug('_threadf interrupted manually')
+
+        except Exception as e:
+            logging.exception(e)
+            raise
+
+    def _serve(self, bus):
+        for line in bus._lineio.readlines_nowait():
+            try:
+                topic_name, payload = bus._parse(line)
+            except (ParserError, ValueError) as e:
+                logging.debug(str(e))
+                continue
+
+            bus._dispatch(topic_name, payload)
+
+    def _fail(self, bus, e):
+        # Only the failing bus is given up (e.g. its device has been unplugged), the others keep being served
+        logging.error('%s failed, removed from %s: %s' % (repr(bus), repr(self), repr(e)))
+        logging.debug(traceback.format_exc())
+        self.remove(bus)
+
+
+# ==============================================================================
+
+# Broker client protocol, over a stream socket. Each record is:
+#
+# +--------+------+------+
+# | length | type | body |  length (UINT16) counts type and body
+# +--------+------+------+
+#
+# BROKER_SUBSCRIBE / BROKER_UNSUBSCRIBE: body = topic name, an empty name means all the topics
+# BROKER_PUBLISH: body = topic name length (UINT8), topic name, payload
+
+BROKER_SUBSCRIBE = 0x01
+BROKER_UNSUBSCRIBE = 0x02
+BROKER_PUBLISH = 0x03
+
+_broker_header = struct.Struct('<HB')
+
+
+def broker_record(type, body):
+    return _broker_header.pack(len(body) + 1, type) + body
+
+
+def broker_publish_record(topic_name, payload):
+    topic_name = toBytes(topic_name)
+    return _broker_header.pack(len(topic_name) + len(payload) + 2, BROKER_PUBLISH) + bytes((len(topic_name),)) + topic_name + bytes(payload)
+
+
+def broker_parse(buffer, offset=0):
+    """Returns (type, body, next offset) of the record at buffer[offset:], None if it is not complete yet"""
+
+    if len(buffer) - offset < _broker_header.size:
+        return None
+
+    length, type = _broker_header.unpack_from(buffer, offset)
+    end = offset + 2 + length
+    if length == 0 or len(buffer) < end:
+        return None
+
+    return (type, bytes(buffer[offset + _broker_header.size:end]), end)
+
+
+def broker_parse_publish(body):
+    """Returns (topic name, payload) of a BROKER_PUBLISH body, raises ValueError if it is malformed"""
+
+    if len(body) == 0 or len(body) < 1 + body[0]:
+        raise ValueError('truncated publish record')
+
+    length = body[0]
+    return (str(body[1:1 + length], 'ascii'), body[1 + length:])
+
+
+def broker_parse_topic_name(body):
+    """Returns the topic name of a BROKER_SUBSCRIBE / BROKER_UNSUBSCRIBE body, raises ValueError if it is malformed"""
+
+    topic_name = str(body, 'ascii')
+    if topic_name != '' and not is_topic_name(topic_name):
+        raise ValueError('invalid topic name %s' % repr(topic_name))
+
+    return topic_name
+
+
+# ==============================================================================
+
+class Broker(object):
+    MAX_CLIENT_BACKLOG = 1 << 20  # Bytes queued for a client that does not read, frames are dropped beyond it
+
+    class Client(object):
+        def __init__(self, sock):
+            self.socket = sock
+            self.rx = bytearray()
+            self.tx = bytearray()
+            self.topics = set()
+            self.frames_in = 0
+            self.frames_out = 0
+            self.dropped = 0
+
+        def __repr__(self):
+            return '%s(fd=%d, topics=%s)' % (type(self).__name__, self.socket.fileno(), repr(sorted(self.topics)))
+
+    def __init__(self, path, transport):
+        """Owns the LineIO of a DebugTransport and shares its traffic among the local clients connected to a Unix socket.
+        The transport is not opened: it only parses and encodes the lines"""
+
+        self.path = str(path)
+        self._transport = transport
+        self._lineio = transport._lineio
+        self._selector = None
+        self._listener = None
+        self._wakeup = None
+        self.clients = []
+        self._subscriptions = dict()  # topic name -> set of clients, '' -> clients subscribed to all the topics
+
+    def __repr__(self):
+        return '%s(path=%s, transport=%s)' % (type(self).__name__, repr(self.path), repr(self._transport))
+
+    def open(self):
+        self._remove_stale_socket()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(16)
+        self._listener.setblocking(False)
+
+        self._lineio.open()
+        self._lineio.writeline('')
+
+        self._wakeup = os.pipe()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._lineio.fileno(), selectors.EVENT_READ, self._serve_line)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+
+        logging.info('%s open' % repr(self))
+
+    def close(self):
+        for client in list(self.clients):
+            self._drop(client)
+
+        self._selector.close()
+        self._listener.close()
+        os.unlink(self.path)
+        os.close(self._wakeup[0])
+        os.close(self._wakeup[1])
+        self._lineio.close()
+
+        logging.info('%s closed, %s' % (repr(self), self._transport.get_tx_summary()))
+
+    def wakeup(self):
+        os.write(self._wakeup[1], b'\0')  # Never drained: run() returns
+
+    def _remove_stale_socket(self):
+        # Only a socket left by a broker that is gone: nothing else is removed, a running broker is not stolen from
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError('%s exists and is not a socket' % repr(self.path))
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            os.unlink(self.path)  # Left by a previous broker
+            return
+        finally:
+            probe.close()
+
+        raise FileExistsError('%s is in use by another broker' % repr(self.path))
+
+    def run(self):
+        try:
+            while ok():
+                lines = []
+
+                for key, events in self._selector.select():
+                    if key.data is None:
+                        return
+                    elif isinstance(key.data, Broker.Client):
+                        if key.data not in self.clients:
+                            continue  # Dropped meanwhile
+                        if events & selectors.EVENT_READ:
+                            self._serve_client(key.data, lines)
+                        if events & selectors.EVENT_WRITE and key.data in self.clients:
+                            self._flush(key.data)
+                    else:
+                        key.data()
+
+                if len(lines) > 0:  # What all the clients published in this round, at once
+                    self._transport._write_lines(lines)
+
+        except KeyboardInterrupt:
+            logging.debug('run interrupted manually')
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+
+        sock.setblocking(False)
+        client = Broker.Client(sock)
+        self.clients.append(client)
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        logging.info('Client %s connected' % repr(client))
+
+    def _drop(self, client):
+        logging.info('Client %s disconnected: %d frames in, %d out, %d dropped' % (repr(client), client.frames_in, client.frames_out, client.dropped))
+
+        for topic_name in client.topics:
+            self._subscriptions[topic_name].discard(client)
+
+        self.clients.remove(client)
+        self._selector.unregister(client.socket)
+        client.socket.close()
+
+    def _serve_line(self):
+        for line in self._lineio.readlines_nowait():
+            try:
+                topic_name, payload = self._transport._parse(line)
+            except (ParserError, ValueError) as e:
+                logging.debug(str(e))
+                continue
+
+            clients = self._subscriptions.get(topic_name, set()) | self._subscriptions.get('', set())  # Once per client, even if subscribed to both
+            if len(clients) == 0:
+                continue  # Filtered here, nobody pays for it
+
+            record = broker_publish_record(topic_name, payload)
+            for client in clients:
+                if len(client.tx) > self.MAX_CLIENT_BACKLOG:
+                    client.dropped += 1
+                    continue
+
+                if len(client.tx) == 0:
+                    self._selector.modify(client.socket, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+                client.tx += record
+                client.frames_out += 1
+
+    def _serve_client(self, client, lines):
+        try:
+            data = client.socket.recv(1 << 16)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if len(data) == 0:
+            self._drop(client)
+            return
+
+        if len(client.rx) + len(data) > self.MAX_CLIENT_BACKLOG:
+            logging.warning('Client %s sent more than %d bytes without a complete record' % (repr(client), self.MAX_CLIENT_BACKLOG))
+            self._drop(client)
+            return
+
+        client.rx += data
+
+        offset = 0
+        try:
+            while True:
+                record = broker_parse(client.rx, offset)
+                if record is None:
+                    break
+                type, body, offset = record
+
+                if type == BROKER_PUBLISH:
+                    topic_name, payload = broker_parse_publish(body)
+                    if not is_topic_name(topic_name) or len(payload) >= 256:
+                        logging.warning('Client %s published an invalid message on %s' % (repr(client), repr(topic_name)))
+                        continue
+                    lines.append(self._transport._encode_message(topic_name, payload))
+                    client.frames_in += 1
+
+                elif type == BROKER_SUBSCRIBE:
+                    topic_name = broker_parse_topic_name(body)
+                    if topic_name not in client.topics:
+                        client.topics.add(topic_name)
+                        self._subscriptions.setdefault(topic_name, set()).add(client)
+
+                elif type == BROKER_UNSUBSCRIBE:
+                    topic_name = broker_parse_topic_name(body)
+                    if topic_name in client.topics:
+                        client.topics.remove(topic_name)
+                        self._subscriptions[topic_name].discard(client)
+
+                else:
+                    logging.warning('Client %s sent an unknown record type %d' % (repr(client), type))
+
+        except ValueError as e:  # The stream cannot be trusted anymore, only this client pays for it
+            logging.warning('Client %s sent a malformed record: %s' % (repr(client), str(e)))
+            self._drop(client)
+            return
+
+        del client.rx[:offset]
+
+    def _flush(self, client):
+        try:
+            sent = client.socket.send(client.tx)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop(client)
+            return
+
+        del client.tx[:sent]
+        if len(client.tx) == 0:
+            self._selector.modify(client.socket, selectors.EVENT_READ, client)
+
+
+# ==============================================================================
+
+class BrokerClient(object):
+    READ_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._socket = None
+        self._rx = bytearray()
+        self._offset = 0
+        self._selector = None
+        self._wakeup = None
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def __repr__(self):
+        return '%s(path=%s)' % (type(self).__name__, repr(self.path))
+
+    def open(self):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(self.path)
+
+            self._wakeup = os.pipe()
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._socket, selectors.EVENT_READ)
+            self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+    def close(self):
+        if self._socket is not None:
+            self.wakeup()
+            with self._read_lock, self._write_lock:
+                self._socket.close()
+                self._socket = None
+
+                self._selector.close()
+                self._selector = None
+                os.close(self._wakeup[0])
+                os.close(self._wakeup[1])
+                self._wakeup = None
+
+    def wakeup(self):
+        if self._wakeup is not None:
+            os.write(self._wakeup[1], b'\0')  # Never drained: the client is being closed, or the middleware stopped
+
+    def subscribe(self, topic_name=''):
+        self._send(broker_record(BROKER_SUBSCRIBE, toBytes(topic_name)))
+
+    def unsubscribe(self, topic_name=''):
+        self._send(broker_record(BROKER_UNSUBSCRIBE, toBytes(topic_name)))
+
+    def publish(self, topic_name, payload):
+        return self.publish_many([(topic_name, payload)])
+
+    def publish_many(self, messages):
+        """Sends [(topic name, payload), ...] at once, returns the number of bytes sent"""
+
+        data = b''.join([broker_publish_record(topic_name, payload) for topic_name, payload in messages])
+        self._send(data)
+        return len(data)
+
+    def recv(self):
+        """Returns the next (topic name, payload) received"""
+
+        with self._read_lock:
+            while True:
+                record = broker_parse(self._rx, self._offset)
+                if record is not None:
+                    type, body, self._offset = record
+                    if type == BROKER_PUBLISH:
+                        return broker_parse_publish(body)
+                    continue
+
+                if not ok():
+                    raise KeyboardInterrupt('soft interrupt')
+
+                del self._rx[:self._offset]
+                self._offset = 0
+
+                for key, events in self._selector.select():
+                    if key.fd == self._wakeup[0]:
+                        raise KeyboardInterrupt('soft interrupt')
+
+                data = self._socket.recv(self.READ_SIZE)
+                if len(data) == 0:
+                    raise ConnectionError('%s: broker closed the connection' % repr(self))
+                self._rx += data
+
+    def _send(self, data):
+        with self._write_lock:
+            self._socket.sendall(data)
+
+
+# ==============================================================================
+
+class BrokerTransport(DebugTransport):
+    def __init__(self, name, client):
+        """A DebugTransport attached to a Broker: the broker filters the topics, the messages travel in binary form"""
+
+        super(BrokerTransport, self).__init__(name, client)
+
+    def advertise(self, pub, topic_name, publish_timeout, msg_type):
+        super(BrokerTransport, self).advertise(pub, topic_name, publish_timeout, msg_type)
+        self._lineio.subscribe(topic_name)
+
+    def touch_publisher(self, topic, raw_params):
+        pub = super(BrokerTransport, self).touch_publisher(topic, raw_params)
+        self._lineio.subscribe(topic.name)
+        return pub
+
+    def _open_lineio(self):
+        self._lineio.open()
+
+    def _recv(self):
+        with self._running_lock:
+            if not self._running:
+                return None
+
+        return self._lineio.recv()
+
+    def _encode_message(self, topic_name, payload):
+        return (topic_name, payload)  # Encoded by publish_many()
+
+    def _write_lines(self, lines):
+        self.tx_bytes += self._lineio.publish_many(lines)
+        self.tx_frames += len(lines)
+        self.tx_writes += 1
+
+
+# ==============================================================================
+
+_shm_created = set()  # Names of the rings created by this process, the resource tracker must keep tracking them
+
+
+class ShmRing(object):
+    """Fixed size slots in shared memory, written by one process and read by any number of them.
+
+    +--------+---------+---------+-----+
+    | header | slot[0] | slot[1] | ... |  slot = SLOT + payload, 8-byte aligned
+    +--------+---------+---------+-----+
+
+    The writer never waits: a reader that falls more than `slots` messages behind loses the oldest ones.
+    A slot is tagged with its sequence number + 1, and cleared while it is being written."""
+
+    MAGIC = b'NSHR'
+    VERSION = 1
+
+    HEADER = struct.Struct('<4sHHLLQ')  # magic, version, reserved, slot payload size, slots, messages written
+    HEAD = struct.Struct('<Q')  # messages written, at HEAD_OFFSET
+    HEAD_OFFSET = 16
+    SLOT = struct.Struct('<QL')  # sequence + 1, length
+
+    def __init__(self, name, payload_size=0, slots=0, create=False):
+        self.name = str(name)
+        self.lost = 0
+
+        if create:
+            self.payload_size = int(payload_size)
+            self.slots = int(slots)
+            assert self.payload_size > 0 and self.slots > 0
+            self._stride = (self.SLOT.size + self.payload_size + 7) & ~7
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=self.HEADER.size + self.slots * self._stride)
+            _shm_created.add(self._shm._name)
+            self.HEADER.pack_into(self._shm.buf, 0, self.MAGIC, self.VERSION, 0, self.payload_size, self.slots, 0)
+            self._cursor = 0
+        else:
+            self._shm = shared_memory.SharedMemory(self.name)
+            if self._shm._name not in _shm_created:  # Owned by the writer of another process, which unlinks it
+                try:
+                    resource_tracker.unregister(self._shm._name, 'shared_memory')
+                except Exception:
+                    pass
+
+            magic, version, reserved, self.payload_size, self.slots, head = self.HEADER.unpack_from(self._shm.buf, 0)
+            if magic != self.MAGIC or version != self.VERSION:
+                self._shm.close()
+                raise ValueError('%s is not a %s v%d' % (repr(self.name), type(self).__name__, self.VERSION))
+            self._stride = (self.SLOT.size + self.payload_size + 7) & ~7
+            self._cursor = head  # Only what is written from now on
+
+        self._owner = create
+        self._view = self._shm.buf
+
+    def __repr__(self):
+        return '%s(name=%s, payload_size=%d, slots=%d)' % (type(self).__name__, repr(self.name), self.payload_size, self.slots)
+
+    def close(self):
+        if self._view is not None:
+            self._view = None
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+                _shm_created.discard(self._shm._name)
+
+    def write(self, data):
+        length = len(data)
+        if length > self.payload_size:
+            raise ValueError('%d bytes do not fit in a %d bytes slot of %s' % (length, self.payload_size, repr(self.name)))
+
+        seq = self._cursor
+        offset = self.HEADER.size + (seq % self.slots) * self._stride
+
+        self.SLOT.pack_into(self._view, offset, 0, length)
+        self._view[offset + self.SLOT.size:offset + self.SLOT.size + length] = data
+        self.SLOT.pack_into(self._view, offset, seq + 1, length)
+
+        self._cursor = seq + 1
+        self.HEAD.pack_into(self._view, self.HEAD_OFFSET, self._cursor)
+
+    def pending(self):
+        return self.HEAD.unpack_from(self._view, self.HEAD_OFFSET)[0] - self._cursor
+
+    def read(self):
+        """Returns [(sequence, payload), ...] written since the last call. Payloads are views of the slots, not copies:
+        check() tells whether a slot has been overwritten meanwhile"""
+
+        head = self.HEAD.unpack_from(self._view, self.HEAD_OFFSET)[0]
+
+        if head - self._cursor > self.slots:
+            self.lost += head - self._cursor - self.slots
+            self._cursor = head - self.slots
+
+        frames = []
+        for seq in range(self._cursor, head):
+            offset = self.HEADER.size + (seq % self.slots) * self._stride
+            tag, length = self.SLOT.unpack_from(self._view, offset)
+            if tag != seq + 1:
+                self.lost += 1  # Being overwritten
+                continue
+            frames.append((seq, self._view[offset + self.SLOT.size:offset + self.SLOT.size + length]))
+
+        self._cursor = head
+        return frames
+
+    def check(self, seq):
+        offset = self.HEADER.size + (seq % self.slots) * self._stride
+        return self.SLOT.unpack_from(self._view, offset)[0] == seq + 1
+
+
+# ==============================================================================
+
+class ShmSubscriber(RemoteSubscriber):
+    def __init__(self, transport, ring):
+        super(ShmSubscriber, self).__init__(transport)
+        self.ring = ring
+
+    def get_queue_length(self):
+        return self.ring.slots
+
+    def notify(self, msg, deadline):
+        self.ring.write(msg.marshal())  # In the thread of the publisher: no queue, no TX thread
+
+    def fetch(self):
+        raise NotImplementedError()  # Nothing is queued
+
+
+# ==============================================================================
+
+class ShmTransport(Transport):
+    SLOTS = 1 << 10
+    SPIN = Time.us(200)  # How long the RX thread polls before sleeping, for latency
+    POLL = Time.ms(1)  # How long it sleeps at most, when idle
+
+    def __init__(self, name, prefix='nova'):
+        """Topics shared with the processes on this host, one ShmRing per topic, named '<prefix>_<topic>'.
+        export() writes the local publications of a topic to its ring, attach() publishes locally what is written to it"""
+
+        super(ShmTransport, self).__init__(name)
+        self.prefix = str(prefix)
+        self._rings = []  # Attached: (ring, publisher)
+        self._exported = []
+        self._rx_thread = None
+        self._running = False
+        self._running_lock = threading.Lock()
+
+    def __repr__(self):
+        return '%s(name=%s, prefix=%s)' % (type(self).__name__, repr(self.name), repr(self.prefix))
+
+    def get_ring_name(self, topic_name):
+        # Shared memory names cannot contain '/' (e.g. namespaced topics, 'bus0/BENCH' -> 'nova_bus0.2F.BENCH')
+        return '%s_%s' % (self.prefix, re.sub(r'[^\w-]', lambda m: '.%X.' % ord(m.group()), topic_name))
+
+    def open(self):
+        with self._running_lock:
+            if self._running:
+                raise RuntimeError('%s already open' % repr(self))
+            logging.info('Opening %s' % repr(self))
+            self._running = True
+
+        self._rx_thread = threading.Thread(name=(self.name + '_RX'), target=self._rx_threadf)
+        self._rx_thread.start()
+        Middleware.instance().add_transport(self)
+
+    def close(self):
+        with self._running_lock:
+            if not self._running:
+                raise RuntimeError('%s already closed' % repr(self))
+            logging.info('Closing %s' % repr(self))
+            self._running = False
+
+        self._rx_thread.join()
+        self._rx_thread = None
+
+        with self._subscribers_lock:
+            for ring in self._exported:
+                ring.close()
+            self._exported = []
+
+        with self._publishers_lock:
+            for ring, pub in self._rings:
+                if ring.lost > 0:
+                    logging.warning('%s lost %d messages' % (repr(ring), ring.lost))
+                ring.close()
+            self._rings = []
+
+        logging.info('%s closed' % repr(self))
+
+    def export(self, topic_name, msg_type, slots=None):
+        ring = ShmRing(self.get_ring_name(topic_name), msg_type.get_payload_size(), slots or self.SLOTS, create=True)
+        with self._subscribers_lock:
+            self._exported.append(ring)
+            self.subscribe(ShmSubscriber(self, ring), topic_name, msg_type)
+        return ring
+
+    def attach(self, topic_name, msg_type):
+        ring = ShmRing(self.get_ring_name(topic_name))
+        if ring.payload_size != msg_type.get_payload_size():
+            ring.close()
+            raise ValueError('%s does not carry %s' % (repr(ring), msg_type.__name__))
+
+        pub = RemotePublisher(self)
+        with self._publishers_lock:
+            self.advertise(pub, topic_name, Time_INFINITE, msg_type)
+            self._rings.append((ring, pub))
+        return ring
+
+    def _is_running(self):
+        with self._running_lock:
+            return self._running
+
+    def _rx_threadf(self):
+        try:
+            idle = time.time()
+            while self._is_running() and ok():
+                with self._publishers_lock:
+                    rings = list(self._rings)
+
+                received = 0
+                for ring, pub in rings:
+                    for seq, payload in ring.read():
+                        msg = pub.alloc()
+                        msg.unmarshal(payload)
+                        if not ring.check(seq):  # Overwritten while unmarshalling
+                            ring.lost += 1
+                            continue
+                        msg._source = self
+                        pub.publish_locally(msg)
+                        received += 1
+
+                if received > 0:
+                    idle = time.time()
+                elif time.time() - idle > self.SPIN.to_s():
+                    time.sleep(min(time.time() - idle, self.POLL.to_s()))
+
+        except KeyboardInterrupt:
+            logging.debug('_rx_threadf interrupted manually')
+
+        except Exception as e:
+            logging.exception(e)
+            raise
+
+
+# ==============================================================================
+
+class Bootloader(object):
+    States = _enum(
+        IDLE=0x00,
+
+        IDENTIFYING=0x02,
+
+        SELECTING=0x10,
+        SELECTED=0x11,
+        DESELECTING=0x12,
+
+        NONE=0xFF
+    )
+
+    Errors = _enum(
+        SUCCESS=0x00,
+        WRONG_SEQUENCE=0x01,
+        NONE=0xFF
+    )
+
+    def __init__(self):
+        self.target_uid = None
+        self.sel_desel = True
+
+        self._lock = threading.Lock()
+        self._runner = None
+        self._mustRun = False
+        self._state = Bootloader.States.NONE
+        self._slaves = {}
+        self._slavesNames = {}
+        self._slavesTypes = {}
+        self._slavesUserStorageSize = {}
+        self._slavesProgramStorageSize = {}
+        self._lastSeq = 0
+
+        self._lastAck = BootMsg.Acknowledge(None)
+        self._rx_queue = queue.Queue()
+        self._tx_queue = queue.Queue()
+
+        self._subShort = None
+        self._sub = None
+        self._pub = None
 
     def _callbackShort(self, msg):
         #logging.debug('BOOTLOADER >>> %s' % repr(self))
@@ -2850,11 +4384,18 @@ class Bootloader(object):
         return self._ihexWriteCommand(BootMsg.TypeEnum.IHEX_WRITE, type, ihex)
 
     def ihex_read(self, uid, address):
-        status = self._ihexReadCommand(BootMsg.TypeEnum.IHEX_READ, uid, address)
-        while status == BootMsg.Acknowledge.AckEnum.IHEX_OK:
-            status = self._ihexReadCommand(BootMsg.TypeEnum.IHEX_READ, uid, 0xFFFFFFFF)
+        """Returns the IHEX records read from address, None on error"""
+        records = []
+
+        ack = self._ihexReadCommand(BootMsg.TypeEnum.IHEX_READ, uid, address)
+        while ack is not None and ack[0] == BootMsg.Acknowledge.AckEnum.IHEX_OK:
+            records.append(ack[1].rstrip(b'\0').decode('ascii'))
+            ack = self._ihexReadCommand(BootMsg.TypeEnum.IHEX_READ, uid, 0xFFFFFFFF)
 
-        return status == BootMsg.Acknowledge.AckEnum.OK
+        if ack is not None and ack[0] == BootMsg.Acknowledge.AckEnum.OK:
+            return records
+        else:
+            return None
 
     def write_name(self, uid, name):
         return self._uidAndNameCommand(BootMsg.TypeEnum.WRITE_MODULE_NAME, uid, name)
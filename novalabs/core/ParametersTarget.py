@@ -5,8 +5,11 @@
 
 from .CoreWorkspace import *
 from .CoreUtils import *
-from intelhex import IntelHex
+from novalabs.misc.ihex import ihex_from_bytes, ihex_parse
+from novalabs.misc.paramsarchive import npa_pack, npa_is, NPA
 import struct
+import time
+import concurrent.futures
 
 class Parameters:
     SCHEMA = {
@@ -66,6 +69,7 @@ class Parameters:
         self.generatedBinary = None
 
         self._requiredPackages = []
+        self._layout = None  # (configurations, length), see layout()
 
     def open(self, root, name=None):
         self.__init__()
@@ -155,6 +159,27 @@ class Parameters:
 
         return False
 
+    def layout(self, workspace):
+        """Resolves the configurations of the objects and the size of the image, once for all the targets of these parameters"""
+
+        if self._layout is None:
+            configurations = []
+            length = 4
+
+            for obj in self.objects:
+                p = workspace.getCoreConfiguration(obj["package"], obj["parameters"])
+
+                if p is None or not p.valid:
+                    self.reason = obj['object'] + ": configuration " + obj["package"] + "::" + obj["parameters"] + " not found or invalid"
+                    return False
+
+                configurations.append(p)
+                length += (p.namedStruct.size + 3) & ~3
+
+            self._layout = (configurations, length)
+
+        return True
+
     def generateBinary(self, workspace, parametersTarget, out=""):
         self.generated = False
         self.generatedBinary = None
@@ -163,26 +188,32 @@ class Parameters:
             try:
                 CoreConsole.info("Parameters::generateBinary")
 
-                buffer = bytearray()
+                if not self.layout(workspace):
+                    return False
 
-                buffer.extend(struct.pack('<L', len(self.objects)))
+                (configurations, length) = self._layout
 
-                for obj in self.objects:
-                    p = workspace.getCoreConfiguration(obj["package"], obj["parameters"])
-                    bin, size = p.pack(parametersTarget.getObject(obj['object']), obj["object"])
+                # Each object is packed in place, padding is already zeroed
+                buffer = bytearray(length)
 
-                    if bin is None:
+                struct.pack_into('<L', buffer, 0, len(self.objects))
+                offset = 4
+
+                for obj, p in zip(self.objects, configurations):
+                    size = p.packInto(buffer, offset, parametersTarget.getObject(obj['object']), obj["object"])
+
+                    if size == 0:
                         self.reason = obj['object'] + ": " +  p.reason
                         return False
 
-                    buffer.extend(bin)
-
                     #padding
                     if (size % 4) > 0:
                         CoreConsole.info(parametersTarget.name + " [" + self.name + "] generateBinary padding %d " % (4 - (size % 4)))
-                        buffer.extend(bytes(4 - (size % 4)))
 
-                CoreConsole.info(parametersTarget.name + " [" + self.name + "] generateBinary: " + repr(buffer))
+                    offset += (size + 3) & ~3
+
+                if CoreConsole.enabled and (CoreConsole.debug or CoreConsole.verbose):  # Skip the repr() otherwise
+                    CoreConsole.info(parametersTarget.name + " [" + self.name + "] generateBinary: " + repr(buffer))
 
                 self.generatedBinary = buffer
 
@@ -322,51 +353,66 @@ class ParametersTarget:
     def generate(self, workspace, outBin=None, outHex=None,skip=False):
         self.generated = False
         self.generatedBinary = None
+        if self.valid:
+            if skip or self.pack(workspace):  # When skipping, the outputs are up to date
+                return self.write(outBin, outHex, skip)
+
+        return False
+
+    def pack(self, workspace):
+        """Packs the image in memory, in self.generatedBinary"""
+
+        self.generatedBinary = None
+        if self.valid:
+            p = workspace.getParameters(self.parameters)
+
+            if p is not None:
+                if p.generateBinary(workspace, self):
+                    self.generatedBinary = bytes(p.generatedBinary)  # The buffer of p is reused by its next target
+
+                    return True
+                else:
+                    self.reason = p.reason
+            else:
+                self.reason = "Cannot find a valid parameters file for '" + self.parameters + "'"
+
+        return False
+
+    def write(self, outBin=None, outHex=None, skip=False):
+        """Writes the packed image. When skipping, only the destinations are set"""
+
+        self.generated = False
         if self.valid:
             try:
-                p = workspace.getParameters(self.parameters)
-
-                if p is not None:
-                    if p.generateBinary(workspace, self):
-                        if outBin is not None:
-                            path = os.path.join(outBin, self.parameters)
-                            if not os.path.isdir(path):
-                                os.makedirs(path)
-
-                            self.destinationBin = os.path.join(path, self.name + ".bin")
-
-                            sink = open(self.destinationBin, 'wb')
-                            sink.write(p.generatedBinary)
-                        else:
-                            self.destinationBin = None
-
-                        if outHex is not None:
-                            path = os.path.join(outHex, self.parameters)
-                            if not os.path.isdir(path):
-                                os.makedirs(path)
-
-                            self.destinationHex = os.path.join(path, self.name + ".hex")
-
-                            ih = IntelHex()
-                            ih.frombytes(p.generatedBinary)
-                            ih.tofile(self.destinationHex, "hex")
-                        else:
-                            self.destinationHex = None
-
-                        self.generated = True
-                    else:
-                        self.reason = p.reason
+                if outBin is not None:
+                    path = os.path.join(outBin, self.parameters)
+                    self.destinationBin = os.path.join(path, self.name + ".bin")
+
+                    if not skip:
+                        os.makedirs(path, exist_ok=True)
+                        writeIfChanged(self.destinationBin, self.generatedBinary)
                 else:
-                    self.reason = "Cannot find a valid parameters file for '" + self.parameters + "'"
+                    self.destinationBin = None
+
+                if outHex is not None:
+                    path = os.path.join(outHex, self.parameters)
+                    self.destinationHex = os.path.join(path, self.name + ".hex")
+
+                    if not skip:
+                        os.makedirs(path, exist_ok=True)
+                        writeIfChanged(self.destinationHex, "\n".join(ihex_from_bytes(self.generatedBinary)) + "\n")  # As ihex_save
+                else:
+                    self.destinationHex = None
+
+                self.generated = True
 
                 return self.generated
             except IOError as e:
                 self.reason = CoreConsole.error(str(e.strerror) + " [" + CoreConsole.highlightFilename(e.filename) + "]")
-                CoreConsole.fail("ParametersTarget::generate: " + self.reason)
+                CoreConsole.fail("ParametersTarget::write: " + self.reason)
 
         return False
 
-
     def getObject(self, name):
         if name in self.data['parameters']:
             return self.data['parameters'][name]
@@ -418,3 +464,258 @@ class ParametersTarget:
     @staticmethod
     def getSummaryFieldsGenerate():
         return ["Name", "Description", "Parameters", "Source", "Generated Bin", "Generated Hex", "Status"]
+
+
+class ParametersBuilder:
+    """Generates many parameters targets at once: images are packed one after the other, reusing the layout
+    and the compiled packers of their Parameters, then written by a pool of threads"""
+
+    def __init__(self, workspace, outBin=None, outHex=None, jobs=1):
+        self.workspace = workspace
+        self.outBin = outBin
+        self.outHex = outHex
+        self.jobs = max(jobs, 1)
+
+        self.targets = []
+
+        self.packed = 0
+        self.skipped = 0
+        self.size = 0
+        self.packTime = 0.0
+        self.writeTime = 0.0
+
+        self.reason = ""
+
+    def build(self, targets):
+        """Generates targets, a list of (ParametersTarget, skip). Returns True if all of them have been generated"""
+
+        self.targets = [t for t, skip in targets]
+
+        start = time.time()
+
+        pending = []
+        for t, skip in targets:
+            t.generated = False
+            if skip:
+                pending.append((t, True))
+                self.skipped += 1
+            elif t.pack(self.workspace):
+                pending.append((t, False))
+                self.packed += 1
+                self.size += len(t.generatedBinary)
+
+        self.packTime = time.time() - start
+        start = time.time()
+
+        if self.jobs == 1 or len(pending) <= 1:
+            for t, skip in pending:
+                t.write(self.outBin, self.outHex, skip)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                for x in [executor.submit(t.write, self.outBin, self.outHex, skip) for t, skip in pending]:
+                    x.result()
+
+        self.writeTime = time.time() - start
+
+        return all([t.generated for t in self.targets])
+
+    def archive(self, filename):
+        """Writes all the generated images in a single archive, see novalabs.misc.paramsarchive"""
+
+        try:
+            images = []
+            for t in self.targets:
+                if not t.generated:
+                    raise CoreError("not generated: " + t.parameters + "/" + t.name)
+
+                if t.generatedBinary is not None:
+                    data = t.generatedBinary
+                elif t.destinationBin is not None:  # Skipped, the .bin is up to date
+                    with open(t.destinationBin, 'rb') as src:
+                        data = src.read()
+                else:
+                    raise CoreError("no binary output for " + t.parameters + "/" + t.name)
+
+                images.append((t.parameters + "/" + t.name, data))
+
+            mkdir(os.path.dirname(os.path.abspath(filename)))  # A bare filename is in the current directory
+            writeIfChanged(filename, npa_pack(images))
+
+            return True
+        except IOError as e:
+            self.reason = str(CoreError(str(e.strerror), e.filename))
+            CoreConsole.fail("ParametersBuilder::archive: " + self.reason)
+        except CoreError as e:
+            self.reason = str(e)
+            CoreConsole.fail("ParametersBuilder::archive: " + self.reason)
+
+        return False
+
+    def getSummary(self):
+        return "Parameters images: %d packed (%d bytes) in %.2f s, %d up to date, written in %.2f s" % (self.packed, self.size, self.packTime, self.skipped, self.writeTime)
+
+
+class ParametersDecoder:
+    """Decodes parameters images (as generated by Parameters.generateBinary) back to ParametersTarget JSON.
+    Objects are matched to their configuration by signature"""
+
+    HEADER = struct.Struct('<L')  # objects
+    OBJECT = struct.Struct('<16sL')  # name, signature
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+
+        self.index = None  # {signature: CoreConfiguration}, see buildIndex()
+        self.sets = None  # {((object, package, configuration), ...): parameters}
+
+        self.reason = ""
+
+    def buildIndex(self):
+        """Indexes the configurations of all the packages, once"""
+
+        if self.index is not None:
+            return
+
+        self.index = dict()
+        self.sets = dict()
+
+        names = set([x.name for x in self.workspace.core.validPackages] + [x.name for x in self.workspace.coreWorkspace.validPackages])
+
+        for name in sorted(names):
+            package = self.workspace.getCorePackage(name)
+
+            for configuration in package.listConfigurationFiles():
+                c = self.workspace.getCoreConfiguration(package.name, configuration)
+
+                if c is not None and c.valid:
+                    self.index.setdefault(c.signature, c)  # Same signature, same namespace, name and fields
+
+        for p in self.workspace.validParameters():
+            self.sets[tuple([(x["object"], x["package"], x["parameters"]) for x in p.objects])] = p.name
+
+    def decode(self, data, name="", description=""):
+        """Returns the ParametersTarget JSON of an image, None on error. Anything following the last object (e.g. erased flash) is ignored"""
+
+        try:
+            objects = []
+            parameters = dict()
+
+            for objectName, c, offset in self.__objects(data):
+                parameters[objectName] = c.unpack(c.namedStruct.unpack_from(data, offset)[1:])
+                objects.append((objectName, c.package.name if c.package is not None else "", c.name))
+
+            return {
+                "name": name,
+                "description": description,
+                "target": self.sets.get(tuple(objects), ""),
+                "parameters": parameters
+            }
+        except (CoreError, UnicodeDecodeError) as e:
+            self.reason = str(e)
+            CoreConsole.fail("ParametersDecoder::decode: " + self.reason)
+
+        return None
+
+    def blocks(self, data):
+        """Returns the (offset, length) of the blocks of an image: the object count, then each object with its padding. None on error"""
+
+        try:
+            return [(0, self.HEADER.size)] + [(offset, (c.namedStruct.size + 3) & ~3) for objectName, c, offset in self.__objects(data)]
+        except (CoreError, UnicodeDecodeError) as e:
+            self.reason = str(e)
+            CoreConsole.fail("ParametersDecoder::blocks: " + self.reason)
+
+        return None
+
+    def delta(self, current, image):
+        """Returns the segments [(offset, data)] of image that must be written over current: the blocks that changed, merged
+        when contiguous. The whole image if the objects do not match, None on error"""
+
+        new = self.blocks(image)
+        if new is None:
+            return None
+
+        old = self.blocks(current)
+        if old != new:  # Objects added, removed or resized, or current is not a valid image
+            return [(0, bytes(image[:new[-1][0] + new[-1][1]]))]
+
+        segments = []
+        for offset, length in new:
+            if current[offset:offset + length] != image[offset:offset + length]:
+                if len(segments) > 0 and segments[-1][0] + len(segments[-1][1]) == offset:
+                    segments[-1] = (segments[-1][0], segments[-1][1] + bytes(image[offset:offset + length]))
+                else:
+                    segments.append((offset, bytes(image[offset:offset + length])))
+
+        return segments
+
+    def decodeRecords(self, records, name="", description=""):
+        """Decodes IHEX records, e.g. as read back by Bootloader.ihex_read"""
+
+        try:
+            return self.decode(ihex_parse("\n".join(records)).tobinarray(), name, description)
+        except ValueError as e:
+            self.reason = str(e)
+            CoreConsole.fail("ParametersDecoder::decodeRecords: " + self.reason)
+
+        return None
+
+    def decodeFile(self, filename):
+        """Decodes a .bin, .hex or .npa file. Returns a list of JSON, one per image, None on error"""
+
+        images = self.load(filename)
+
+        if images is None:
+            return None
+
+        return [self.decode(data, x.split("/")[-1]) for x, data in images]
+
+    def load(self, filename):
+        """Returns the images [(name, data)] in a .bin, .hex or .npa file, None on error"""
+
+        try:
+            if npa_is(filename):
+                with NPA(filename) as npa:
+                    return [(x, npa.read(x)) for x in npa.names()]
+            elif filename.endswith(".hex"):
+                with open(filename, 'rb') as src:
+                    return [(getFileName(filename), bytes(ihex_parse(src.read()).tobinarray()))]
+            else:
+                with open(filename, 'rb') as src:
+                    return [(getFileName(filename), src.read())]
+        except IOError as e:
+            self.reason = str(CoreError(str(e.strerror), e.filename))
+            CoreConsole.fail("ParametersDecoder::load: " + self.reason)
+        except ValueError as e:
+            self.reason = str(CoreError(str(e), filename))
+            CoreConsole.fail("ParametersDecoder::load: " + self.reason)
+
+        return None
+
+    def __objects(self, data):
+        # Yields (name, configuration, offset) of each object, raises CoreError if the image cannot be walked
+        self.buildIndex()
+
+        if len(data) < self.HEADER.size:
+            raise CoreError("truncated image")
+
+        count, = self.HEADER.unpack_from(data, 0)
+        offset = self.HEADER.size
+
+        for i in range(count):
+            if offset + self.OBJECT.size > len(data):
+                raise CoreError("truncated image, object %d of %d" % (i, count))
+
+            objectName, signature = self.OBJECT.unpack_from(data, offset)
+            objectName = objectName.rstrip(b'\0').decode('ascii')
+
+            c = self.index.get(signature)
+            if c is None:
+                raise CoreError("object '%s' at offset %d: no configuration with signature 0x%08X" % (objectName, offset, signature))
+
+            if offset + c.namedStruct.size > len(data):
+                raise CoreError("truncated image, object '%s'" % objectName)
+
+            yield objectName, c, offset
+
+            offset += (c.namedStruct.size + 3) & ~3
@@ -91,15 +91,13 @@ class CoreConfigurationGenerator :
                     else:
                         raise CoreError("Implementation changed. 'self.package' MUST be defined")
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.hppDestination = os.path.join(path, (self.object.name + ".hpp"))
 
                     self.__processHeader()
 
-                    sink = open(self.hppDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.hppDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CoreConfiguration::generateHeader " + CoreConsole.highlightFilename(self.hppDestination))
 
@@ -130,15 +128,13 @@ class CoreConfigurationGenerator :
                     else:
                         raise CoreError("Implementation changed. 'self.package' MUST be defined")
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.cppDestination = os.path.join(path, (self.object.name + ".cpp"))
 
                     self.__processSource()
 
-                    sink = open(self.cppDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.cppDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CoreConfiguration::generateSource " + CoreConsole.highlightFilename(self.cppDestination))
 
@@ -169,15 +165,13 @@ class CoreConfigurationGenerator :
                     else:
                         raise CoreError("Implementation changed. 'self.package' MUST be defined")
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.docDestination = os.path.join(path, (self.object.name + ".adoc"))
 
                     self.__processDocumentation()
 
-                    sink = open(self.docDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.docDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CoreConfiguration::generateDocumentation " + CoreConsole.highlightFilename(self.docDestination))
 
@@ -208,15 +202,13 @@ class CoreConfigurationGenerator :
                     else:
                         raise CoreError("Implementation changed. 'self.package' MUST be defined")
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.schemaDestination = os.path.join(path, (self.object.name + ".json"))
 
                     self.__processSchema()
 
-                    sink = open(self.schemaDestination, 'w')
-                    sink.write(json.dumps(self.schema, indent=4, separators=(',', ': ')))
+                    writeIfChanged(self.schemaDestination, json.dumps(self.schema, indent=4, separators=(',', ': ')))
 
                     CoreConsole.ok("CoreConfiguration::generateSchema " + CoreConsole.highlightFilename(self.schemaDestination))
 
@@ -71,15 +71,13 @@ class CoreMessageGenerator :
                     else:
                         path = path
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.hppDestination = os.path.join(path, (self.object.name + ".hpp"))
 
                     self.__process()
 
-                    sink = open(self.hppDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.hppDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CoreMessage::generate " + CoreConsole.highlightFilename(self.hppDestination))
 
@@ -110,15 +108,13 @@ class CoreMessageGenerator :
                     else:
                         raise CoreError("Implementation changed. 'self.package' MUST be defined")
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.docDestination = os.path.join(path, (self.object.name + ".adoc"))
 
                     self.__processDocumentation()
 
-                    sink = open(self.docDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.docDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CoreMessage::generateDocumentation " + CoreConsole.highlightFilename(self.docDestination))
 
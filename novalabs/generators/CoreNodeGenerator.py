@@ -64,15 +64,13 @@ class CoreNodeGenerator :
                     else:
                         raise CoreError("Implementation changed. 'self.object.package' MUST be defined")
 
-                    if not os.path.isdir(path):
-                        os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
 
                     self.docDestination = os.path.join(path, (self.object.name + ".adoc"))
 
                     self.__processDocumentation()
 
-                    sink = open(self.docDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.docDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CoreNode::generateDocumentation " + CoreConsole.highlightFilename(self.docDestination))
 
@@ -120,8 +120,7 @@ class CorePackageGenerator:
 
                     self.processDocumentation()
 
-                    sink = open(self.docDestination, 'w')
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.docDestination, "\n".join(self.buffer))
 
                     CoreConsole.ok("CorePackage::generateDocumentation " + CoreConsole.highlightFilename(self.docDestination))
 
@@ -144,21 +143,13 @@ class CorePackageGenerator:
         dstIncludes = os.path.join(self.destination, "include", self.object.provider, self.object.name)
 
         self.includes = listFiles(srcIncludes)
-        if len(self.includes) > 0:
-            if not os.path.isdir(dstIncludes):
-                os.makedirs(dstIncludes)
-            for file in self.includes:
-                copyOrLink(os.path.join(srcIncludes, file), os.path.join(dstIncludes, file), link=self.link)
+        syncFiles(srcIncludes, dstIncludes, self.includes, link=self.link)
 
         srcSources = os.path.join(self.object.packageRoot, "src")
         dstSources = os.path.join(self.destination, "src")
 
         self.sources = listFiles(srcSources)
-        if len(self.sources) > 0:
-            if not os.path.isdir(dstSources):
-                os.makedirs(dstSources)
-            for file in self.sources:
-                copyOrLink(os.path.join(srcSources, file), os.path.join(dstSources, file), link=self.link)
+        syncFiles(srcSources, dstSources, self.sources, link=self.link)
 
         self.cmakeSources = listFiles(srcSources)
 
@@ -168,9 +159,7 @@ class CorePackageGenerator:
         self.__processCMake()
 
         self.cmake = os.path.join(self.destination, self.object.name + "Config.cmake")
-        sink = open(self.cmake, 'w')
-
-        sink.write("\n".join(self.buffer))
+        writeIfChanged(self.cmake, "\n".join(self.buffer))
 
     def __processCMake(self):
         self.buffer = []
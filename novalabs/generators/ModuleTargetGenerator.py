@@ -31,11 +31,9 @@ class ModuleTargetGenerator:
                 self.destination = os.path.join(out, "CMakeLists.txt")
 
                 if not skip:
-                    sink = open(self.destination, 'w')
-
                     self.__process()
 
-                    sink.write("\n".join(self.buffer))
+                    writeIfChanged(self.destination, "\n".join(self.buffer))
                     CoreConsole.ok("ModuleTarget::generate " + CoreConsole.highlightFilename(self.destination))
                 else:
                     CoreConsole.ok("ModuleTarget::generate " + CoreConsole.highlightFilename(self.destination) + " SKIPPED")
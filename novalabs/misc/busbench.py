@@ -0,0 +1,142 @@
+import os
+import selectors
+import struct
+import sys
+import threading
+import time
+import tty
+
+import novalabs.core.MW as MW
+
+# Aggregate RX frames/s of N buses (ptys), served by a DebugTransport each (RX + TX threads)
+# or all of them by a single BusSelector thread.
+
+
+class BenchMsg(MW.Message):
+    def __init__(self):
+        super(BenchMsg, self).__init__()
+        self.value = 0
+
+    @staticmethod
+    def get_type_size():
+        return 8
+
+    @staticmethod
+    def get_payload_size():
+        return 8
+
+    def marshal(self):
+        return struct.pack('<Q', self.value)
+
+    def unmarshal(self, data, offset=0):
+        self.value, = struct.unpack_from('<Q', data, offset)
+
+
+class Counter(MW.BaseSubscriber):
+    def __init__(self):
+        super(Counter, self).__init__()
+        self.count = 0
+        self.done = threading.Event()
+        self.expected = 0
+
+    def get_queue_length(self):
+        return 1
+
+    def notify(self, msg, deadline):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+def make_pty():
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return master, slave
+
+
+def make_frames(count):
+    encoder = MW.DebugTransport('bench', None)
+    return ''.join([encoder._encode_message('BENCH', struct.pack('<Q', i)) + '\r\n' for i in range(count)]).encode('ascii')
+
+
+def feed(masters, data):
+    # Writes data to every master, without blocking on the slower ones
+    selector = selectors.DefaultSelector()
+    for master in masters:
+        os.set_blocking(master, False)
+        selector.register(master, selectors.EVENT_WRITE, [0])
+
+    while len(selector.get_map()) > 0:
+        for key, events in selector.select():
+            offset = key.data
+            try:
+                offset[0] += os.write(key.fd, data[offset[0]:offset[0] + (1 << 14)])
+            except BlockingIOError:
+                continue
+            if offset[0] == len(data):
+                selector.unregister(key.fd)
+
+    selector.close()
+
+
+def bench(buses, data, count, selector=None):
+    mw = MW.Middleware.instance()
+    ptys = [make_pty() for i in range(buses)]
+
+    counter = Counter()
+    counter.expected = buses * count
+
+    transports = []
+    for i, (master, slave) in enumerate(ptys):
+        lineio = MW.SerialLineIO(os.ttyname(slave), 921600)
+        if selector is None:
+            transport = MW.DebugTransport('bus%d' % i, lineio)
+            topic_name = 'BENCH'
+        else:
+            transport = MW.BusTransport('bus%d' % i, lineio, selector, 'bus%d' % i)
+            topic_name = 'bus%d/BENCH' % i
+
+        transport.open()
+        transports.append(transport)
+
+        topic = mw.touch_topic(topic_name, BenchMsg)
+        if counter not in topic.local_subscribers:
+            topic.subscribe_local(counter)
+        transport.touch_publisher(topic, None)
+
+    start = time.perf_counter()
+    feed([master for master, slave in ptys], data)
+    counter.done.wait(60)
+    elapsed = time.perf_counter() - start
+
+    for transport in transports:
+        transport.close()
+    for master, slave in ptys:
+        os.close(master)
+        os.close(slave)
+
+    for topic in mw.topics:
+        if counter in topic.local_subscribers:
+            topic.local_subscribers.remove(counter)
+
+    return counter.count / elapsed, counter.count == counter.expected
+
+
+# Main entrypoint
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = make_frames(count)
+
+    print('Receiving %d frames per bus' % count)
+    print('%6s %20s %20s' % ('Buses', 'Threads [frames/s]', 'Selector [frames/s]'))
+
+    for buses in (1, 4, 16):
+        threaded, ok1 = bench(buses, data, count)
+
+        selector = MW.BusSelector()
+        selector.start()
+        selected, ok2 = bench(buses, data, count, selector)
+        selector.close()
+
+        print('%6d %20.0f %20.0f%s' % (buses, threaded, selected, '' if ok1 and ok2 else '  (frames lost)'))
@@ -29,6 +29,22 @@ def stm32_crc32_bytes(crc, buffer):
         crc = stm32_crc32_fast(crc, buffer[i+3] << 24 | buffer[i+2] << 16 | buffer[i+1] << 8 | buffer[i+0])
 
     return crc
+
+def stm32_crc32_stream(crc, chunks):
+    # CRC of the concatenated chunks, zero padded to a multiple of 4 bytes
+    tail = b''
+
+    for chunk in chunks:
+        if len(tail) > 0:
+            chunk = tail + chunk
+        n = len(chunk) & ~3
+        crc = stm32_crc32_bytes(crc, memoryview(chunk)[:n])
+        tail = bytes(chunk[n:])
+
+    if len(tail) > 0:
+        crc = stm32_crc32_bytes(crc, tail + b'\0' * (4 - len(tail)))
+
+    return crc
 #-----------------------------------------------------------------------------#
 def test():
     try:
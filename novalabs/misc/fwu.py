@@ -1,64 +1,245 @@
 from collections import namedtuple
 import sys
+import mmap
+import struct
+import zlib
 
 FWU = namedtuple('FWU', ['crc', 'dest_filename', 'revision', 'match_type', 'match_name', 'match_uid', 'write_name', 'write_id', 'config', 'program', 'program_crc'])
 
+# Header lines: prefix -> (field, conversion)
+FWU_FIELDS = [
+    ('@CRC', 'crc', lambda x: int(x, 16)),
+    ('!DEST_FILENAME', 'dest_filename', str),
+    ('!REVISION', 'revision', str),
+    ('!MATCH_TYPE', 'match_type', str),
+    ('!MATCH_NAME', 'match_name', str),
+    ('!MATCH_UID', 'match_uid', lambda x: int(x, 16)),
+    ('!WRITE_NAME', 'write_name', str),
+    ('!WRITE_ID', 'write_id', lambda x: int(x, 0)),
+    ('!WRITE_CRC', 'program_crc', lambda x: int(x, 16)),
+]
+
+FWU_SECTION_CONFIG = 'config'
+FWU_SECTION_PROGRAM = 'program'
+
+
+def fwu_iter(lines):
+    """Yields ('field', name, value) for header lines and (section, None, record) for config/program records."""
+
+    section = None
+
+    for line in lines:
+        if section is not None and line.startswith(':'):
+            yield section, None, line.rstrip('\r\n')
+            continue
+
+        if line.startswith('!BEGIN_CONFIG'):
+            section = FWU_SECTION_CONFIG
+        elif line.startswith('!END_CONFIG'):
+            section = None
+        elif line.startswith('!BEGIN_PROGRAM'):
+            section = FWU_SECTION_PROGRAM
+        elif line.startswith('!END_PROGRAM'):
+            section = None
+        else:
+            for prefix, field, convert in FWU_FIELDS:
+                if line.startswith(prefix):
+                    yield 'field', field, convert(line[len(prefix) + 1:].strip())
+                    break
+
+
 def fwu_parse(filename):
-    crc = None
-    dest_filename = None
-    revision = None
-    match_type = None
-    match_name = None
-    match_uid = None
-    write_name = None
-    write_id = None
-    config = ""
-    program = ""
-    program_crc = None
-
-    is_reading_program = False
-    is_reading_config = False
-
-    with open (filename, 'rt') as fwu_file:
-        for line in fwu_file:
-            if is_reading_config and line.startswith(':'):
-                config += line
-                continue
-            if is_reading_program and line.startswith(':'):
-                program += line
-                continue
-
-            if line.startswith('@CRC'):
-                crc = int(line[5:].strip(), 16)
-            elif line.startswith('!DEST_FILENAME'):
-                dest_filename = line[15:].strip()
-            elif line.startswith('!REVISION'):
-                revision = line[10:].strip()
-            elif line.startswith('!MATCH_TYPE'):
-                match_type = line[12:].strip()
-            elif line.startswith('!MATCH_NAME'):
-                match_name = line[12:].strip()
-            elif line.startswith('!MATCH_UID'):
-                match_uid = int(line[11:].strip(), 16)
-            elif line.startswith('!WRITE_NAME'):
-                write_name = line[12:].strip()
-            elif line.startswith('!WRITE_ID'):
-                write_id = int(line[10:].strip(), 0)
-            elif line.startswith('!WRITE_CRC'):
-                program_crc = int(line[11:].strip(), 16)
-
-            elif line.startswith('!BEGIN_CONFIG'):
-                is_reading_config = True
-            elif line.startswith('!END_CONFIG'):
-                is_reading_config = False
-            elif line.startswith('!BEGIN_PROGRAM'):
-                is_reading_program = True
-            elif line.startswith('!END_PROGRAM'):
-                is_reading_program = False
-
-    return FWU(crc, dest_filename, revision, match_type, match_name, match_uid, write_name, write_id, config, program.splitlines(), program_crc)
+    fields = dict.fromkeys(FWU._fields)
+    config = []
+    program = []
+
+    with open(filename, 'rt') as fwu_file:
+        for section, field, value in fwu_iter(fwu_file):
+            if section == FWU_SECTION_PROGRAM:
+                program.append(value)
+            elif section == FWU_SECTION_CONFIG:
+                config.append(value + '\n')
+            else:
+                fields[field] = value
+
+    fields['config'] = ''.join(config)
+    fields['program'] = program
+
+    return FWU(**fields)
+
+
+# Binary FWU container
+#
+# +------------------+
+# | header           | FWB_HEADER
+# | section table    | FWB_SECTION * sections
+# | sections ...     | each one 4-byte aligned
+# +------------------+
+#
+# The HEADER section holds the '!' header lines of the text format, CONFIG and
+# PROGRAM hold '\n' terminated IHEX records. Every section carries its record
+# count and zlib CRC32, so a reader can mmap the file and stream records as
+# soon as the fixed-size header has been decoded.
+
+FWB_MAGIC = b'NFWB'
+FWB_VERSION = 1
+
+FWB_HEADER = struct.Struct('<4sHHLLLLL')  # magic, version, sections, flags, crc, program_crc, match_uid, write_id
+FWB_SECTION = struct.Struct('<LLLLL')  # id, offset, length, count, crc32
+
+FWB_SECTION_HEADER = 1
+FWB_SECTION_CONFIG = 2
+FWB_SECTION_PROGRAM = 3
+
+FWB_FLAG_CRC = 0x01
+FWB_FLAG_PROGRAM_CRC = 0x02
+FWB_FLAG_MATCH_UID = 0x04
+FWB_FLAG_WRITE_ID = 0x08
+
+FWB_FLAGS = [
+    (FWB_FLAG_CRC, 'crc'),
+    (FWB_FLAG_PROGRAM_CRC, 'program_crc'),
+    (FWB_FLAG_MATCH_UID, 'match_uid'),
+    (FWB_FLAG_WRITE_ID, 'write_id'),
+]
+
+
+def fwb_is(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(FWB_MAGIC)) == FWB_MAGIC
+
+
+def fwb_write(filename, fwu):
+    header = []
+    for prefix, field, convert in FWU_FIELDS:
+        value = getattr(fwu, field)
+        if prefix.startswith('!') and value is not None and convert is str:
+            header.append('%s %s\n' % (prefix, value))
+
+    config = fwu.config
+    if len(config) > 0 and not config.endswith('\n'):
+        config += '\n'
+
+    sections = [
+        (FWB_SECTION_HEADER, ''.join(header).encode('ascii'), len(header)),
+        (FWB_SECTION_CONFIG, config.encode('ascii'), config.count('\n')),
+        (FWB_SECTION_PROGRAM, ''.join([r + '\n' for r in fwu.program]).encode('ascii'), len(fwu.program)),
+    ]
+
+    flags = 0
+    values = []
+    for flag, field in FWB_FLAGS:
+        value = getattr(fwu, field)
+        if value is None:
+            value = 0
+        else:
+            flags |= flag
+        values.append(value & 0xFFFFFFFF)
+
+    table = []
+    offset = FWB_HEADER.size + FWB_SECTION.size * len(sections)
+    for id, data, count in sections:
+        table.append(FWB_SECTION.pack(id, offset, len(data), count, zlib.crc32(data) & 0xFFFFFFFF))
+        offset += (len(data) + 3) & ~3
+
+    with open(filename, 'wb') as f:
+        f.write(FWB_HEADER.pack(FWB_MAGIC, FWB_VERSION, len(sections), flags, *values))
+        f.write(b''.join(table))
+        for id, data, count in sections:
+            f.write(data)
+            f.write(b'\0' * (-len(data) & 3))
+
+
+class FWB(object):
+    def __init__(self, filename):
+        self._map = None
+        self._file = open(filename, 'rb')
+        try:
+            self._open(filename)
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, filename):
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError('%s: empty file' % filename)
+
+        if len(self._map) < FWB_HEADER.size:
+            raise ValueError('%s: truncated header' % filename)
+
+        magic, version, count, flags, crc, program_crc, match_uid, write_id = FWB_HEADER.unpack_from(self._map, 0)
+        values = {'crc': crc, 'program_crc': program_crc, 'match_uid': match_uid, 'write_id': write_id}
+        if magic != FWB_MAGIC or version != FWB_VERSION:
+            raise ValueError('%s: not a FWB v%d file' % (filename, FWB_VERSION))
+
+        if len(self._map) < FWB_HEADER.size + count * FWB_SECTION.size:
+            raise ValueError('%s: truncated section table' % filename)
+
+        # All the sections are checked here, before a caller acts on any of them (e.g. erases the flash)
+        self.sections = {}
+        for i in range(count):
+            id, offset, length, records, crc32 = FWB_SECTION.unpack_from(self._map, FWB_HEADER.size + i * FWB_SECTION.size)
+            if offset + length > len(self._map):
+                raise ValueError('%s: section %d out of bounds' % (filename, id))
+            if zlib.crc32(self._map[offset:offset + length]) & 0xFFFFFFFF != crc32:
+                raise ValueError('%s: section %d CRC mismatch' % (filename, id))
+            self.sections[id] = (offset, length, records, crc32)
+
+        fields = dict.fromkeys(FWU._fields)
+        for flag, field in FWB_FLAGS:
+            if flags & flag:
+                fields[field] = values[field]
+        for section, field, value in fwu_iter(self.records(FWB_SECTION_HEADER)):
+            fields[field] = value
+        fields['config'] = None
+        fields['program'] = None
+
+        self.header = FWU(**fields)
+
+    def count(self, id):
+        if id not in self.sections:
+            return 0
+        return self.sections[id][2]
+
+    def records(self, id):
+        """Yields the records of a section, its CRC32 has been checked when the file was opened."""
+
+        if id not in self.sections:
+            return
+
+        offset, length, count, crc32 = self.sections[id]
+        end = offset + length
+
+        while offset < end:
+            eol = self._map.find(b'\n', offset, end)
+            if eol < 0:
+                eol = end - 1
+            line = self._map[offset:eol + 1]
+            offset = eol + 1
+            yield line.rstrip(b'\r\n').decode('ascii')
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
 
 # Main entrypoint
 if __name__ == '__main__':
-    fwu = fwu_parse(sys.argv[1])
-    print(fwu)
\ No newline at end of file
+    if fwb_is(sys.argv[1]):
+        with FWB(sys.argv[1]) as fwb:
+            print(fwb.header)
+            for id, section in sorted(fwb.sections.items()):
+                print('section %d: offset=%d, length=%d, records=%d, crc=0x%08X' % ((id,) + section))
+    else:
+        fwu = fwu_parse(sys.argv[1])
+        print(fwu)
@@ -0,0 +1,222 @@
+import sys
+
+# Intel HEX reader/writer
+#
+# A whole file is decoded with a single bytes.fromhex() call over the record
+# slices, then walked with a memoryview: checksums are validated with sum()
+# over each record and data is merged into a sparse map of contiguous
+# (address, bytearray) segments.
+
+RECORD_DATA = 0x00
+RECORD_END_OF_FILE = 0x01
+RECORD_EXTENDED_SEGMENT_ADDRESS = 0x02
+RECORD_START_SEGMENT_ADDRESS = 0x03
+RECORD_EXTENDED_LINEAR_ADDRESS = 0x04
+RECORD_START_LINEAR_ADDRESS = 0x05
+
+RECORD_LENGTH = 16
+
+EOF_RECORD = ':00000001FF'
+
+
+class IHex(object):
+    def __init__(self, segments=None, records=None, start_address=None, start_type=RECORD_START_LINEAR_ADDRESS):
+        self.segments = segments if segments is not None else []  # sorted [(address, bytearray), ...]
+        self.records = records if records is not None else []  # the records, as read from the file
+        self.start_address = start_address  # EIP, or CS:IP (CS in the upper 16 bits) for a start segment address
+        self.start_type = start_type
+
+    def __repr__(self):
+        return '%s(segments=%d, records=%d, size=%d)' % (type(self).__name__, len(self.segments), len(self.records), self.size())
+
+    def size(self):
+        return sum(len(data) for address, data in self.segments)
+
+    def minaddr(self):
+        if len(self.segments) == 0:
+            return None
+        return self.segments[0][0]
+
+    def maxaddr(self):
+        if len(self.segments) == 0:
+            return None
+        address, data = self.segments[-1]
+        return address + len(data) - 1
+
+    def tobinarray(self, start=None, size=None, pad=0xFF):
+        if start is None:
+            start = self.minaddr()
+            if start is None:
+                start = 0
+
+        if size is None:
+            end = self.maxaddr()
+            end = start if end is None else end + 1
+        else:
+            end = start + size
+
+        buffer = bytearray([pad]) * max(end - start, 0)
+
+        for address, data in self.segments:
+            lo = max(address, start)
+            hi = min(address + len(data), end)
+            if lo < hi:
+                buffer[lo - start:hi - start] = memoryview(data)[lo - address:hi - address]
+
+        return buffer
+
+    def dump(self, record_length=RECORD_LENGTH):
+        return ihex_dump(self.segments, record_length, self.start_address, self.start_type)
+
+
+def ihex_parse(text):
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode('ascii')
+
+    records = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        if line[0] != ':':
+            raise ValueError("Record %d does not start with ':'" % (len(records) + 1))
+        records.append(line)
+
+    try:
+        raw = bytes.fromhex(''.join([record[1:] for record in records]))
+    except ValueError:
+        raise ValueError('Invalid hex digits in IHEX data')
+
+    view = memoryview(raw)
+
+    segments = []
+    current = None
+    base = 0
+    start_address = None
+    start_type = RECORD_START_LINEAR_ADDRESS
+    pos = 0
+
+    for i in range(len(records)):
+        length = len(records[i]) - 1
+        if length & 1:
+            raise ValueError('Record %d has an odd number of digits' % (i + 1))
+        length >>= 1
+
+        count = raw[pos]
+        if length != count + 5:
+            raise ValueError('Record %d: count=%d does not match its length' % (i + 1, count))
+        if sum(view[pos:pos + length]) & 0xFF:
+            raise ValueError('Record %d: invalid checksum' % (i + 1))
+
+        type = raw[pos + 3]
+        data = view[pos + 4:pos + 4 + count]
+
+        if type == RECORD_DATA:
+            address = base + ((raw[pos + 1] << 8) | raw[pos + 2])
+            if current is not None and current[0] + len(current[1]) == address:
+                current[1] += data
+            else:
+                current = [address, bytearray(data)]
+                segments.append(current)
+        elif type == RECORD_END_OF_FILE:
+            del records[i + 1:]
+            break
+        elif type == RECORD_EXTENDED_SEGMENT_ADDRESS:
+            base = int.from_bytes(data, 'big') << 4
+        elif type == RECORD_EXTENDED_LINEAR_ADDRESS:
+            base = int.from_bytes(data, 'big') << 16
+        elif type in (RECORD_START_SEGMENT_ADDRESS, RECORD_START_LINEAR_ADDRESS):
+            if count != 4:
+                raise ValueError('Record %d: start address count=%d != 4' % (i + 1, count))
+            start_address = int.from_bytes(data, 'big')
+            start_type = type
+        else:
+            raise ValueError('Record %d: unknown type %d' % (i + 1, type))
+
+        pos += length
+
+    segments.sort(key=lambda s: s[0])
+
+    merged = []
+    for address, data in segments:
+        if len(merged) > 0:
+            last_address, last_data = merged[-1]
+            last_end = last_address + len(last_data)
+            if address < last_end:
+                raise ValueError('Overlapping data at 0x%08X' % address)
+            if address == last_end:
+                last_data += data
+                continue
+        merged.append((address, data))
+
+    return IHex(merged, records, start_address, start_type)
+
+
+def ihex_load(filename):
+    with open(filename, 'rb') as f:
+        return ihex_parse(f.read())
+
+
+def _record(type, offset, data):
+    record = bytearray(4 + len(data) + 1)
+    record[0] = len(data)
+    record[1] = (offset >> 8) & 0xFF
+    record[2] = offset & 0xFF
+    record[3] = type
+    record[4:-1] = data
+    record[-1] = -sum(record) & 0xFF
+    return ':' + record.hex().upper()
+
+
+def ihex_dump(segments, record_length=RECORD_LENGTH, start_address=None, start_type=RECORD_START_LINEAR_ADDRESS):
+    records = []
+
+    if len(segments) == 0:
+        records.append(EOF_RECORD)
+        return records
+
+    address, data = segments[-1]
+    need_offset = (address + len(data) - 1) > 0xFFFF
+    high = None
+
+    if start_address is not None:
+        records.append(_record(start_type, 0, start_address.to_bytes(4, 'big')))
+
+    for address, data in segments:
+        view = memoryview(data)
+        offset = 0
+        end = len(view)
+
+        while offset < end:
+            current = address + offset
+
+            if need_offset and (current >> 16) != high:
+                high = current >> 16
+                records.append(_record(RECORD_EXTENDED_LINEAR_ADDRESS, 0, high.to_bytes(2, 'big')))
+
+            low = current & 0xFFFF
+            n = min(record_length, 0x10000 - low, end - offset)
+            records.append(_record(RECORD_DATA, low, view[offset:offset + n]))
+            offset += n
+
+    records.append(EOF_RECORD)
+
+    return records
+
+
+def ihex_from_bytes(data, address=0, record_length=RECORD_LENGTH):
+    return ihex_dump([(address, data)], record_length)
+
+
+def ihex_save(filename, records):
+    with open(filename, 'w') as f:
+        f.write('\n'.join(records))
+        f.write('\n')
+
+
+# Main entrypoint
+if __name__ == '__main__':
+    ih = ihex_load(sys.argv[1])
+    print(ih)
+    for address, data in ih.segments:
+        print('0x%08X-0x%08X' % (address, address + len(data) - 1))
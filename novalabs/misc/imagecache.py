@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import atexit
+import hashlib
+import tempfile
+
+from novalabs.misc.ihex import ihex_load
+from novalabs.misc.crc import stm32_crc32_bytes
+from novalabs.misc.fwu import FWU, fwu_parse
+
+# Parsed-image cache
+#
+# Lives in <NOVA_WORKSPACE_ROOT>/build/image_cache. Every input file is keyed
+# by the SHA-256 of its content; index.json maps a file path to its last seen
+# (size, mtime, digest) so that unchanged files are not even re-hashed. It is
+# saved once, when the process exits, merged with what other tools saved meanwhile.
+# For each digest the cache keeps:
+#   records     - the record stream to be sent to the bootloader
+#   image.json  - CRCs of the 0xFF padded binary per program size (and the FWU header fields)
+#
+# When no workspace is available (or the cache cannot be written) everything
+# is computed on the fly.
+
+IMAGE_CACHE_DIR = os.path.join('build', 'image_cache')
+
+
+class ImageCache(object):
+    def __init__(self, workspaceRoot=None):
+        if workspaceRoot is None:
+            workspaceRoot = os.environ.get('NOVA_WORKSPACE_ROOT')
+
+        if workspaceRoot is None:
+            self.path = None
+        else:
+            self.path = os.path.join(workspaceRoot, IMAGE_CACHE_DIR)
+
+        self._index = None
+        self._updated = {}  # Index entries not saved yet
+
+        if self.enabled():
+            atexit.register(self.save)
+
+    def enabled(self):
+        return self.path is not None
+
+    def digest(self, filename):
+        st = os.stat(filename)
+        key = os.path.abspath(filename)
+
+        entry = self.__index().get(key)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+
+        h = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+
+        self.__index()[key] = [st.st_size, st.st_mtime_ns, digest]
+        self._updated[key] = self._index[key]
+
+        return digest
+
+    def save(self):
+        if not self.enabled() or len(self._updated) == 0:
+            return
+
+        index = self.__load()
+        index.update(self._updated)
+        self.__save(os.path.join(self.path, 'index.json'), json.dumps(index).encode('ascii'))
+        self._updated = {}
+
+    def records(self, filename):
+        digest = self.digest(filename)
+
+        records = self.__read(digest, 'records')
+        if records is not None:
+            return records.decode('ascii').splitlines()
+
+        records = ihex_load(filename).records
+        self.__write(digest, 'records', '\n'.join(records).encode('ascii'))
+
+        return records
+
+    def crc(self, filename, size):
+        digest = self.digest(filename)
+        meta = self.__meta(digest)
+
+        crc = meta['crc'].get(str(size))
+        if crc is not None:
+            return crc
+
+        ih = ihex_load(filename)
+        crc = stm32_crc32_bytes(0xffffffff, ih.tobinarray(size=size))
+
+        meta['crc'][str(size)] = crc
+        self.__write(digest, 'image.json', json.dumps(meta).encode('ascii'))
+        if self.__read(digest, 'records') is None:
+            self.__write(digest, 'records', '\n'.join(ih.records).encode('ascii'))
+
+        return crc
+
+    def fwu(self, filename):
+        digest = self.digest(filename)
+        meta = self.__meta(digest)
+
+        records = self.__read(digest, 'records')
+        if 'fwu' in meta and records is not None:
+            return FWU(program=records.decode('ascii').splitlines(), **meta['fwu'])
+
+        fwu = fwu_parse(filename)
+
+        fields = fwu._asdict()
+        del fields['program']
+        meta['fwu'] = fields
+        self.__write(digest, 'image.json', json.dumps(meta).encode('ascii'))
+        self.__write(digest, 'records', '\n'.join(fwu.program).encode('ascii'))
+
+        return fwu
+
+    def __index(self):
+        if self._index is None:
+            self._index = self.__load()
+
+        return self._index
+
+    def __load(self):
+        if self.enabled():
+            try:
+                with open(os.path.join(self.path, 'index.json'), 'r') as f:
+                    return json.load(f)
+            except (IOError, ValueError):
+                pass
+
+        return {}
+
+    def __meta(self, digest):
+        meta = self.__read(digest, 'image.json')
+        if meta is not None:
+            try:
+                return json.loads(meta.decode('ascii'))
+            except ValueError:
+                pass
+
+        return {'crc': {}}
+
+    def __read(self, digest, name):
+        if not self.enabled():
+            return None
+
+        try:
+            with open(os.path.join(self.path, digest, name), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def __write(self, digest, name, data):
+        if not self.enabled():
+            return
+
+        self.__save(os.path.join(self.path, digest, name), data)
+
+    def __save(self, filename, data):
+        # Write to a temporary file and rename, concurrent tools may share the cache
+        tmp = None
+        try:
+            path = os.path.dirname(filename)
+            os.makedirs(path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, filename)
+        except OSError:
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+# Main entrypoint
+if __name__ == '__main__':
+    cache = ImageCache()
+    print(hex(cache.crc(sys.argv[1], int(sys.argv[2]))))
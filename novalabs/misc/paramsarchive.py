@@ -0,0 +1,130 @@
+import sys
+import mmap
+import struct
+import zlib
+
+# Parameters images archive
+#
+# +------------------+
+# | header           | NPA_HEADER
+# | index            | NPA_ENTRY * images, sorted by name
+# | names            | utf-8, not terminated
+# | images ...       | each one 4-byte aligned
+# +------------------+
+#
+# An image is named "<parameters>/<target>", as its .bin in generated/params.
+# Every entry carries the zlib CRC32 of its image, which is checked when the
+# image is read: a reader can mmap the file and extract a single image without
+# touching the others.
+
+NPA_MAGIC = b'NPAR'
+NPA_VERSION = 1
+
+NPA_HEADER = struct.Struct('<4sHHL')  # magic, version, images, names length
+NPA_ENTRY = struct.Struct('<LLLLL')  # name offset, name length, offset, length, crc32
+
+
+def npa_is(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(NPA_MAGIC)) == NPA_MAGIC
+
+
+def npa_pack(images):
+    """Returns the archive of images, a list of (name, data)"""
+
+    images = sorted(images, key=lambda x: x[0])
+
+    names = []
+    namesLength = 0
+    for name, data in images:
+        names.append(name.encode('utf-8'))
+        namesLength += len(names[-1])
+
+    table = []
+    nameOffset = 0
+    offset = (NPA_HEADER.size + NPA_ENTRY.size * len(images) + namesLength + 3) & ~3
+    for (name, data), encoded in zip(images, names):
+        table.append(NPA_ENTRY.pack(nameOffset, len(encoded), offset, len(data), zlib.crc32(data) & 0xFFFFFFFF))
+        nameOffset += len(encoded)
+        offset += (len(data) + 3) & ~3
+
+    chunks = [NPA_HEADER.pack(NPA_MAGIC, NPA_VERSION, len(images), namesLength)] + table + names
+    size = NPA_HEADER.size + NPA_ENTRY.size * len(images) + namesLength
+    chunks.append(b'\0' * (-size & 3))
+    for name, data in images:
+        chunks.append(bytes(data))
+        chunks.append(b'\0' * (-len(data) & 3))
+
+    return b''.join(chunks)
+
+
+def npa_write(filename, images):
+    with open(filename, 'wb') as f:
+        f.write(npa_pack(images))
+
+
+class NPA(object):
+    def __init__(self, filename):
+        self._map = None
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError('%s: empty file' % filename)
+
+        if len(self._map) < NPA_HEADER.size:
+            self.close()
+            raise ValueError('%s: truncated header' % filename)
+
+        magic, version, count, namesLength = NPA_HEADER.unpack_from(self._map, 0)
+        if magic != NPA_MAGIC or version != NPA_VERSION:
+            self.close()
+            raise ValueError('%s: not a NPA v%d file' % (filename, NPA_VERSION))
+
+        names = NPA_HEADER.size + NPA_ENTRY.size * count
+        if names + namesLength > len(self._map):
+            self.close()
+            raise ValueError('%s: truncated index' % filename)
+
+        self.images = {}
+        for i in range(count):
+            nameOffset, nameLength, offset, length, crc32 = NPA_ENTRY.unpack_from(self._map, NPA_HEADER.size + i * NPA_ENTRY.size)
+            name = self._map[names + nameOffset:names + nameOffset + nameLength].decode('utf-8')
+            if offset + length > len(self._map):
+                self.close()
+                raise ValueError('%s: image %s out of bounds' % (filename, name))
+            self.images[name] = (offset, length, crc32)
+
+    def names(self):
+        return sorted(self.images)
+
+    def read(self, name):
+        """Returns an image, checking its CRC32. Raises KeyError if there is no such image."""
+
+        offset, length, crc32 = self.images[name]
+        data = self._map[offset:offset + length]
+
+        if zlib.crc32(data) & 0xFFFFFFFF != crc32:
+            raise ValueError('Image %s: CRC mismatch' % name)
+
+        return data
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+# Main entrypoint
+if __name__ == '__main__':
+    with NPA(sys.argv[1]) as npa:
+        for name in npa.names():
+            print('%s: offset=%d, length=%d, crc=0x%08X' % ((name,) + npa.images[name]))
@@ -0,0 +1,92 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import jsonschema
+
+from novalabs.core.CoreUtils import validateJson, loadAndValidateJson
+from novalabs.core.CoreConfiguration import CoreConfiguration
+from novalabs.core.CoreMessage import CoreMessage
+from novalabs.core.ModuleTarget import ModuleTarget
+
+TYPES = ["CHAR", "INT8", "UINT8", "INT16", "UINT16", "INT32", "UINT32", "INT64", "UINT64", "FLOAT32", "FLOAT64"]
+
+
+def make_configuration(i):
+    fields = []
+    for j in range(random.randint(1, 16)):
+        fields.append({"name": "field%d" % j, "description": "Field %d" % j, "type": random.choice(TYPES), "size": random.randint(1, 4)})
+
+    return {"name": "Configuration%d" % i, "description": "Benchmark configuration", "namespace": "@", "fields": fields}
+
+
+def make_message(i):
+    fields = []
+    for j in range(random.randint(1, 16)):
+        fields.append({"name": "field%d" % j, "description": "Field %d" % j, "type": random.choice(TYPES), "size": random.randint(1, 4)})
+
+    return {"name": "Message%d" % i, "description": "Benchmark message", "namespace": "@", "fields": fields}
+
+
+def make_target(i):
+    return {"name": "target%d" % i, "description": "Benchmark target", "type": "application", "module": "module", "required_packages": ["core_common"], "sources": ["main.cpp"], "includes": []}
+
+
+KINDS = [
+    (make_configuration, CoreConfiguration.SCHEMA),
+    (make_message, CoreMessage.SCHEMA),
+    (make_target, ModuleTarget.SCHEMA),
+]
+
+
+def bench(name, function, files):
+    start = time.perf_counter()
+    for filename, schema in files:
+        function(filename, schema)
+    elapsed = time.perf_counter() - start
+
+    print('%-32s %8.3f s  %8.1f us/file' % (name, elapsed, elapsed / len(files) * 1e6))
+
+    return elapsed
+
+
+def jsonschema_validate(filename, schema):
+    with open(filename, 'r') as src:
+        jsonschema.validate(json.loads(src.read()), schema)
+
+
+def registry_validate(filename, schema):
+    with open(filename, 'r') as src:
+        validateJson(json.loads(src.read()), schema)
+
+
+# Main entrypoint
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as path:
+        files = []
+        for i in range(count):
+            make, schema = KINDS[i % len(KINDS)]
+            filename = os.path.join(path, "%d.json" % i)
+            with open(filename, 'w') as sink:
+                json.dump(make(i), sink)
+            files.append((filename, schema))
+
+        # All of them must be valid, or the benchmark measures error reporting
+        for filename, schema in files:
+            jsonschema_validate(filename, schema)
+
+        print('Validating %d metadata files' % count)
+
+        old = bench('jsonschema.validate', jsonschema_validate, files)
+        new = bench('validator registry', registry_validate, files)
+        bench('loadAndValidateJson (cold)', loadAndValidateJson, files)
+        cached = bench('loadAndValidateJson (warm)', loadAndValidateJson, files)
+
+        print('Speedup: registry %.1fx, warm cache %.1fx' % (old / new, old / cached))